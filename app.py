@@ -1,9 +1,23 @@
+import logging
 import streamlit as st
 import time
-from modules.api_manager import APIManager
-from modules.chat_engine import ChatEngine,Message
+from modules.api_manager import APIManager, ConfigLoader
+from modules.chat_engine import Message, memory_report
+from modules.async_engine import AsyncChatEngine, GenerationRegistry, run_in_background, start_group
 from modules.ui_components import ChatUI
-import os
+from modules.stream_renderer import StreamRenderer
+from modules.conversation_store import ConversationStore
+from modules.log import describe, new_request_id, set_request_id, setup_logging
+from modules.rag_index import RAGIndex
+from modules.spill_store import SpillStore
+
+# 流式渲染刷新参数：最大帧率与最小新增字符数
+STREAM_MAX_FPS = 15
+STREAM_MIN_DELTA = 8
+# 发送新消息时等待上一次生成停止的最长时间（秒）
+GENERATION_CANCEL_TIMEOUT = 5
+# 等待分块时向前端发送心跳的间隔（秒），脚本线程只在发送内容时才能响应停止按钮与重新运行
+FOLLOW_HEARTBEAT = 0.5
 
 # 设置页面配置
 st.set_page_config(
@@ -16,18 +30,51 @@ st.set_page_config(
     }
 )
 
-# 加载自定义CSS
-with open("config/style.css","r",encoding="utf-8") as f:
-    st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+# 结构化日志经队列由后台线程写出（进程内只配置一次），级别与采样率见 modules/log.py
+setup_logging()
+logger = logging.getLogger("app")
+
+# 加载自定义CSS（按文件修改时间缓存，每次运行脚本不再重新读取）
+ChatUI.render_css("config/style.css")
 
 # 初始化组件
 @st.cache_resource
 def get_api_manager():
-    return APIManager()
+    api_manager = APIManager()
+    # 后台预热供应商连接，首个请求无需再付出 TLS 握手延迟
+    run_in_background(api_manager.async_warm_up())
+    return api_manager
+
+@st.cache_resource
+def get_conversation_store():
+    return ConversationStore.from_config(ConfigLoader.load_section('conversation_store'))
+
+@st.cache_resource
+def get_shared_rag_index():
+    return RAGIndex.from_config(ConfigLoader.load_section('rag'), get_api_manager())
+
+def get_rag_index():
+    """知识库默认按会话隔离，上传的文档不会进入其他用户的提示；rag.shared 为 true 时所有会话共用持久化的索引"""
+    config = ConfigLoader.load_section('rag') or {}
+    if config.get('shared'):
+        return get_shared_rag_index()
+    if 'rag_index' not in st.session_state:
+        st.session_state.rag_index = RAGIndex.from_config(config, get_api_manager(), temporary=True)
+    return st.session_state.rag_index
+
+@st.cache_resource
+def get_generation_registry():
+    return GenerationRegistry()
+
+@st.cache_resource
+def get_spill_store():
+    return SpillStore.from_config(ConfigLoader.load_section('spill'))
 
 def init_chat_engine():
     if 'chat_engine' not in st.session_state:
-        st.session_state.chat_engine = ChatEngine(get_api_manager())
+        st.session_state.chat_engine = AsyncChatEngine(
+            get_api_manager(), get_rag_index(), ConfigLoader.load_section('chat').get('system_prompt')
+        )
     return st.session_state.chat_engine
 
 def create_layout():
@@ -49,14 +96,256 @@ def create_layout():
     
     return chat_container
 
+def persist_message(store, message, api_name, model):
+    """将定稿的消息追加到会话存储，首条消息时创建会话"""
+    if store is None:
+        return
+    if st.session_state.conversation_id is None:
+        st.session_state.conversation_id = store.create_conversation(message.text, api_name, model)
+    store.append_message(st.session_state.conversation_id, message)
+
+def append_message(store, message, api_name, model):
+    """定稿的消息写入会话存储后加入会话历史，较长的推理内容与图片移到外置存储"""
+    persist_message(store, message, api_name, model)
+    st.session_state.messages.append(message.spill(get_spill_store()))
+
+def load_conversation(store, conversation_id):
+    """切换会话：只加载最新一页消息；进行中的生成先停止，部分答案写回发起它的会话"""
+    detach_generation(store)
+    messages = store.load_messages(conversation_id, limit=ChatUI.HISTORY_PAGE_SIZE) if conversation_id else []
+    for message in messages:
+        message.spill(get_spill_store())
+    st.session_state.conversation_id = conversation_id or None
+    st.session_state.messages = messages
+    st.session_state.history_window = ChatUI.HISTORY_PAGE_SIZE
+    st.session_state.has_earlier = bool(messages) and messages[0].seq > 0
+    st.session_state.render_cache.clear()
+    # 未采用的对比结果属于原会话，切换后丢弃
+    st.session_state.compare_results = None
+
+def sync_loaded_history(store):
+    """按历史窗口懒加载更早的消息，并释放窗口之外的消息，使内存占用有界"""
+    messages = st.session_state.messages
+    window = st.session_state.history_window
+    if store is None or st.session_state.conversation_id is None:
+        return
+    missing = window - len(messages)
+    if missing > 0 and st.session_state.has_earlier:
+        older = store.load_messages(st.session_state.conversation_id, before_seq=messages[0].seq, limit=missing)
+        for message in older:
+            message.spill(get_spill_store())
+        messages[:0] = older
+        st.session_state.has_earlier = bool(older) and older[0].seq > 0
+    excess = len(messages) - (window + ChatUI.HISTORY_PAGE_SIZE)
+    if excess > 0 and all(m.seq is not None for m in messages[:excess]):
+        del messages[:excess]
+        st.session_state.has_earlier = True
+
+def new_stream_state():
+    """单路流式响应的渲染状态，键与 ChatUI.streaming_renderer 返回的渲染函数的参数一致"""
+    return {"content": "", "reasoning": "", "is_reasoner": False, "under_reasoning": False, "elapsed": None}
+
+def apply_chunk(state, chunk):
+    """将一个流式分块合并到渲染状态，思考/正文阶段切换时返回 True（需要立即刷新）"""
+    chunk_type = chunk["type"]
+    force = False
+    if chunk_type == "reasoning" and not state["under_reasoning"]:
+        state["is_reasoner"] = True
+        state["under_reasoning"] = True
+        force = True
+    elif chunk_type == "content" and state["under_reasoning"]:
+        state["under_reasoning"] = False
+        state["elapsed"] = chunk["elapsed"]
+        force = True
+    state[chunk_type] += chunk["content"] if chunk["content"] else ""
+    return force
+
+def start_generation(chat_engine, api_name, model):
+    """在后台开始生成并登记，会话中只保存生成 id、已读到的序号与渲染状态"""
+    handle = chat_engine.start(st.session_state.messages)
+    st.session_state.generation = {
+        "id": get_generation_registry().add(handle),
+        "offset": 0,
+        "state": new_stream_state(),
+        "target": (api_name, model),
+        "conversation_id": st.session_state.conversation_id,  # 结果只写回发起生成的会话
+    }
+
+def finish_generation(store, handle):
+    """取回本会话的生成结果写入发起它的会话（被取消时保留已收到的部分答案），并从登记表中移除"""
+    generation = st.session_state.generation
+    st.session_state.generation = None
+    get_generation_registry().release(generation["id"])
+    if handle is None or handle.error is not None:
+        return
+    message = handle.result or handle.partial_message()
+    if message is None:
+        return
+    if generation["conversation_id"] == st.session_state.conversation_id:
+        append_message(store, message, *generation["target"])
+    elif store is not None and generation["conversation_id"] is not None:
+        # 生成期间已切换到其他会话：只保存到发起它的会话，不加入当前会话的历史
+        store.append_message(generation["conversation_id"], message)
+
+def stop_generation(store):
+    """停止本会话进行中的生成并保留已收到的部分答案"""
+    handle = get_generation_registry().get(st.session_state.generation["id"])
+    if handle is not None:
+        handle.cancel()
+        handle.wait(GENERATION_CANCEL_TIMEOUT)
+    finish_generation(store, handle)
+
+def detach_generation(store):
+    """停止本会话进行中的生成（如有），避免上游继续输出并计费，已收到的部分答案照常保存"""
+    if st.session_state.generation:
+        stop_generation(store)
+
+def follow_generation(store, chat_ui):
+    """
+    接上本会话进行中的生成，从上次读到的序号继续渲染；
+    本次运行被中断（重新运行、连接断开）时生成不受影响，下次运行从中断处继续，不会重新请求
+    """
+    generation = st.session_state.generation
+    handle = get_generation_registry().get(generation["id"])
+    if handle is None:
+        # 已过期被清理
+        st.session_state.generation = None
+        return
+    state = generation["state"]
+    message_placeholder = st.empty()
+    if generation["offset"] == 0:
+        with message_placeholder:
+            chat_ui.render_thinking_animation()
+    stop_placeholder = st.empty()
+    if stop_placeholder.button("⏹️ 停止生成", key="stop_generation"):
+        handle.cancel()
+    renderer = StreamRenderer(
+        message_placeholder, chat_ui.streaming_renderer(), max_fps=STREAM_MAX_FPS, min_delta=STREAM_MIN_DELTA
+    )
+    if generation["offset"]:
+        # 重新接上时先补出已读到的内容
+        renderer.update(force=True, **state)
+    try:
+        for seq, chunk in handle.follow(generation["offset"], heartbeat=FOLLOW_HEARTBEAT):
+            if chunk is None:
+                # 心跳：重发当前一帧（尚无内容时为思考动画），让停止按钮在首个分块到达前也能生效
+                if renderer.frames:
+                    renderer.update(force=True)
+                else:
+                    with message_placeholder:
+                        chat_ui.render_thinking_animation()
+                continue
+            # 先记录已读序号再刷新：刷新时本次运行可能被中断，下次运行不会重复合并同一分块
+            force = apply_chunk(state, chunk)
+            generation["offset"] = seq + 1
+            # 思考/正文阶段切换时强制刷新，其余分块按帧率合并
+            renderer.update(force=force, **state)
+    except Exception as e:
+        finish_generation(store, handle)
+        message_placeholder.empty()
+        stop_placeholder.empty()
+        st.error(f"发生错误: {str(e)}")
+        return
+    stop_placeholder.empty()
+    renderer.close(**state)  # 补一帧防抖，保证最终内容完整
+    finish_generation(store, handle)
+    st.rerun()
+
+def run_compare(api_manager, chat_ui, targets, labels):
+    """对比模式：同一轮对话并发发送给多个模型并分列流式显示，结果保存到 compare_results 等待用户采用"""
+    chat_engine = init_chat_engine()
+    group, engines = start_group(
+        api_manager, targets, st.session_state.messages,
+        retriever=chat_engine.retriever, system_prompt=chat_engine.system_prompt
+    )
+    slots = chat_ui.render_compare_columns(labels)
+    states = [new_stream_state() for _ in targets]
+    renderers = [
+        StreamRenderer(message, chat_ui.streaming_renderer(), max_fps=STREAM_MAX_FPS, min_delta=STREAM_MIN_DELTA)
+        for _, message in slots
+    ]
+    ttfts = [None] * len(targets)
+    stats = [ChatUI.format_compare_stats(None) for _ in targets]
+    stop_placeholder = st.empty()
+    stop_placeholder.button("⏹️ 停止生成", key="stop_compare")
+    start = time.perf_counter()
+    try:
+        for index, chunk in group:
+            stats_placeholder = slots[index][0]
+            if chunk is None:
+                # 该路结束：补一帧保证内容完整，并显示以服务端用量计算的最终指标
+                renderers[index].close(**states[index])
+                handle, metrics = group.handles[index], engines[index].last_metrics or {}
+                error = f"{type(handle.error).__name__}: {handle.error}" if handle.error else None
+                stats[index] = ChatUI.format_compare_stats(
+                    metrics.get("ttft", ttfts[index]), metrics.get("tokens_per_sec"), error
+                )
+                stats_placeholder.caption(stats[index])
+                continue
+            if ttfts[index] is None:
+                ttfts[index] = time.perf_counter() - start
+                stats[index] = ChatUI.format_compare_stats(ttfts[index])
+                stats_placeholder.caption(stats[index])
+            renderers[index].update(force=apply_chunk(states[index], chunk), **states[index])
+        stop_placeholder.empty()
+    finally:
+        # 停止或中断时取消仍在进行的各路生成，保留已收到的部分答案
+        group.cancel()
+        conversation_id = st.session_state.conversation_id
+        st.session_state.compare_results = [
+            {"label": label, "target": target, "stats": stat, "message": handle.result or handle.partial_message(),
+             "conversation_id": conversation_id}
+            for label, target, stat, handle in zip(labels, targets, stats, group.handles)
+        ]
+
+def adopt_compare_result(store, index):
+    """采用某一路对比结果作为本轮回答，写入历史与会话存储（只采用到产生该结果的会话中）"""
+    results = st.session_state.compare_results
+    st.session_state.compare_results = None
+    result = results[index] if results and index < len(results) else None
+    if result is None or result["message"] is None:
+        return
+    if result["conversation_id"] != st.session_state.conversation_id:
+        return
+    append_message(store, result["message"], *result["target"])
+
 def main():
     # 初始化聊天引擎、聊天窗口、侧边栏、用户输入框
     api_manager = get_api_manager()
+    store = get_conversation_store()
     chat_engine = init_chat_engine()
     chat_ui = ChatUI()
+    # 配置文件修改后自动生效，无需重启
+    changed = api_manager.maybe_reload()
+    if changed is not None:
+        st.toast(f"配置已重新加载：{', '.join(changed) or '无供应商变化'}")
+    # 供应商 /models 列表过期时在后台刷新模型目录，本次运行继续使用当前目录
+    if api_manager.catalog_refresh_due():
+        run_in_background(api_manager.async_refresh_catalog())
+    if api_manager.reload_error:
+        st.sidebar.warning(f"配置文件有误，继续使用上一版配置：{api_manager.reload_error}")
     
     # 渲染侧边栏并获取选择的API和模型
-    api_name, model = chat_ui.render_sidebar(api_manager.get_api_configs())
+    api_name, model = chat_ui.render_sidebar(api_manager.catalog, on_clear=lambda: detach_generation(store))
+    if store is not None:
+        selected = chat_ui.render_conversations(store.list_conversations(), st.session_state.conversation_id)
+        if selected is not None:
+            load_conversation(store, selected)
+            st.rerun()
+    rag_index = get_rag_index()
+    if rag_index is not None:
+        uploads, deleted = chat_ui.render_knowledge_base(rag_index.list_documents())
+        for upload in uploads:
+            rag_index.add_document(upload.name, upload.getvalue().decode("utf-8", errors="replace"))
+        if deleted is not None:
+            rag_index.delete_document(deleted)
+        if uploads or deleted is not None:
+            st.rerun()
+    chat_ui.render_metrics(
+        api_manager.metrics.summary(), api_manager.get_pool_stats(), chat_engine.prefix_cache_hit_rate,
+        memory_report(st.session_state.messages, st.session_state.render_cache)
+    )
+    compare_targets = chat_ui.render_compare_settings(api_manager.catalog)
     
     # 如果API或模型发生变化,更新chat engine
     if (st.session_state.current_api != api_name or 
@@ -74,92 +363,60 @@ def main():
     
     # 获取用户输入
     user_input = chat_ui.get_user_input_with_upload()
-    print(user_input)
     
     # 处理用户输入
     if user_input:
-        # 会话状态中添加用户消息
-        st.session_state.messages.append(Message(
+        # 本轮的请求 id 关联界面轮次、供应商调用与指标记录
+        set_request_id(new_request_id())
+        logger.info("user turn", extra={"fields": {
+            "api": api_name, "model": model, "history": len(st.session_state.messages),
+            "files": len(user_input.files or []), "compare": len(compare_targets), **describe(user_input.text)
+        }})
+        # 上一轮对比结果未被采用时，默认采用第一列，保持对话历史连贯
+        if st.session_state.compare_results:
+            adopt_compare_result(store, 0)
+        # 上一次生成尚未结束时先停止，保留已收到的部分答案
+        detach_generation(store)
+        # 会话状态中添加用户消息，并写入会话存储
+        user_message = Message(
             role="user",
             content=user_input.text,
             files=user_input.files if user_input.files else None,
             timestamp=time.time()
-            ))
+            )
+        append_message(store, user_message, api_name, model)
+        if user_message.files and api_manager.get_image_policy(api_name, model) is None:
+            st.warning("当前模型不支持图片输入，本次只发送文字内容")
         
         # 更新chat engine的消息历史
         chat_engine.clear_history()
     
     # 渲染所有消息
     with message_container:
-        # 渲染历史消息
-        for message in st.session_state.messages:
-            chat_ui.render_message(message)
-        
-        # 如果有新输入，显示AI响应
-        if user_input:
+        # 渲染历史消息（仅渲染最近窗口内的消息，更早的消息从存储中按页加载）
+        sync_loaded_history(store)
+        chat_ui.render_history(st.session_state.messages, st.session_state.has_earlier)
+
+        # 对比模式：并发请求所有选中的模型
+        if user_input and compare_targets:
+            labels = [api_manager.catalog.get(*target).label for target in compare_targets]
             try:
-                # 显示思考动画
-                message_placeholder = st.empty()
-                with message_placeholder:
-                    chat_ui.render_thinking_animation()
-                
-                # 获取 AI 流式响应
-                response_text = {"reasoning": "", "content": ""}
-                under_reasoning = False
-                is_reasoner = False
-                try:
-                    print("会话记录：")
-                    print(st.session_state.messages)
-                    response = chat_engine.get_response(st.session_state.messages)
-                    while True:
-                        chunk = next(response)
-                        if not any(response_text.values()):
-                            message_placeholder.empty()
-                            message_placeholder = st.empty()
-                        
-                        chunk_type = chunk["type"]
-                        if chunk_type == "reasoning" and not under_reasoning:
-                            is_reasoner = True
-                            under_reasoning = True
-                        elif chunk_type == "content" and under_reasoning:
-                            under_reasoning = False
-                            response_text["elapsed"] = chunk["elapsed"]
-
-                        response_text[chunk_type] += chunk["content"] if chunk["content"] else ""
-                        
-                        message_placeholder.markdown(
-                            chat_ui.render_streaming_message(
-                                content=response_text["content"],
-                                reasoning=response_text["reasoning"],
-                                is_reasoner=is_reasoner,
-                                under_reasoning=under_reasoning,
-                                elapsed=response_text.get("elapsed", None)
-                            ),
-                            unsafe_allow_html=True
-                        )
-
-                except StopIteration as e:
-                    final_result = e.value
-                    st.session_state.messages.append(final_result)
-                    message_placeholder.markdown(
-                        chat_ui.render_streaming_message(
-                            content=final_result.content["content"],
-                            reasoning=final_result.content["reasoning"],
-                            is_reasoner=is_reasoner,
-                            under_reasoning=under_reasoning,
-                            elapsed=final_result.content.get("elapsed", None)
-                        ),
-                        unsafe_allow_html=True
-                    ) # 补一帧防抖
-                    print("会话记录：")
-                    print(st.session_state.messages)
-
-                # 刷新页面
-                st.rerun()
-                
+                run_compare(api_manager, chat_ui, compare_targets, labels)
             except Exception as e:
-                message_placeholder.empty()
                 st.error(f"发生错误: {str(e)}")
+            else:
+                st.rerun()
+        elif st.session_state.compare_results:
+            selected = chat_ui.render_compare_results(st.session_state.compare_results)
+            if selected is not None:
+                adopt_compare_result(store, selected)
+                st.rerun()
+
+        # 如果有新输入，在后台开始生成；本会话有进行中的生成时（包括被中断的上一次运行）接上继续渲染
+        if user_input and not compare_targets:
+            start_generation(chat_engine, api_name, model)
+        if st.session_state.generation:
+            follow_generation(store, chat_ui)
 
 if __name__ == "__main__":
     main() 
@@ -0,0 +1,296 @@
+"""
+批量/无界面运行器
+
+从 JSONL 读取提示词，使用与界面相同的供应商配置，经 AsyncChatEngine 并发请求（每个供应商独立限制并发数，
+模型别名的请求计入路由实际选中的供应商），每条结果完成后立即追加写入输出 JSONL；
+再次运行时跳过输出文件中已成功的记录，可从中断处继续。
+
+输入每行一个 JSON 对象：
+    {"id": "q1", "prompt": "你好"}
+    {"id": "q2", "messages": [{"role": "system", "content": "..."}, {"role": "user", "content": "..."}],
+     "model": "groq/qwen/qwen3-32b"}
+id 缺省时使用行号；model 缺省时使用 --model。
+
+用法：
+    python batch.py prompts.jsonl -o results.jsonl --model deepseek/deepseek-chat --concurrency 8
+    python batch.py prompts.jsonl -o results.jsonl --model auto/deepseek-v3 --provider-concurrency groq=2
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from modules.api_manager import APIManager, ConfigLoader
+from modules.async_engine import AsyncChatEngine
+from modules.chat_engine import Message, ResponseCollector
+from modules.log import new_request_id, set_request_id, setup_logging
+from modules.metrics import percentile
+from modules.rag_index import RAGIndex
+from modules.router import ALIAS_API, Endpoint
+
+# 每个供应商默认的并发请求数
+DEFAULT_CONCURRENCY = 4
+
+
+def load_prompts(path: str, default_model: Optional[str]) -> List[Dict]:
+    """读取输入 JSONL，返回 [{"id", "endpoint", "messages"}]"""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            spec = record.get("model") or default_model
+            if not spec:
+                raise ValueError(f"Line {line_no}: no model given and --model not set")
+            if "messages" in record:
+                messages = [Message(role=m["role"], content=m["content"]) for m in record["messages"]]
+            elif "prompt" in record:
+                messages = [Message(role="user", content=record["prompt"])]
+            else:
+                raise ValueError(f"Line {line_no}: expected 'prompt' or 'messages'")
+            items.append({
+                "id": str(record.get("id", line_no)),
+                "endpoint": Endpoint.parse(spec),
+                "messages": messages,
+            })
+    return items
+
+
+def completed_ids(path: str) -> Set[str]:
+    """读取已有输出文件中成功完成的 id（中断时写了一半的末行会被忽略）"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("error") is None:
+                done.add(record["id"])
+    return done
+
+
+def parse_provider_concurrency(values: List[str]) -> Dict[str, int]:
+    limits = {}
+    for value in values:
+        name, _, limit = value.partition("=")
+        if not name or not limit.isdigit() or int(limit) < 1:
+            raise ValueError(f"Invalid provider concurrency '{value}', expected 'api=N'")
+        limits[name] = int(limit)
+    return limits
+
+
+class BatchRunner:
+    """
+    按供应商分组的有界并发执行器：每个供应商一个信号量，直接指定该供应商的请求与经模型别名路由到它的请求
+    共用同一并发上限；别名请求优先选择排序靠前且仍有空闲并发的端点，失败时依次切换到其余端点
+    """
+    def __init__(self, api_manager: APIManager, output_path: str, concurrency: int = DEFAULT_CONCURRENCY,
+                 provider_concurrency: Optional[Dict[str, int]] = None, use_cache: bool = True,
+                 retriever: Optional[RAGIndex] = None):
+        self.api_manager = api_manager
+        self.retriever = retriever
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.provider_concurrency = provider_concurrency or {}
+        self.use_cache = use_cache
+        self.records: List[Dict] = []
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _limit(self, api_name: str) -> int:
+        return self.provider_concurrency.get(api_name, self.concurrency)
+
+    def _slot(self, api_name: str) -> asyncio.Semaphore:
+        if api_name not in self._slots:
+            self._slots[api_name] = asyncio.Semaphore(self._limit(api_name))
+        return self._slots[api_name]
+
+    def _providers(self, endpoint: Endpoint) -> Set[str]:
+        """请求可能使用的实际供应商：模型别名为其全部端点的供应商"""
+        if endpoint.api_name == ALIAS_API:
+            return {e.api_name for e in self.api_manager.router.aliases[endpoint.model].endpoints}
+        return {endpoint.api_name}
+
+    def _candidates(self, endpoint: Endpoint) -> List[Endpoint]:
+        """按尝试顺序排列的实际端点：别名按路由排序，有空闲并发的端点排在前面"""
+        if endpoint.api_name != ALIAS_API:
+            return [endpoint]
+        ranked = self.api_manager.router.rank(endpoint.model)
+        return sorted(ranked, key=lambda e: self._slot(e.api_name).locked())
+
+    def validate(self, items: List[Dict]):
+        """开始前检查所有模型是否有效，避免运行到一半才失败"""
+        for endpoint in {item["endpoint"] for item in items}:
+            if endpoint.api_name not in self.api_manager.get_api_configs():
+                raise ValueError(f"Unknown API: {endpoint.api_name}")
+            if not self.api_manager.validate_model(endpoint.api_name, endpoint.model):
+                raise ValueError(f"Invalid model {endpoint.model} for API {endpoint.api_name}")
+
+    async def run(self, items: List[Dict]) -> float:
+        """执行全部请求，返回总耗时（秒）"""
+        queues: Dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+        providers: Dict[str, Set[str]] = defaultdict(set)
+        for item in items:
+            queues[item["endpoint"].api_name].put_nowait(item)
+            providers[item["endpoint"].api_name] |= self._providers(item["endpoint"])
+
+        start = time.perf_counter()
+        with open(self.output_path, "a", encoding="utf-8") as out:
+            # 实际的并发由各供应商的信号量限制，工作协程数只需足以用满其可能使用的供应商的上限
+            workers = [
+                self._worker(queue, out)
+                for api_name, queue in queues.items()
+                for _ in range(min(sum(self._limit(name) for name in providers[api_name]), queue.qsize()))
+            ]
+            await asyncio.gather(*workers)
+        return time.perf_counter() - start
+
+    async def _worker(self, queue: asyncio.Queue, out):
+        while not queue.empty():
+            record = await self._run_one(queue.get_nowait())
+            self.records.append(record)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+    async def _run_one(self, item: Dict) -> Dict:
+        endpoint = item["endpoint"]
+        # 请求 id 关联该条目的日志与指标记录
+        request_id = new_request_id()
+        set_request_id(request_id)
+        record = {"id": item["id"], "request_id": request_id, "api": endpoint.api_name, "model": endpoint.model}
+        start = time.perf_counter()
+        candidates = self._candidates(endpoint)
+        errors = []
+        for index, target in enumerate(candidates):
+            async with self._slot(target.api_name):
+                engine, collector, error = await self._stream(item, target)
+            if error is None:
+                break
+            message = f"{type(error).__name__}: {error}"
+            errors.append(f"{target}: {message}" if len(candidates) > 1 else message)
+            partial = collector.result()
+            # 已收到内容的请求不再切换端点，以免重复计费
+            if index + 1 < len(candidates) and not partial["content"] and not partial["reasoning"]:
+                continue
+            record.update({
+                "content": partial["content"], "reasoning": partial["reasoning"],
+                "duration": time.perf_counter() - start,
+                "error": "; ".join(errors)
+            })
+            return record
+
+        reply = collector.message.content
+        metrics = engine.last_metrics or {}
+        cache_hit = engine.last_context_stats.get("cache_hit", False)
+        record.update({
+            "content": reply.content,
+            "reasoning": reply.reasoning,
+            "served_by": f"{metrics['api']}/{metrics['model']}" if metrics else str(target),
+            "cache_hit": cache_hit,
+            "ttft": None if cache_hit else metrics.get("ttft"),
+            "duration": time.perf_counter() - start,
+            "prompt_tokens": metrics.get("prompt_tokens"),
+            "completion_tokens": metrics.get("completion_tokens"),
+            "tokens_per_sec": metrics.get("tokens_per_sec"),
+            "retrieval": engine.last_context_stats.get("retrieval"),
+            "error": None
+        })
+        return record
+
+    async def _stream(self, item: Dict, target: Endpoint) -> Tuple[AsyncChatEngine, ResponseCollector, Optional[Exception]]:
+        """向实际端点发送一条请求并读完响应，返回 (引擎, 收集器, 错误)"""
+        # 每个请求使用独立的引擎，避免并发请求互相覆盖模型与指标
+        engine = AsyncChatEngine(self.api_manager, self.retriever)
+        engine.set_model(target.api_name, target.model)
+        collector = ResponseCollector()
+        try:
+            async for _ in engine.astream_response(item["messages"], use_cache=self.use_cache, collector=collector):
+                pass
+        except Exception as e:
+            return engine, collector, e
+        return engine, collector, None
+
+
+def summarize(records: List[Dict], wall_time: float) -> List[Dict]:
+    """按供应商与整体汇总吞吐与延迟"""
+    groups = defaultdict(list)
+    for record in records:
+        groups[record["api"]].append(record)
+    rows = []
+    for name, group in sorted(groups.items()) + [("全部", records)]:
+        ok = [r for r in group if r["error"] is None]
+        tokens = sum(r.get("completion_tokens") or 0 for r in ok)
+        ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+        durations = [r["duration"] for r in ok]
+        rows.append({
+            "provider": name,
+            "requests": len(group),
+            "errors": len(group) - len(ok),
+            "req_per_sec": len(group) / wall_time if wall_time else None,
+            "tokens_per_sec": tokens / wall_time if wall_time else None,
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+            "duration_p50": percentile(durations, 50),
+            "duration_p95": percentile(durations, 95),
+        })
+    return rows
+
+
+def print_summary(rows: List[Dict], wall_time: float, skipped: int):
+    columns = [
+        ("provider", "供应商", "{}"),
+        ("requests", "请求", "{}"),
+        ("errors", "错误", "{}"),
+        ("req_per_sec", "请求/秒", "{:.2f}"),
+        ("tokens_per_sec", "输出token/秒", "{:.1f}"),
+        ("ttft_p50", "首字p50(s)", "{:.2f}"),
+        ("ttft_p95", "首字p95(s)", "{:.2f}"),
+        ("duration_p50", "耗时p50(s)", "{:.2f}"),
+        ("duration_p95", "耗时p95(s)", "{:.2f}"),
+    ]
+    print(f"\n总耗时 {wall_time:.1f}s，跳过已完成 {skipped} 条")
+    print(" | ".join(title for _, title, _ in columns))
+    for row in rows:
+        print(" | ".join("-" if row.get(name) is None else fmt.format(row[name]) for name, _, fmt in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量运行 JSONL 中的提示词")
+    parser.add_argument("input", help="输入 JSONL 文件")
+    parser.add_argument("-o", "--output", required=True, help="输出 JSONL 文件（追加写入，支持断点续跑）")
+    parser.add_argument("--model", help="默认模型，格式为 供应商/模型（模型别名使用 auto/别名）")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="每个供应商的并发请求数")
+    parser.add_argument("--provider-concurrency", action="append", default=[], metavar="API=N",
+                        help="按供应商覆盖并发数，可重复")
+    parser.add_argument("--config", default="config/api_config.yaml", help="API 配置文件")
+    parser.add_argument("--no-cache", action="store_true", help="不使用响应缓存")
+    parser.add_argument("--rag", action="store_true", help="使用配置中的本地知识库为每条提示词检索参考资料")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    items = load_prompts(args.input, args.model)
+    done = completed_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+
+    api_manager = APIManager(args.config)
+    retriever = RAGIndex.from_config(ConfigLoader.load_section('rag', args.config), api_manager) if args.rag else None
+    runner = BatchRunner(
+        api_manager, args.output, args.concurrency,
+        parse_provider_concurrency(args.provider_concurrency), use_cache=not args.no_cache, retriever=retriever
+    )
+    runner.validate(pending)
+    print(f"共 {len(items)} 条，待运行 {len(pending)} 条")
+    wall_time = asyncio.run(runner.run(pending)) if pending else 0.0
+    print_summary(summarize(runner.records, wall_time), wall_time, len(items) - len(pending))
+    return 1 if any(r["error"] for r in runner.records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+聊天链路离线基准测试
+
+启动本地模拟供应商（独立进程，避免其 CPU 计入客户端），通过 APIManager / ChatClient /
+ChatEngine.get_response 以及 ChatUI.streaming_renderer 驱动不同长度的合成对话，
+报告吞吐、首字延迟、每 token CPU 时间与内存增长。
+
+用法：
+    python -m benchmarks.bench_chat --history 0 20 200 --iterations 5 --reasoning field
+    python -m benchmarks.bench_chat --save bench.json
+    python -m benchmarks.bench_chat --baseline bench.json --tolerance 0.2   # 退化超过 20% 时返回非零
+"""
+from contextlib import contextmanager
+from typing import Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.mock_provider import add_settings_arguments
+from modules.api_manager import APIManager
+from modules.chat_engine import ChatEngine, Message
+from modules.metrics import percentile
+from modules.ui_components import ChatUI
+
+MOCK_API = "mock"
+MOCK_MODEL = "mock-chat"
+
+# 与基线比较时的指标及其方向（True 表示越大越好）
+COMPARED_METRICS = {
+    "tokens_per_sec": True,
+    "ttft_p50": False,
+    "cpu_ms_per_token": False,
+    "render_ms_per_chunk": False,
+}
+
+
+@contextmanager
+def mock_provider_process(argv: List[str]):
+    """在子进程中启动模拟供应商，返回其 base_url"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_provider", "--port", "0"] + argv,
+        cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    try:
+        base_url = process.stdout.readline().strip()
+        if not base_url:
+            raise RuntimeError("mock provider failed to start")
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=5)
+
+
+def write_mock_config(base_url: str, path: str):
+    """生成只包含模拟供应商的 API 配置文件"""
+    config = {"apis": {MOCK_API: {
+        "url": base_url,
+        "key": "mock-key",
+        "model_list": [MOCK_MODEL],
+        "context_window": 1000000,
+        "stream_usage": True,
+    }}}
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+
+
+def synthetic_history(length: int) -> List[Message]:
+    """生成指定条数的合成对话历史，最后一条总是用户提问"""
+    messages = []
+    for i in range(length):
+        if i % 2 == 0:
+            messages.append(Message(role="user", content=f"第{i}轮问题：请解释一下这段代码的作用。" * 3))
+        else:
+            messages.append(Message(role="assistant", content={
+                "content": "这是一个示例回答，包含一些 `code` 和说明文字。" * 20,
+                "reasoning": "思考过程" * 50,
+                "elapsed": 1
+            }))
+    messages.append(Message(role="user", content="最后的问题：总结一下上面的内容。"))
+    return messages
+
+
+def run_once(engine: ChatEngine, ui: ChatUI, history: List[Message]) -> Dict:
+    """执行一次流式请求，并模拟 app.py 中逐块渲染的路径"""
+    response_text = {"reasoning": "", "content": ""}
+    under_reasoning = False
+    is_reasoner = False
+    render_time = 0.0
+    chunks = 0
+    first_chunk = None
+    render = ui.streaming_renderer()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    response = engine.get_response(history)
+    try:
+        while True:
+            chunk = next(response)
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - wall_start
+            chunks += 1
+            chunk_type = chunk["type"]
+            if chunk_type == "reasoning":
+                is_reasoner = under_reasoning = True
+            elif under_reasoning:
+                under_reasoning = False
+            response_text[chunk_type] += chunk["content"] or ""
+            render_start = time.perf_counter()
+            render(
+                content=response_text["content"],
+                reasoning=response_text["reasoning"],
+                is_reasoner=is_reasoner,
+                under_reasoning=under_reasoning,
+                elapsed=chunk.get("elapsed")
+            )
+            render_time += time.perf_counter() - render_start
+    except StopIteration:
+        pass
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    metrics = engine.last_metrics or {}
+    tokens = metrics.get("completion_tokens") or 0
+    return {
+        "ttft": first_chunk,
+        "duration": wall,
+        "chunks": chunks,
+        "tokens": tokens,
+        "cpu": cpu,
+        "render": render_time,
+        "prompt_tokens": engine.last_context_stats.get("prompt_tokens"),
+    }
+
+
+def run_scenario(engine: ChatEngine, ui: ChatUI, history_length: int, iterations: int) -> Dict:
+    """对一种对话长度重复执行，汇总各项指标"""
+    history = synthetic_history(history_length)
+    snapshot_before = tracemalloc.take_snapshot()
+    runs = [run_once(engine, ui, history) for _ in range(iterations)]
+    snapshot_after = tracemalloc.take_snapshot()
+    growth = sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, "filename"))
+
+    tokens = sum(r["tokens"] for r in runs)
+    chunks = sum(r["chunks"] for r in runs)
+    ttfts = [r["ttft"] for r in runs if r["ttft"] is not None]
+    return {
+        "history": history_length,
+        "iterations": iterations,
+        "prompt_tokens": runs[-1]["prompt_tokens"],
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p99": percentile(ttfts, 99),
+        "duration_mean": statistics.mean(r["duration"] for r in runs),
+        "tokens_per_sec": tokens / sum(r["duration"] for r in runs) if tokens else None,
+        "cpu_ms_per_token": 1000 * sum(r["cpu"] for r in runs) / tokens if tokens else None,
+        "render_ms_per_chunk": 1000 * sum(r["render"] for r in runs) / chunks if chunks else None,
+        "memory_growth_kb": growth / 1024,
+    }
+
+
+def compare_with_baseline(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """与基线结果比较，返回超出容差的退化项"""
+    previous = {r["history"]: r for r in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(result["history"])
+        if not base:
+            continue
+        for name, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(name), result.get(name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"history={result['history']} {name}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results: List[Dict]):
+    columns = [
+        ("history", "历史条数", "{}"),
+        ("prompt_tokens", "上下文tokens", "{}"),
+        ("ttft_p50", "首字p50(s)", "{:.3f}"),
+        ("ttft_p99", "首字p99(s)", "{:.3f}"),
+        ("tokens_per_sec", "tokens/s", "{:.1f}"),
+        ("cpu_ms_per_token", "CPU ms/token", "{:.3f}"),
+        ("render_ms_per_chunk", "渲染 ms/chunk", "{:.3f}"),
+        ("memory_growth_kb", "内存增长(KB)", "{:.1f}"),
+    ]
+    print(" | ".join(title for _, title, _ in columns))
+    for result in results:
+        cells = []
+        for name, _, fmt in columns:
+            value = result.get(name)
+            cells.append("-" if value is None else fmt.format(value))
+        print(" | ".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="聊天链路离线基准测试")
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 10, 50, 200], help="合成对话的历史条数")
+    parser.add_argument("--iterations", type=int, default=5, help="每种场景的重复次数")
+    parser.add_argument("--save", help="将结果保存为 JSON 文件")
+    parser.add_argument("--baseline", help="与之比较的基线 JSON 文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化比例")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock_argv = []
+    for action in parser._actions:
+        if action.dest in ("help", "history", "iterations", "save", "baseline", "tolerance"):
+            continue
+        value = getattr(args, action.dest)
+        if value is not None:
+            mock_argv += [action.option_strings[0], str(value)]
+
+    with mock_provider_process(mock_argv) as base_url, tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "api_config.yaml")
+        write_mock_config(base_url, config_path)
+        engine = ChatEngine(APIManager(config_path))
+        engine.set_model(MOCK_API, MOCK_MODEL)
+        # streaming_renderer 不依赖 session_state，跳过 ChatUI 的初始化
+        ui = ChatUI.__new__(ChatUI)
+
+        tracemalloc.start()
+        # 预热连接，避免首个场景包含建连开销
+        run_once(engine, ui, synthetic_history(0))
+        results = [run_scenario(engine, ui, length, args.iterations) for length in args.history]
+        tracemalloc.stop()
+
+    print_table(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n性能退化：")
+            for line in regressions:
+                print("  " + line)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+多会话压测：估算一个 app.py 工作进程能同时服务多少个会话
+
+每个模拟会话在独立线程中运行（与 Streamlit 每次脚本运行占用一个线程一致），每轮依次：
+渲染历史（按消息缓存 HTML，与 ChatUI.render_message 相同）→ 通过 AsyncChatEngine.start 在共享事件循环中生成 →
+由 StreamRenderer 按帧率渲染 → 保存回复并外置大块负载 → 等待思考时间后发送下一条消息。
+APIManager、SpillStore 与事件循环在各会话间共享，与 app.py 中 st.cache_resource 的对象一致；
+模拟供应商运行在独立进程中，其 CPU 不计入。
+
+会话数逐级增加，每级报告首个渲染 token 的 p95、CPU 占用（以核数计，单进程受 GIL 限制约为 1）、
+每会话内存与吞吐，并给出首字 p95 不超过 --slo 且 CPU 未饱和的最大会话数。
+
+用法：
+    python -m benchmarks.bench_load --sessions 1 10 25 50 100 --turns 5 --think-time 2
+    python -m benchmarks.bench_load --sessions 20 --history 40 --reasoning field --slo 1.5 --save load.json
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.bench_chat import MOCK_API, MOCK_MODEL, mock_provider_process, synthetic_history, write_mock_config
+from benchmarks.mock_provider import add_settings_arguments
+from modules.api_manager import APIManager
+from modules.async_engine import AsyncChatEngine
+from modules.chat_engine import Message, memory_report
+from modules.metrics import percentile
+from modules.spill_store import SpillStore
+from modules.stream_renderer import StreamRenderer
+from modules.ui_components import ChatUI
+
+# 与 app.py 中的刷新参数一致
+STREAM_MAX_FPS = 15
+STREAM_MIN_DELTA = 8
+
+# 本脚本自身的参数，其余参数转发给模拟供应商
+OWN_ARGUMENTS = ("help", "sessions", "turns", "think_time", "history", "ramp", "slo", "cpu_limit", "save")
+
+
+class NullPlaceholder:
+    """代替 st.empty() 的占位组件：不输出，只统计推送到前端的帧数与字节数"""
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def markdown(self, body: str, **kwargs):
+        self.frames += 1
+        self.bytes += len(body.encode("utf-8"))
+
+
+def rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（仅 Linux），无法读取时返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class SimulatedSession:
+    """一个模拟会话：持有自己的历史、渲染缓存与聊天引擎，依次执行若干轮对话"""
+    def __init__(self, api_manager: APIManager, spill_store: Optional[SpillStore], ui: ChatUI,
+                 history: int, rng: random.Random):
+        self.engine = AsyncChatEngine(api_manager)
+        self.engine.set_model(MOCK_API, MOCK_MODEL)
+        self.spill_store = spill_store
+        self.ui = ui
+        self.rng = rng
+        self.messages: List[Message] = [message.spill(spill_store) for message in synthetic_history(history)]
+        self.render_cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self.turns: List[Dict] = []
+        self.errors = 0
+
+    def render_history(self):
+        """模拟每次脚本运行时渲染历史窗口"""
+        for message in self.messages[-ChatUI.HISTORY_PAGE_SIZE:]:
+            self.ui.cached_message_html(self.render_cache, message, ChatUI.HISTORY_PAGE_SIZE)
+
+    def run_turn(self):
+        """一轮对话：用户发送消息后的脚本运行，直到回复渲染完成"""
+        start = time.perf_counter()
+        self.render_history()
+        handle = self.engine.start(self.messages)
+        placeholder = NullPlaceholder()
+        renderer = StreamRenderer(placeholder, self.ui.streaming_renderer(),
+                                  max_fps=STREAM_MAX_FPS, min_delta=STREAM_MIN_DELTA)
+        state = {"content": "", "reasoning": "", "is_reasoner": False, "under_reasoning": False, "elapsed": None}
+        first_render = None
+        try:
+            for _, chunk in handle.follow():
+                force = False
+                if chunk["type"] == "reasoning" and not state["under_reasoning"]:
+                    state["is_reasoner"] = state["under_reasoning"] = force = True
+                elif chunk["type"] == "content" and state["under_reasoning"]:
+                    state["under_reasoning"] = False
+                    state["elapsed"] = chunk["elapsed"]
+                    force = True
+                state[chunk["type"]] += chunk["content"] or ""
+                flushed = renderer.update(force=force, **state)
+                if flushed and first_render is None and (state["content"] or state["reasoning"]):
+                    first_render = time.perf_counter() - start
+        except Exception:
+            self.errors += 1
+        renderer.close(**state)
+
+        message = handle.result or handle.partial_message()
+        if message is not None:
+            self.messages.append(message.spill(self.spill_store))
+        self.turns.append({
+            "ttfr": first_render,
+            "duration": time.perf_counter() - start,
+            "frames": placeholder.frames,
+            "pushed_bytes": placeholder.bytes,
+        })
+
+    def run(self, turns: int, think_time: float):
+        for turn in range(turns):
+            if turn:
+                if think_time > 0:
+                    time.sleep(self.rng.expovariate(1 / think_time))
+                self.messages.append(Message(role="user", content=f"第{turn}轮追问：请继续展开说明。"))
+            self.run_turn()
+
+
+def run_level(api_manager: APIManager, ui: ChatUI, count: int, args: argparse.Namespace) -> Dict:
+    """同时运行 count 个会话，汇总这一级的指标"""
+    spill_store = SpillStore()
+    sessions = [
+        SimulatedSession(api_manager, spill_store, ui, args.history, random.Random(index))
+        for index in range(count)
+    ]
+    rss_before = rss_bytes()
+    threads = [threading.Thread(target=session.run, args=(args.turns, args.think_time), daemon=True)
+               for session in sessions]
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+        # 在 ramp 秒内均匀启动，避免所有会话在同一时刻发出首个请求
+        if args.ramp > 0 and count > 1:
+            time.sleep(args.ramp / count)
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    rss_after = rss_bytes()
+
+    turns = [turn for session in sessions for turn in session.turns]
+    ttfrs = [turn["ttfr"] for turn in turns if turn["ttfr"] is not None]
+    reports = [memory_report(session.messages, session.render_cache) for session in sessions]
+    session_bytes = [r["resident_bytes"] + r["render_cache_bytes"] for r in reports]
+    result = {
+        "sessions": count,
+        "turns": len(turns),
+        "errors": sum(session.errors for session in sessions),
+        "ttfr_p50": percentile(ttfrs, 50),
+        "ttfr_p95": percentile(ttfrs, 95),
+        "turn_p95": percentile([turn["duration"] for turn in turns], 95),
+        "turns_per_sec": len(turns) / wall if wall else None,
+        "cpu_cores": cpu / wall if wall else None,
+        "session_kb": sum(session_bytes) / len(session_bytes) / 1024,
+        # 外置存储按内容去重，相同的合成历史只计一次
+        "spilled_kb": spill_store.stats()["bytes"] / count / 1024,
+        "rss_kb_per_session": (rss_after - rss_before) / count / 1024
+        if rss_before is not None and rss_after is not None else None,
+        "pushed_kb_per_turn": sum(turn["pushed_bytes"] for turn in turns) / len(turns) / 1024 if turns else None,
+    }
+    result["saturated"] = bool(
+        result["ttfr_p95"] is None or result["ttfr_p95"] > args.slo
+        or (result["cpu_cores"] or 0) >= args.cpu_limit
+    )
+    return result
+
+
+def print_table(results: List[Dict]):
+    columns = [
+        ("sessions", "会话数", "{}"),
+        ("turns", "轮数", "{}"),
+        ("errors", "错误", "{}"),
+        ("ttfr_p50", "首字p50(s)", "{:.3f}"),
+        ("ttfr_p95", "首字p95(s)", "{:.3f}"),
+        ("turn_p95", "整轮p95(s)", "{:.2f}"),
+        ("turns_per_sec", "轮/s", "{:.2f}"),
+        ("cpu_cores", "CPU(核)", "{:.2f}"),
+        ("session_kb", "会话常驻(KB)", "{:.1f}"),
+        ("spilled_kb", "会话外置(KB)", "{:.1f}"),
+        ("rss_kb_per_session", "RSS/会话(KB)", "{:.1f}"),
+        ("pushed_kb_per_turn", "推送KB/轮", "{:.1f}"),
+        ("saturated", "饱和", "{}"),
+    ]
+    print(" | ".join(title for _, title, _ in columns))
+    for result in results:
+        cells = []
+        for name, _, fmt in columns:
+            value = result.get(name)
+            cells.append("-" if value is None else fmt.format(value))
+        print(" | ".join(cells))
+
+
+def capacity(results: List[Dict]) -> Optional[int]:
+    """未饱和的最大会话数（在它之前不能有已饱和的级别），全部饱和时返回 None"""
+    best = None
+    for result in sorted(results, key=lambda r: r["sessions"]):
+        if result["saturated"]:
+            break
+        best = result["sessions"]
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多会话压测")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 25, 50], help="逐级测试的并发会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的对话轮数")
+    parser.add_argument("--think-time", type=float, default=2.0, help="两轮之间的平均思考时间（秒，指数分布）")
+    parser.add_argument("--history", type=int, default=10, help="每个会话初始的合成历史条数")
+    parser.add_argument("--ramp", type=float, default=1.0, help="每级在多少秒内陆续启动全部会话")
+    parser.add_argument("--slo", type=float, default=2.0, help="首个渲染 token 的 p95 上限（秒）")
+    parser.add_argument("--cpu-limit", type=float, default=0.9, help="视为 CPU 饱和的占用（核）")
+    parser.add_argument("--save", help="将结果保存为 JSON 文件")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock_argv = []
+    for action in parser._actions:
+        if action.dest in OWN_ARGUMENTS:
+            continue
+        value = getattr(args, action.dest)
+        if value is not None:
+            mock_argv += [action.option_strings[0], str(value)]
+
+    with mock_provider_process(mock_argv) as base_url, tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "api_config.yaml")
+        write_mock_config(base_url, config_path)
+        api_manager = APIManager(config_path)
+        # streaming_renderer 与 build_message_html 不依赖 session_state，跳过 ChatUI 的初始化
+        ui = ChatUI.__new__(ChatUI)
+
+        # 预热连接与事件循环，避免第一级包含建连开销
+        SimulatedSession(api_manager, None, ui, 0, random.Random()).run_turn()
+        results = [run_level(api_manager, ui, count, args) for count in args.sessions]
+
+    print_table(results)
+    supported = capacity(results)
+    if supported is None:
+        print(f"\n所有级别均已饱和（首字 p95 > {args.slo}s 或 CPU >= {args.cpu_limit} 核）")
+    else:
+        print(f"\n单个工作进程可支撑约 {supported} 个并发会话（首字 p95 <= {args.slo}s，CPU < {args.cpu_limit} 核）")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"capacity": supported, "levels": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
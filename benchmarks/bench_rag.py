@@ -0,0 +1,114 @@
+"""
+本地知识库检索基准
+
+按 Zipf 分布生成合成语料建立 BM25 倒排索引，对三类查询（停用词较多、自然语言、稀有词）分别测量
+检索延迟，并与逐个遍历全部倒排列表的穷举实现比较前 k 名的重合率（停用词被跳过时结果可能略有不同）。
+
+用法：python -m benchmarks.bench_rag --chunks 100000 --queries 50
+"""
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+import argparse
+import heapq
+import math
+import random
+import sys
+import time
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from modules.metrics import percentile
+from modules.rag_index import BM25_B, BM25_K1, BM25Index, DEFAULT_TOP_K
+
+VOCABULARY = 50000
+# 每类查询的词数与取词范围（按词频排名）
+QUERY_KINDS = {
+    "stopwords": (8, 0, 50),
+    "natural": (14, 0, VOCABULARY),
+    "rare": (3, 5000, VOCABULARY),
+}
+
+
+def build_index(chunks: int, terms_per_chunk: int, rng: random.Random) -> Tuple[BM25Index, List[float]]:
+    """生成合成语料并建立索引，返回索引与词频分布的累积权重"""
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, VOCABULARY + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+    index = BM25Index()
+    vocabulary = range(VOCABULARY)
+    for chunk_id in range(chunks):
+        length = max(10, int(rng.gauss(terms_per_chunk, terms_per_chunk / 4)))
+        index.add(chunk_id, Counter(f"t{term}" for term in rng.choices(vocabulary, cum_weights=cum_weights, k=length)))
+    return index, cum_weights
+
+
+def make_query(kind: str, rng: random.Random, cum_weights: List[float]) -> List[str]:
+    count, low, high = QUERY_KINDS[kind]
+    if kind == "natural":
+        # 自然语言查询的词频分布与语料一致：既有常见词也有少量稀有词
+        return [f"t{term}" for term in rng.choices(range(VOCABULARY), cum_weights=cum_weights, k=count)]
+    return [f"t{rng.randrange(low, high)}" for _ in range(count)]
+
+
+def exhaustive_search(index: BM25Index, terms: List[str], k: int) -> List[Tuple[int, float]]:
+    """参照实现：遍历所有查询词的完整倒排列表"""
+    n = len(index.lengths)
+    avg_length = index.total_length / n
+    scores: Dict[int, float] = defaultdict(float)
+    for term, qtf in Counter(terms).items():
+        posting = index.postings.get(term)
+        if not posting:
+            continue
+        idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+        for chunk_id, tf in posting.items():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * index.lengths[chunk_id] / avg_length)
+            scores[chunk_id] += qtf * idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def measure(func, queries: List[List[str]]) -> Tuple[List[float], list]:
+    timings, results = [], []
+    for terms in queries:
+        start = time.perf_counter()
+        results.append(func(terms))
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地知识库检索基准")
+    parser.add_argument("--chunks", type=int, default=100000, help="索引中的分块数")
+    parser.add_argument("--terms-per-chunk", type=int, default=150, help="每个分块的平均词数")
+    parser.add_argument("--queries", type=int, default=50, help="每类查询的次数")
+    parser.add_argument("--k", type=int, default=DEFAULT_TOP_K * 2, help="每次检索返回的分块数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    index, cum_weights = build_index(args.chunks, args.terms_per_chunk, rng)
+    print(f"index: {len(index)} chunks, {len(index.postings)} terms, built in {time.perf_counter() - start:.1f}s")
+    # 首次检索计算长度归一化项，不计入各次检索的耗时
+    index.search(["t0"], 1)
+
+    print("查询类型 | 剪枝p50(ms) | 剪枝p95(ms) | 穷举p50(ms) | 穷举p95(ms) | 前k重合率")
+    for kind in QUERY_KINDS:
+        queries = [make_query(kind, rng, cum_weights) for _ in range(args.queries)]
+        pruned_ms, pruned = measure(lambda terms: index.search(terms, args.k), queries)
+        full_ms, full = measure(lambda terms: exhaustive_search(index, terms, args.k), queries)
+        overlap = [
+            len({c for c, _ in a} & {c for c, _ in b}) / len(b) for a, b in zip(pruned, full) if b
+        ]
+        print(f"{kind} | {percentile(pruned_ms, 50):.1f} | {percentile(pruned_ms, 95):.1f} | "
+              f"{percentile(full_ms, 50):.1f} | {percentile(full_ms, 95):.1f} | "
+              f"{sum(overlap) / len(overlap):.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+启动与每次运行脚本的开销基准
+
+冷启动：在全新子进程中导入核心模块并创建 APIManager，报告耗时以及重量级依赖（openai/httpx/numpy/PIL）
+是否被提前导入。每次运行：对比直接读取/解析配置与样式文件和使用按修改时间缓存的结果的耗时。
+
+用法：python -m benchmarks.bench_startup --iterations 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from modules.file_cache import read_cached
+
+HEAVY_MODULES = ("openai", "httpx", "numpy", "PIL")
+CONFIG_PATH = os.path.join(ROOT, "config", "api_config.yaml")
+CSS_PATH = os.path.join(ROOT, "config", "style.css")
+
+_COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+from modules.api_manager import APIManager
+from modules.async_engine import AsyncChatEngine
+from modules.conversation_store import ConversationStore
+from modules.rag_index import RAGIndex
+imported = time.perf_counter()
+manager = APIManager(sys.argv[1])
+created = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "api_manager_ms": (created - imported) * 1000,
+    "models": len(manager.catalog),
+    "heavy_loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def write_offline_config(path: str):
+    """复制项目配置并填入占位密钥，避免依赖环境变量"""
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    for api_config in config["apis"].values():
+        api_config["key"] = "offline"
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+
+def cold_start(config_path: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _COLD_START % (HEAVY_MODULES,), config_path],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def per_run(config_path: str, iterations: int) -> dict:
+    """模拟每次运行脚本时读取样式与配置段的开销"""
+    def uncached():
+        with open(CSS_PATH, "r", encoding="utf-8") as f:
+            f"<style>{f.read()}</style>"
+        for _ in range(3):
+            with open(config_path, "r", encoding="utf-8") as f:
+                yaml.safe_load(f)
+
+    def cached():
+        read_cached(CSS_PATH)
+        for _ in range(3):
+            read_cached(config_path, yaml.safe_load)
+
+    result = {}
+    for name, func in (("uncached_ms", uncached), ("cached_ms", cached)):
+        func()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        result[name] = (time.perf_counter() - start) / iterations * 1000
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动与每次运行脚本的开销基准")
+    parser.add_argument("--iterations", type=int, default=200, help="每次运行开销的重复次数")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "api_config.yaml")
+        write_offline_config(config_path)
+        cold = cold_start(config_path)
+        rerun = per_run(config_path, args.iterations)
+
+    print(f"cold start: import={cold['import_ms']:.1f}ms APIManager={cold['api_manager_ms']:.1f}ms "
+          f"models={cold['models']} heavy modules loaded={cold['heavy_loaded'] or 'none'}")
+    print(f"per rerun (css + 3 config sections): uncached={rerun['uncached_ms']:.3f}ms "
+          f"cached={rerun['cached_ms']:.3f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+ThinkStreamParser 正确性与性能基准
+
+对同一段文本做多种对抗性分块（逐字符、标签在每个位置被切开、随机分块、标签与正文同块），
+校验分段结果与整段解析的参考结果一致，并测量每块耗时是否与已累积长度无关。
+
+用法：python -m benchmarks.bench_think_parser --length 200000
+"""
+from typing import Iterator, List, Tuple
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from modules.think_parser import ThinkStreamParser
+
+
+def reference_split(text: str, open_tag: str = "<think>", close_tag: str = "</think>") -> Tuple[str, str]:
+    """整段解析的参考实现，返回 (推理, 正文)"""
+    reasoning, content = [], []
+    pos = 0
+    while pos < len(text):
+        start = text.find(open_tag, pos)
+        if start == -1:
+            content.append(text[pos:])
+            break
+        content.append(text[pos:start])
+        end = text.find(close_tag, start + len(open_tag))
+        if end == -1:
+            reasoning.append(text[start + len(open_tag):])
+            break
+        reasoning.append(text[start + len(open_tag):end])
+        pos = end + len(close_tag)
+    return "".join(reasoning), "".join(content)
+
+
+def parse_chunks(chunks: List[str]) -> Tuple[str, str]:
+    parser = ThinkStreamParser()
+    reasoning, content = [], []
+    for chunk in chunks:
+        for kind, text in parser.feed(chunk):
+            (reasoning if kind == "reasoning" else content).append(text)
+    for kind, text in parser.flush():
+        (reasoning if kind == "reasoning" else content).append(text)
+    return "".join(reasoning), "".join(content)
+
+
+def chunkings(text: str, rng: random.Random) -> Iterator[Tuple[str, List[str]]]:
+    """生成对抗性分块方案"""
+    yield "whole", [text]
+    yield "per-char", list(text)
+    for size in (2, 3, 5, 7):
+        yield f"fixed-{size}", [text[i:i + size] for i in range(0, len(text), size)]
+    for tag in ("<think>", "</think>"):
+        index = text.find(tag)
+        if index == -1:
+            continue
+        for cut in range(1, len(tag)):
+            at = index + cut
+            yield f"split-{tag}-{cut}", [text[:at], text[at:]]
+    for trial in range(20):
+        cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 30))))
+        bounds = [0] + cuts + [len(text)]
+        yield f"random-{trial}", [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+CASES = [
+    "<think>推理过程</think>最终答案",
+    "前言<think>思考</think>\n\n回答",
+    "<think>未闭合的推理",
+    "没有推理标签的普通回答，包含 < 和 <thin 这样的片段",
+    "<think>含有 </thin 与 <think 字样的推理</think>答案以 </think 结尾 <",
+    "<think></think>空推理",
+    "<think>a</think>b<think>c</think>d",
+]
+
+
+def check_correctness(seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for case in CASES:
+        expected = reference_split(case)
+        for name, chunks in chunkings(case, rng):
+            actual = parse_chunks(chunks)
+            if actual != expected:
+                failures += 1
+                print(f"FAIL {name}: {case!r}\n  expected={expected!r}\n  actual={actual!r}")
+    return failures
+
+
+def bench(length: int, chunk_size: int) -> None:
+    """测量前后两半分块的平均耗时，验证每块开销不随累积长度增长"""
+    body = "推理内容 reasoning text " * (length // 40)
+    text = f"<think>{body}</think>{body}"
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    parser = ThinkStreamParser()
+    timings = []
+    for chunk in chunks:
+        start = time.perf_counter()
+        parser.feed(chunk)
+        timings.append(time.perf_counter() - start)
+    parser.flush()
+    half = len(timings) // 2
+    first = sum(timings[:half]) / half * 1e6
+    second = sum(timings[half:]) / (len(timings) - half) * 1e6
+    total = sum(timings)
+    print(f"chars={len(text)} chunks={len(chunks)} total={total * 1000:.2f}ms "
+          f"per-chunk first-half={first:.2f}us second-half={second:.2f}us "
+          f"throughput={len(text) / total / 1e6:.1f}M chars/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ThinkStreamParser 正确性与性能基准")
+    parser.add_argument("--length", type=int, default=200000, help="基准文本长度（字符）")
+    parser.add_argument("--chunk-size", type=int, default=4, help="基准分块大小（字符）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failures = check_correctness(args.seed)
+    print(f"correctness: {'OK' if not failures else f'{failures} failures'}")
+    bench(args.length, args.chunk_size)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
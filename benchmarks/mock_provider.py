@@ -0,0 +1,242 @@
+"""
+本地 OpenAI 兼容的模拟供应商，用于离线基准测试与压测
+
+支持：
+- POST /v1/chat/completions（流式 SSE 与非流式）
+- GET /v1/models
+- 可配置首字延迟、输出速率、推理内容形式（reasoning_content 字段 / <think> 标签 / 无）与错误注入
+
+用法：python -m benchmarks.mock_provider --port 8900 --token-rate 200 --reasoning think
+"""
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+WORDS = ("the quick brown fox jumps over a lazy dog while 模型 正在 生成 一段 用于 测试 的 文本 "
+         "and code `x = 1` appears with **bold** text").split()
+
+
+@dataclass
+class MockSettings:
+    ttft: float = 0.2  # 首个分块前的延迟（秒）
+    token_rate: float = 100.0  # 每秒输出的 token 数，<=0 表示不限速
+    completion_tokens: int = 200  # 正文 token 数
+    reasoning_tokens: int = 0  # 推理 token 数
+    reasoning: str = "none"  # 推理形式：none / field / think
+    tokens_per_chunk: int = 1  # 每个分块包含的 token 数
+    error_rate: float = 0.0  # 请求直接返回错误的概率
+    error_status: int = 500  # 注入错误的 HTTP 状态码（429 时附带 Retry-After）
+    abort_rate: float = 0.0  # 流式输出中途断开连接的概率
+    seed: Optional[int] = None
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = MockSettings()
+    rng = random.Random()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": name, "object": "model", "owned_by": "mock"}
+                         for name in ("mock-chat", "mock-reasoner")]
+            })
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        settings = self.settings
+        if settings.error_rate and self.rng.random() < settings.error_rate:
+            headers = {"Retry-After": "1"} if settings.error_status == 429 else None
+            self._send_json(settings.error_status, {"error": {"message": "injected error", "type": "mock_error"}}, headers)
+            return
+
+        model = request.get("model", "mock-chat")
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 4 for m in request.get("messages", []))
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self._stream(model, prompt_tokens, include_usage)
+        else:
+            time.sleep(settings.ttft)
+            reasoning, content = self._texts()
+            message = {"role": "assistant", "content": content}
+            if settings.reasoning == "field":
+                message["reasoning_content"] = reasoning
+            elif settings.reasoning == "think":
+                message["content"] = f"<think>{reasoning}</think>{content}"
+            self._send_json(200, {
+                "id": "mock-completion", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": self._usage(prompt_tokens)
+            })
+
+    def _texts(self):
+        settings = self.settings
+        reasoning = " ".join(self.rng.choice(WORDS) for _ in range(settings.reasoning_tokens))
+        content = " ".join(self.rng.choice(WORDS) for _ in range(settings.completion_tokens))
+        return reasoning, content
+
+    def _usage(self, prompt_tokens: int) -> dict:
+        completion = self.settings.completion_tokens + self.settings.reasoning_tokens
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion, "total_tokens": prompt_tokens + completion}
+
+    def _pieces(self):
+        """生成 (字段, 文本) 序列，模拟不同的推理内容输出形式"""
+        settings = self.settings
+        step = max(1, settings.tokens_per_chunk)
+        reasoning_words = [self.rng.choice(WORDS) + " " for _ in range(settings.reasoning_tokens)]
+        content_words = [self.rng.choice(WORDS) + " " for _ in range(settings.completion_tokens)]
+        if settings.reasoning == "think" and reasoning_words:
+            yield "content", "<think>"
+        for i in range(0, len(reasoning_words), step):
+            text = "".join(reasoning_words[i:i + step])
+            yield ("reasoning_content" if settings.reasoning == "field" else "content"), text
+        if settings.reasoning == "think" and reasoning_words:
+            yield "content", "</think>"
+        for i in range(0, len(content_words), step):
+            yield "content", "".join(content_words[i:i + step])
+
+    def _stream(self, model: str, prompt_tokens: int, include_usage: bool):
+        settings = self.settings
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        base = {"id": "mock-stream", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        interval = max(1, settings.tokens_per_chunk) / settings.token_rate if settings.token_rate > 0 else 0
+        abort_at = None
+        if settings.abort_rate and self.rng.random() < settings.abort_rate:
+            abort_at = self.rng.randint(1, max(1, settings.completion_tokens // max(1, settings.tokens_per_chunk)))
+
+        try:
+            time.sleep(settings.ttft)
+            deadline = time.perf_counter()
+            for index, (field, text) in enumerate(self._pieces()):
+                if abort_at is not None and index >= abort_at:
+                    return
+                delta = {"role": "assistant", field: text} if index == 0 else {field: text}
+                if field == "reasoning_content":
+                    delta.setdefault("content", None)
+                chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+                self.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+                # 按截止时间调度，避免 sleep 误差随分块数累积
+                deadline += interval
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            self.wfile.write(b"data: " + json.dumps(final).encode("utf-8") + b"\n\n")
+            if include_usage:
+                usage_chunk = dict(base, choices=[], usage=self._usage(prompt_tokens))
+                self.wfile.write(b"data: " + json.dumps(usage_chunk).encode("utf-8") + b"\n\n")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（如取消生成），直接结束
+            pass
+
+
+class MockProvider:
+    """在后台线程中运行的模拟供应商"""
+    def __init__(self, settings: Optional[MockSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or MockSettings()
+        handler = type("BoundMockProviderHandler", (MockProviderHandler,), {
+            "settings": self.settings,
+            "rng": random.Random(self.settings.seed)
+        })
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'MockProvider':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    """向命令行解析器添加模拟供应商参数（基准测试与压测脚本共用）"""
+    defaults = MockSettings()
+    parser.add_argument("--ttft", type=float, default=defaults.ttft, help="首个分块前的延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate, help="每秒输出 token 数，<=0 不限速")
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens, help="正文 token 数")
+    parser.add_argument("--reasoning-tokens", type=int, default=defaults.reasoning_tokens, help="推理 token 数")
+    parser.add_argument("--reasoning", choices=["none", "field", "think"], default=defaults.reasoning,
+                        help="推理内容形式：none / field（reasoning_content 字段）/ think（<think> 标签）")
+    parser.add_argument("--tokens-per-chunk", type=int, default=defaults.tokens_per_chunk, help="每个分块的 token 数")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="请求直接失败的概率")
+    parser.add_argument("--error-status", type=int, default=defaults.error_status, help="注入错误的 HTTP 状态码")
+    parser.add_argument("--abort-rate", type=float, default=defaults.abort_rate, help="流式输出中途断开的概率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(**{name: getattr(args, name) for name in asdict(MockSettings())})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的模拟供应商")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900, help="监听端口，0 表示随机端口")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    provider = MockProvider(settings_from_args(args), args.host, args.port)
+    # 第一行输出实际地址，便于其他进程读取
+    print(provider.base_url, flush=True)
+    try:
+        provider.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        provider.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,73 @@
+import copy
 import os
 import yaml
-from typing import Dict, List, Optional
-from dataclasses import dataclass
-from openai import OpenAI
-from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import threading
 import time
-import streamlit as st
+from modules.catalog import ModelCatalog
+from modules.file_cache import file_version, read_cached
+from modules.context_builder import DEFAULT_CONTEXT_WINDOW, DEFAULT_OUTPUT_RESERVE, content_tokens
+from modules.image_pipeline import ImagePolicy
+from modules.log import describe_messages
+from modules.metrics import MetricsHub
+from modules.model_discovery import ModelDiscovery
+from modules.router import ALIAS_API, Endpoint, ModelRouter
+from modules.response_cache import ResponseCache
+from modules.transport import (
+    PoolStats, TransportConfig, async_warm_up, build_async_http_client, build_http_client, client_busy,
+    pool_connections, warm_up
+)
+from modules.rate_limiter import (
+    DEFAULT_MAX_WAIT, RateLimiter, RateLimitExceeded, backoff_delay, parse_retry_after
+)
+
+logger = logging.getLogger(__name__)
+
+# openai 在首次创建客户端时才导入，缩短冷启动时间
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI, RateLimitError
+
+# 检查配置文件是否变化的最小间隔（秒）
+RELOAD_CHECK_INTERVAL = 1.0
+# 重新加载后被替换的 HTTP 客户端在请求全部结束后关闭，超过该秒数仍未结束时强制关闭
+RETIRED_CLIENT_GRACE = 600
+# 收到 429 后最多重试的次数
+MAX_RATE_LIMIT_RETRIES = 3
+# 连接错误/超时/5xx 重试的退避基数与上限（秒）
+TRANSIENT_BACKOFF_BASE = 0.5
+TRANSIENT_BACKOFF_CAP = 8.0
 
 @dataclass
 class APIConfig:
     url: str
     key: str
     model_list: List[str] = None
+    context_window: int = None  # 供应商默认上下文长度（token）
+    context_windows: Dict[str, int] = None  # 按模型覆盖的上下文长度
+    max_prompt_tokens: int = None  # 单次请求上下文的上限，用于控制费用与首字延迟
+    output_reserve: int = None  # 为模型输出预留的 token 数
+    stream_usage: bool = False  # 是否支持 stream_options.include_usage 在流末尾返回用量
+    rate_limits: Dict = None  # 供应商级配额：rpm / tpm / rpd / max_wait
+    model_rate_limits: Dict[str, Dict] = None  # 按模型覆盖的配额
+    think_tags: List[List[str]] = None  # 内联推理内容的标签对，默认 [["<think>", "</think>"]]
+    transport: Dict = None  # HTTP 连接池与超时设置，见 TransportConfig
+    vision_models: List[str] = None  # 支持图片输入的模型
+    image: Dict = None  # 图片输入限制，见 ImagePolicy
+    model_image: Dict[str, Dict] = None  # 按模型覆盖的图片输入限制
+    reasoning_models: List[str] = None  # 输出推理内容的模型
+    discover_models: bool = True  # 是否从供应商的 /models 补全模型能力（见 model_discovery 配置段）
+    list_discovered: bool = False  # 是否将 /models 中未列出的对话模型加入模型目录
+    allow_unlisted: bool = False  # 是否接受目录之外的模型 id（如用户自建的接入点）
 
 class ConfigLoader:
     @staticmethod
     def load_config(config_path: str = "config/api_config.yaml") -> Dict:
-        """加载API配置"""
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        """加载API配置（解析结果按文件修改时间缓存，返回副本）"""
+        config = copy.deepcopy(read_cached(config_path, yaml.safe_load))
         
         # 替换环境变量
         for api_name, api_config in config['apis'].items():
@@ -29,6 +78,12 @@ class ConfigLoader:
                     raise ValueError(f"Environment variable {env_var} not found for {api_name} API")
         
         return config['apis']
+
+    @staticmethod
+    def load_section(section: str, config_path: str = "config/api_config.yaml") -> Dict:
+        """加载配置文件中 apis 以外的可选配置段（如 aliases、response_cache）"""
+        config = read_cached(config_path, yaml.safe_load)
+        return copy.deepcopy(config.get(section) or {})
     
     @staticmethod
     def validate_config(config: Dict) -> bool:
@@ -43,44 +98,300 @@ class ConfigLoader:
         return True
 
 class ChatClient:
-    """聊天客户端"""
+    """
+    聊天客户端：聊天请求的所有重试都在这里执行，openai SDK 客户端创建时关闭了自身的重试，
+    避免同一次失败在两层中各重试一遍、尝试次数成倍增加
+    """
     def __init__(self, api_name: str, model: str, api_manager: 'APIManager'):
-        if not api_manager.validate_model(api_name, model) and api_name != "volcengine":
+        if not api_manager.validate_model(api_name, model):
             raise ValueError(f"Model {model} is not supported by {api_name}")
         
         self.api_name = api_name
         self.model = model
+        self._api_manager = api_manager
         self._client = api_manager.get_client(api_name)
+        self._limiter = api_manager.get_rate_limiter(api_name, model)
+        self._max_retries = api_manager.get_transport(api_name).max_retries
     
     def chat_completion(self, messages: List[Dict], **kwargs) -> Dict:
-        """执行聊天补全"""
-        try:
-            response = self._client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                **kwargs
-            )
-            return response
-        except Exception as e:
-            raise Exception(f"Error calling {self.api_name} API: {str(e)}")
+        """执行聊天补全（受配额调度，429 时按 retry-after 退避重试，连接错误与 5xx 按指数退避重试）"""
+        from openai import RateLimitError
+        prompt_tokens = self._estimate_prompt_tokens(messages)
+        attempt = failures = 0
+        while True:
+            if self._limiter:
+                self._limiter.acquire(prompt_tokens)
+            try:
+                response = self._client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    **kwargs
+                )
+                return response
+            except RateLimitError as e:
+                delay = self._rate_limit_delay(e, attempt)
+                attempt += 1
+                if not self._limiter:
+                    time.sleep(delay)
+            except Exception as e:
+                if not self._retryable(e, failures):
+                    raise Exception(f"Error calling {self.api_name} API: {str(e)}")
+                time.sleep(backoff_delay(failures, TRANSIENT_BACKOFF_BASE, TRANSIENT_BACKOFF_CAP))
+                failures += 1
+
+    async def async_chat_completion(self, messages: List[Dict], **kwargs):
+        """异步执行聊天补全，配额与重试策略与 chat_completion 相同"""
+        from openai import RateLimitError
+        prompt_tokens = self._estimate_prompt_tokens(messages)
+        attempt = failures = 0
+        while True:
+            if self._limiter:
+                # 配额等待是阻塞的，放到线程中执行以免阻塞事件循环
+                await asyncio.to_thread(self._limiter.acquire, prompt_tokens)
+            try:
+                return await self._async_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    **kwargs
+                )
+            except RateLimitError as e:
+                delay = self._rate_limit_delay(e, attempt)
+                attempt += 1
+                if not self._limiter:
+                    await asyncio.sleep(delay)
+            except Exception as e:
+                if not self._retryable(e, failures):
+                    raise Exception(f"Error calling {self.api_name} API: {str(e)}")
+                await asyncio.sleep(backoff_delay(failures, TRANSIENT_BACKOFF_BASE, TRANSIENT_BACKOFF_CAP))
+                failures += 1
+
+    @staticmethod
+    def _estimate_prompt_tokens(messages: List[Dict]) -> int:
+        return sum(content_tokens(m.get("content")) for m in messages)
+
+    def _retryable(self, e: Exception, failures: int) -> bool:
+        """连接错误、超时与 5xx 在 transport.max_retries 次以内重试"""
+        from openai import APIConnectionError, InternalServerError
+        return failures < self._max_retries and isinstance(e, (APIConnectionError, InternalServerError))
+
+    def _rate_limit_delay(self, e: 'RateLimitError', attempt: int) -> float:
+        """处理 429：计算退避时间并暂停共享配额，超出重试次数时抛出 RateLimitExceeded"""
+        response = getattr(e, "response", None)
+        retry_after = parse_retry_after(response.headers if response is not None else None)
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        if self._limiter:
+            # 共享的调度器会让其他会话一同暂停，下一轮 acquire 负责等待
+            self._limiter.penalize(delay)
+        if attempt >= MAX_RATE_LIMIT_RETRIES or (not self._limiter and delay > DEFAULT_MAX_WAIT):
+            raise RateLimitExceeded(f"Rate limited by {self.api_name} API: {str(e)}", retry_after=delay)
+        return delay
+
+    @property
+    def _async_client(self) -> 'AsyncOpenAI':
+        return self._api_manager.get_async_client(self.api_name)
+
+    def record_usage(self, completion_tokens: int):
+        """请求完成后补记输出 token，计入 TPM 配额"""
+        if self._limiter and completion_tokens:
+            self._limiter.record_usage(completion_tokens)
+
+@dataclass(frozen=True)
+class _ConfigSnapshot:
+    """一个版本的供应商配置，重新加载时整体替换，读取方不会看到新旧混合的状态"""
+    api_configs: Dict[str, APIConfig]
+    transports: Dict[str, TransportConfig]
+    pool_stats: Dict[str, PoolStats]
+    aliases: Dict
+    catalog: ModelCatalog
+    version: Tuple[int, int]
 
 class APIManager:
     def __init__(self, config_path: str = "config/api_config.yaml"):
         """初始化API管理器"""
-        self._api_configs = self._load_config(config_path)
+        self._config_path = config_path
+        self.discovery = ModelDiscovery.from_config(ConfigLoader.load_section('model_discovery', config_path))
+        self._discovery_check = 0.0
+        self._discovery_running = False
+        self._snapshot = self._load_snapshot()
         self._clients = {}
-    
-    def _load_config(self, config_path: str) -> dict[str, APIConfig]:
-        """加载API配置,进一步封装"""
-        config = ConfigLoader.load_config(config_path)
-        return {
-            name: APIConfig(**config[name])
-            for name in config
+        self._async_clients = {}
+        self._http_clients = {}
+        self._async_http_clients = {}
+        self._retired_clients: List[Tuple[float, object]] = []  # (替换时间, 待关闭的 HTTP 客户端)
+        self._client_lock = threading.Lock()
+        self._last_reload_check = time.monotonic()
+        self._failed_version = None
+        self.reload_error: Optional[str] = None  # 最近一次重新加载失败的原因
+        self.metrics = MetricsHub.from_env()
+        self.rate_limiter = RateLimiter()
+        self.router = ModelRouter()
+        self.router.aliases = self._snapshot.aliases
+        # 路由器根据每次请求的指标更新端点的 TTFT 与错误率
+        self.metrics.sinks.append(self.router)
+        self.response_cache = ResponseCache.from_config(ConfigLoader.load_section('response_cache', config_path))
+
+    @property
+    def _api_configs(self) -> Dict[str, APIConfig]:
+        return self._snapshot.api_configs
+
+    @property
+    def _transports(self) -> Dict[str, TransportConfig]:
+        return self._snapshot.transports
+
+    @property
+    def _pool_stats(self) -> Dict[str, PoolStats]:
+        return self._snapshot.pool_stats
+
+    @property
+    def catalog(self) -> ModelCatalog:
+        """预先计算的模型目录：干净的模型 id、显示名称与能力"""
+        return self._snapshot.catalog
+
+    def _load_snapshot(self, previous: Optional[_ConfigSnapshot] = None) -> _ConfigSnapshot:
+        """读取并完整校验配置文件，任何错误都会在替换前抛出"""
+        version = file_version(self._config_path)
+        config = ConfigLoader.load_config(self._config_path)
+        ConfigLoader.validate_config(config)
+        api_configs = {name: APIConfig(**config[name]) for name in config}
+        aliases = ModelRouter.parse_aliases(ConfigLoader.load_section('aliases', self._config_path))
+        for alias in aliases.values():
+            for endpoint in alias.endpoints:
+                if endpoint.api_name not in api_configs:
+                    raise ValueError(f"Unknown API {endpoint.api_name} in model alias {alias.name}")
+        # 未变化的供应商沿用原有的连接池统计
+        pool_stats = {
+            name: previous.pool_stats[name]
+            if previous and previous.api_configs.get(name) == api_config else PoolStats()
+            for name, api_config in api_configs.items()
         }
+        return _ConfigSnapshot(
+            api_configs=api_configs,
+            transports={name: TransportConfig.from_dict(c.transport) for name, c in api_configs.items()},
+            pool_stats=pool_stats,
+            aliases=aliases,
+            catalog=ModelCatalog.build(api_configs, aliases, ALIAS_API, self.discovery.models(api_configs)),
+            version=version
+        )
+
+    def reload(self) -> List[str]:
+        """
+        重新加载配置并原子替换，返回配置发生变化的供应商；
+        只替换变化供应商的客户端与配额调度器，进行中的流式请求继续使用旧客户端直到结束，之后旧连接池被关闭
+        """
+        previous = self._snapshot
+        snapshot = self._load_snapshot(previous)
+        changed = sorted(
+            name for name in set(previous.api_configs) | set(snapshot.api_configs)
+            if previous.api_configs.get(name) != snapshot.api_configs.get(name)
+        )
+        with self._client_lock:
+            self._snapshot = snapshot
+            self.router.aliases = snapshot.aliases
+            now = time.monotonic()
+            for name in changed:
+                for clients in (self._clients, self._async_clients):
+                    clients.pop(name, None)
+                for clients in (self._http_clients, self._async_http_clients):
+                    client = clients.pop(name, None)
+                    if client is not None:
+                        self._retired_clients.append((now, client))
+                self.rate_limiter.discard(name)
+        self.reload_error = None
+        return changed
+
+    def maybe_reload(self) -> Optional[List[str]]:
+        """
+        配置文件变化时重新加载（最多每 RELOAD_CHECK_INTERVAL 秒检查一次），返回变化的供应商；
+        新配置无效时保留当前配置继续服务，并记录在 reload_error
+        """
+        now = time.monotonic()
+        if now - self._last_reload_check < RELOAD_CHECK_INTERVAL:
+            return None
+        self._last_reload_check = now
+        self._close_retired_clients()
+        try:
+            version = file_version(self._config_path)
+        except OSError:
+            return None
+        if version in (self._snapshot.version, self._failed_version):
+            return None
+        try:
+            return self.reload()
+        except Exception as e:
+            self._failed_version = version
+            self.reload_error = f"{type(e).__name__}: {e}"
+            logger.warning("config reload failed, keeping current config",
+                           extra={"fields": {"path": self._config_path, "error": self.reload_error}})
+            return None
     
+    def _close_retired_clients(self):
+        """关闭重新加载时被替换、且已没有进行中请求（或超过宽限期）的 HTTP 客户端，释放其连接池"""
+        if not self._retired_clients:
+            return
+        now = time.monotonic()
+        with self._client_lock:
+            closing = [client for retired_at, client in self._retired_clients
+                       if now - retired_at >= RETIRED_CLIENT_GRACE or not client_busy(client)]
+            self._retired_clients = [item for item in self._retired_clients if item[1] not in closing]
+        for client in closing:
+            try:
+                if hasattr(client, "aclose"):
+                    # 异步客户端的连接属于后台事件循环，在其中关闭
+                    from modules.async_engine import run_in_background
+                    run_in_background(client.aclose())
+                else:
+                    client.close()
+            except Exception as e:
+                logger.warning("failed to close retired http client", extra={"fields": {"error": str(e)}})
+
+    def catalog_refresh_due(self) -> bool:
+        """是否有供应商的 /models 列表过期需要在后台刷新（最多每 RELOAD_CHECK_INTERVAL 秒检查一次）"""
+        now = time.monotonic()
+        if self._discovery_running or now - self._discovery_check < RELOAD_CHECK_INTERVAL:
+            return False
+        self._discovery_check = now
+        return bool(self.discovery.stale(self._api_configs))
+
+    async def async_refresh_catalog(self) -> List[str]:
+        """
+        并发拉取过期供应商的 /models，写入磁盘缓存后原子替换模型目录，返回刷新成功的供应商；
+        拉取失败的供应商继续使用缓存（或配置中）的模型列表
+        """
+        with self._client_lock:
+            if self._discovery_running:
+                return []
+            self._discovery_running = True
+        try:
+            names = self.discovery.stale(self._api_configs)
+            results = await asyncio.gather(*(self._fetch_models(name) for name in names))
+            refreshed = [name for name, ok in zip(names, results) if ok]
+            if refreshed:
+                with self._client_lock:
+                    snapshot = self._snapshot
+                    catalog = ModelCatalog.build(
+                        snapshot.api_configs, snapshot.aliases, ALIAS_API, self.discovery.models(snapshot.api_configs)
+                    )
+                    self._snapshot = replace(snapshot, catalog=catalog)
+                logger.info("model catalog refreshed", extra={"fields": {"providers": refreshed, "models": len(catalog)}})
+            return refreshed
+        finally:
+            self._discovery_running = False
+
+    async def _fetch_models(self, api_name: str) -> bool:
+        url = self._api_configs[api_name].url
+        try:
+            page = await self.get_async_client(api_name).models.list()
+            raw_models = [item.model_dump() if hasattr(item, "model_dump") else dict(item) for item in page.data]
+        except Exception as e:
+            self.discovery.mark_failed(api_name)
+            logger.warning("model discovery failed", extra={"fields": {"api": api_name, "error": f"{type(e).__name__}: {e}"}})
+            return False
+        self.discovery.update(api_name, url, raw_models)
+        return True
+
     def get_api_configs(self) -> Dict:
-        """获取所有API配置"""
-        return {
+        """获取所有API配置（配置了模型别名时，额外包含虚拟供应商 auto）"""
+        configs = {
             name: {
                 "url": config.url,
                 "key": config.key,
@@ -88,37 +399,217 @@ class APIManager:
             }
             for name, config in self._api_configs.items()
         }
+        if self.router.aliases:
+            configs[ALIAS_API] = {"url": None, "key": None, "model_list": list(self.router.aliases)}
+        return configs
     
     def get_available_models(self, api_name: str) -> List[str]:
-        """获取指定API支持的模型列表"""
-        if api_name not in self._api_configs:
-            raise ValueError(f"Unknown API: {api_name}")
-        return self._api_configs[api_name].model_list or []
+        """获取指定API支持的模型 id 列表（不含 # 后的显示名称）"""
+        return [info.model for info in self.catalog.models(api_name)]
     
-    @lru_cache(maxsize=None)
-    def get_client(self, api_name: str) -> Optional[OpenAI]:
-        """获取指定API的客户端实例"""
-        if api_name not in self._api_configs:
+    def get_transport(self, api_name: str) -> TransportConfig:
+        """指定供应商的 HTTP 连接与重试设置"""
+        if api_name not in self._transports:
             raise ValueError(f"Unknown API: {api_name}")
-            
-        if api_name not in self._clients:
-            config = self._api_configs[api_name]
-            self._clients[api_name] = OpenAI(
-                api_key=config.key,
-                base_url=config.url
-            )
+        return self._transports[api_name]
+
+    def get_client(self, api_name: str) -> 'OpenAI':
+        """获取指定API的客户端实例（进程内共享，复用连接池；SDK 自身不重试，聊天请求的重试由 ChatClient 执行）"""
+        with self._client_lock:
+            snapshot = self._snapshot
+            if api_name not in snapshot.api_configs:
+                raise ValueError(f"Unknown API: {api_name}")
+            if api_name not in self._clients:
+                config = snapshot.api_configs[api_name]
+                transport = snapshot.transports[api_name]
+                from openai import OpenAI
+                http_client = build_http_client(transport, snapshot.pool_stats[api_name])
+                self._http_clients[api_name] = http_client
+                self._clients[api_name] = OpenAI(
+                    api_key=config.key,
+                    base_url=config.url,
+                    # 聊天请求由 ChatClient 重试，SDK 不再重试
+                    max_retries=0,
+                    http_client=http_client
+                )
         
-        return self._clients[api_name]
+            return self._clients[api_name]
+
+    def get_async_client(self, api_name: str) -> 'AsyncOpenAI':
+        """获取指定API的异步客户端实例（供后台事件循环使用）"""
+        with self._client_lock:
+            snapshot = self._snapshot
+            if api_name not in snapshot.api_configs:
+                raise ValueError(f"Unknown API: {api_name}")
+            if api_name not in self._async_clients:
+                config = snapshot.api_configs[api_name]
+                transport = snapshot.transports[api_name]
+                from openai import AsyncOpenAI
+                http_client = build_async_http_client(transport, snapshot.pool_stats[api_name])
+                self._async_http_clients[api_name] = http_client
+                self._async_clients[api_name] = AsyncOpenAI(
+                    api_key=config.key,
+                    base_url=config.url,
+                    # 聊天请求由 ChatClient 重试，SDK 不再重试
+                    max_retries=0,
+                    http_client=http_client
+                )
+            return self._async_clients[api_name]
+
+    def warm_up(self) -> Dict[str, Optional[float]]:
+        """并发预热所有启用了 warm_up 的供应商连接，返回各供应商的握手耗时"""
+        names = [name for name, transport in self._transports.items() if transport.warm_up]
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            durations = executor.map(
+                lambda name: self._warm_up_sync(name), names
+            )
+            return dict(zip(names, durations))
+
+    async def async_warm_up(self) -> Dict[str, Optional[float]]:
+        """在事件循环中并发预热异步客户端的连接"""
+        names = [name for name, transport in self._transports.items() if transport.warm_up]
+        durations = await asyncio.gather(*(
+            self._warm_up_async(name) for name in names
+        ))
+        return dict(zip(names, durations))
+
+    def _warm_up_sync(self, api_name: str) -> Optional[float]:
+        self.get_client(api_name)
+        return warm_up(self._http_clients[api_name], self._api_configs[api_name].url)
+
+    async def _warm_up_async(self, api_name: str) -> Optional[float]:
+        self.get_async_client(api_name)
+        return await async_warm_up(self._async_http_clients[api_name], self._api_configs[api_name].url)
+
+    def get_pool_stats(self) -> Dict[str, Dict]:
+        """各供应商连接池的使用统计"""
+        result = {}
+        for name, stats in self._pool_stats.items():
+            entry = {"requests": stats.requests, "in_flight": stats.in_flight, "errors": stats.errors}
+            for client, prefix in ((self._http_clients.get(name), "sync"), (self._async_http_clients.get(name), "async")):
+                if client is not None:
+                    entry.update({f"{prefix}_{k}": v for k, v in pool_connections(client).items()})
+            result[name] = entry
+        return result
     
+    def get_context_window(self, api_name: str, model: str) -> int:
+        """获取指定模型的上下文长度（模型别名取各端点中的最小值）"""
+        if api_name == ALIAS_API:
+            return min(self.get_context_window(e.api_name, e.model) for e in self.router.aliases[model].endpoints)
+        if api_name not in self._api_configs:
+            raise ValueError(f"Unknown API: {api_name}")
+        info = self.catalog.get(api_name, model)
+        if info is not None and info.context_window:
+            return info.context_window
+        return self._api_configs[api_name].context_window or DEFAULT_CONTEXT_WINDOW
+
+    def get_context_budget(self, api_name: str, model: str) -> int:
+        """获取指定模型可用于上下文的 token 预算（扣除输出预留并受 max_prompt_tokens 限制）"""
+        if api_name == ALIAS_API:
+            return min(self.get_context_budget(e.api_name, e.model) for e in self.router.aliases[model].endpoints)
+        config = self._api_configs[api_name]
+        reserve = config.output_reserve if config.output_reserve is not None else DEFAULT_OUTPUT_RESERVE
+        budget = self.get_context_window(api_name, model) - reserve
+        if config.max_prompt_tokens:
+            budget = min(budget, config.max_prompt_tokens)
+        return max(budget, 1)
+
+    def supports_stream_usage(self, api_name: str) -> bool:
+        """指定API是否支持在流式响应末尾返回 token 用量"""
+        return bool(self._api_configs[api_name].stream_usage)
+
+    def get_think_tags(self, api_name: str) -> Optional[List[List[str]]]:
+        """获取指定API内联推理内容的标签对，未配置时返回 None（使用默认标签）"""
+        return self._api_configs[api_name].think_tags
+
+    def get_image_policy(self, api_name: str, model: str) -> Optional[ImagePolicy]:
+        """获取指定模型的图片输入限制，模型不支持图片时返回 None；模型别名需所有端点都支持"""
+        if api_name == ALIAS_API:
+            policies = [self.get_image_policy(e.api_name, e.model) for e in self.router.aliases[model].endpoints]
+            if not policies or None in policies:
+                return None
+            return ImagePolicy.strictest(policies)
+        info = self.catalog.get(api_name, model)
+        if info is None or not info.vision:
+            return None
+        config = self._api_configs[api_name]
+        settings = dict(config.image or {})
+        settings.update((config.model_image or {}).get(model) or {})
+        return ImagePolicy.from_dict(settings)
+
+    def get_rate_limits(self, api_name: str, model: str) -> Dict:
+        """获取指定模型的配额，模型级配置覆盖供应商级配置"""
+        config = self._api_configs[api_name]
+        limits = dict(config.rate_limits or {})
+        limits.update((config.model_rate_limits or {}).get(model) or {})
+        return limits
+
+    def get_rate_limiter(self, api_name: str, model: str):
+        """获取进程内共享的配额调度器，未配置配额时返回 None"""
+        return self.rate_limiter.get(api_name, model, self.get_rate_limits(api_name, model))
+
     def validate_model(self, api_name: str, model: str) -> bool:
-        """验证模型是否支持"""
-        available_models = self.get_available_models(api_name)
-        return model in available_models
+        """验证模型是否支持（包括模型别名），直接查目录索引"""
+        return self.catalog.accepts(api_name, model)
 
     def create_chat_client(self, api_name: str, model: str) -> 'ChatClient':
         """创建特定API和模型的聊天客户端"""
         return ChatClient(api_name, model, self)
 
+    @staticmethod
+    def _log_call(endpoint: Endpoint, messages: List[Dict]):
+        """记录一次供应商调用（只记录上下文的条数、长度与哈希）"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("provider call", extra={"fields": {"endpoint": str(endpoint), **describe_messages(messages)}})
+
+    def open_stream(self, api_name: str, model: str, messages: List[Dict]):
+        """
+        发起流式聊天补全，返回 (实际使用的客户端, 响应流)；
+        api_name 为 auto 时按模型别名路由到最快的健康端点
+        """
+        def start(endpoint: Endpoint):
+            client = clients[endpoint] = self.create_chat_client(endpoint.api_name, endpoint.model)
+            self._log_call(endpoint, messages)
+            kwargs = {}
+            if self.supports_stream_usage(endpoint.api_name):
+                kwargs["stream_options"] = {"include_usage": True}
+            return client.chat_completion(messages, stream=True, **kwargs)
+
+        clients = {}
+        if api_name != ALIAS_API:
+            endpoint = Endpoint(api_name, model)
+            stream = start(endpoint)
+            return clients[endpoint], stream
+        endpoint, stream = self.router.open_stream(model, start)
+        return clients[endpoint], stream
+
+    async def open_async_stream(self, api_name: str, model: str, messages: List[Dict]):
+        """
+        异步发起流式聊天补全，返回 (实际使用的客户端, 异步响应流)；
+        模型别名按路由排序依次尝试端点（异步路径不做对冲请求）
+        """
+        if api_name == ALIAS_API:
+            endpoints = self.router.rank(model)
+        else:
+            endpoints = [Endpoint(api_name, model)]
+        errors = []
+        for endpoint in endpoints:
+            client = self.create_chat_client(endpoint.api_name, endpoint.model)
+            self._log_call(endpoint, messages)
+            kwargs = {}
+            if self.supports_stream_usage(endpoint.api_name):
+                kwargs["stream_options"] = {"include_usage": True}
+            try:
+                return client, await client.async_chat_completion(messages, stream=True, **kwargs)
+            except Exception as e:
+                if len(endpoints) == 1:
+                    raise
+                errors.append(f"{endpoint}: {e}")
+                self.router.observe(endpoint, None, False)
+        raise Exception(f"All endpoints failed for model alias {model}: " + "; ".join(errors))
+
 if __name__ == "__main__":
     api_manager = APIManager()
     chat_client = api_manager.create_chat_client("deepseek", "deepseek-chat")
@@ -0,0 +1,319 @@
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import queue
+import threading
+import time
+import uuid
+
+from modules.chat_engine import ChatEngine, Message, ResponseCollector
+from modules.log import get_request_id, new_request_id, set_request_id
+from modules.response_cache import replay_chunks
+from modules.think_parser import ThinkStreamParser
+
+_DONE = object()
+# 已结束但无人取回的生成在登记表中保留的时间（秒）
+DETACHED_TTL = 3600
+
+
+class _LoopThread:
+    """进程内共享的后台事件循环，所有会话的异步生成都在其中运行"""
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="chat-engine-loop", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def get(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance.loop
+
+
+def run_in_background(coro):
+    """在共享的后台事件循环中运行协程，返回 concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, _LoopThread.get())
+
+
+class GenerationHandle:
+    """
+    一次进行中的生成：在后台事件循环中运行，与脚本运行相互独立，可随时取消
+
+    分块按序号追加到缓冲区，脚本重新运行或连接断开后可从上次读到的序号继续读取，
+    不会丢失已生成的内容；取消会立即中止后台任务并关闭上游连接，已收到的内容可通过 partial_message() 取回
+    """
+    def __init__(self, sink: Optional[queue.Queue] = None, tag=None):
+        """
+        sink: 多路生成共享的分块队列，分块以 (tag, 分块) 的形式写入，此时句柄本身不可迭代
+        """
+        self.collector = ResponseCollector()
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self.chunks: List[dict] = []  # 按序号保存的全部分块
+        self.finished_at: Optional[float] = None
+        self.request_id: Optional[str] = None  # 日志与指标记录中关联本次生成的 id
+        self._sink = sink
+        self._tag = tag
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._done = threading.Event()
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def result(self) -> Optional[Message]:
+        """生成正常结束后的最终消息"""
+        return self.collector.message
+
+    def _emit(self, item):
+        with self._cond:
+            self.chunks.append(item)
+            self._cond.notify_all()
+        if self._sink is not None:
+            self._sink.put((self._tag, item))
+
+    def follow(self, offset: int = 0, heartbeat: Optional[float] = None) -> Iterator[Tuple[int, Optional[dict]]]:
+        """
+        从序号 offset 开始依次产出 (序号, 分块)，直到生成结束；生成出错时在最后抛出
+        heartbeat: 设置后，超过该秒数没有新分块时产出 (offset, None)，调用方借此在等待首个分块期间
+        响应停止按钮与重新运行
+        """
+        if self._sink is not None:
+            raise TypeError("Handle writes to a shared queue, iterate the GenerationGroup instead")
+        while True:
+            with self._cond:
+                while offset >= len(self.chunks) and not self.done:
+                    if not self._cond.wait(heartbeat):
+                        break
+                pending = self.chunks[offset:]
+                finished = self.done
+            if not pending and not finished:
+                yield offset, None
+                continue
+            for chunk in pending:
+                yield offset, chunk
+                offset += 1
+            if finished:
+                break
+        if self.error is not None:
+            raise self.error
+
+    def __iter__(self):
+        for _, chunk in self.follow():
+            yield chunk
+
+    def _launch(self, coro):
+        """在共享的后台事件循环中创建任务；任务完全结束（包括被取消后的清理）时才标记生成结束"""
+        self._loop = _LoopThread.get()
+
+        def create():
+            self._task = self._loop.create_task(coro)
+            self._task.add_done_callback(self._finalize)
+            if self.cancelled:
+                self._task.cancel()
+
+        self._loop.call_soon_threadsafe(create)
+
+    def _cancel_task(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def cancel(self):
+        """停止生成并关闭上游连接；wait() 在后台任务清理完毕后返回，此后部分答案不再变化"""
+        if self.done:
+            return
+        self.cancelled = True
+        if self._loop is not None:
+            # 与创建任务的回调按顺序在事件循环中执行，不会早于任务创建
+            self._loop.call_soon_threadsafe(self._cancel_task)
+
+    def _finalize(self, *args):
+        """标记生成结束并唤醒读取方（由后台任务的完成回调调用，只生效一次）"""
+        with self._cond:
+            if self.done:
+                return
+            self.finished_at = time.monotonic()
+            # 在推理阶段被取消或出错时，已收到的部分答案也要带上思考用时
+            self.collector.stop()
+            self._done.set()
+            self._cond.notify_all()
+        if self._sink is not None:
+            self._sink.put((self._tag, _DONE))
+
+    def partial_message(self) -> Optional[Message]:
+        """取消后已收到的部分答案，没有内容时返回 None"""
+        content = self.collector.result()
+        if not content["content"] and not content["reasoning"]:
+            return None
+        return Message(role="assistant", content=content)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+
+class GenerationRegistry:
+    """
+    进程内所有会话的后台生成，按 id 登记
+
+    脚本运行被中断（重新运行、刷新页面、连接断开）时生成继续进行，会话凭 id 重新接上并从上次的序号继续；
+    结束后超过 ttl 秒仍无人取回的生成会被清理
+    """
+    def __init__(self, ttl: float = DETACHED_TTL):
+        self.ttl = ttl
+        self._handles: Dict[str, GenerationHandle] = {}
+        self._lock = threading.Lock()
+
+    def add(self, handle: GenerationHandle) -> str:
+        generation_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._handles[generation_id] = handle
+        return generation_id
+
+    def get(self, generation_id: Optional[str]) -> Optional[GenerationHandle]:
+        with self._lock:
+            self._expire()
+            return self._handles.get(generation_id)
+
+    def release(self, generation_id: str):
+        """结果已被会话取回，不再保留"""
+        with self._lock:
+            self._handles.pop(generation_id, None)
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl
+        for generation_id in [
+            gid for gid, handle in self._handles.items()
+            if handle.finished_at is not None and handle.finished_at < deadline
+        ]:
+            del self._handles[generation_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._handles)
+
+
+class GenerationGroup:
+    """
+    并发进行的多路生成（对比模式）：各路分块写入同一队列，按到达顺序迭代，
+    总等待时间取决于最慢的一路而不是各路之和；某一路出错不影响其他路
+    """
+    def __init__(self, count: int):
+        self._queue: queue.Queue = queue.Queue()
+        self.handles = [GenerationHandle(self._queue, tag=i) for i in range(count)]
+
+    def __iter__(self) -> Iterator[Tuple[int, dict]]:
+        """依次产出 (序号, 分块)；某一路结束时产出 (序号, None)"""
+        remaining = len(self.handles)
+        while remaining:
+            index, item = self._queue.get()
+            if item is _DONE:
+                remaining -= 1
+                yield index, None
+                continue
+            yield index, item
+
+    @property
+    def done(self) -> bool:
+        return all(handle.done for handle in self.handles)
+
+    def cancel(self):
+        for handle in self.handles:
+            handle.cancel()
+
+
+class AsyncChatEngine(ChatEngine):
+    """基于 AsyncOpenAI 的聊天引擎：异步迭代分块，支持随时取消正在进行的生成"""
+
+    async def astream_response(self, messages: List[Message], rag_context: Optional[str] = None,
+                               use_cache: bool = True,
+                               collector: Optional[ResponseCollector] = None) -> AsyncIterator[dict]:
+        """
+        异步获取AI响应，分块格式与 get_response 相同；
+        结束后最终消息保存在 collector.message
+        """
+        collector = collector or ResponseCollector()
+        # 检索可能包含磁盘读取与向量请求，放到线程中执行以免阻塞事件循环
+        rag_context = await asyncio.to_thread(self._retrieve, messages, rag_context)
+        # 构建上下文可能需要解码/压缩图片并读取外置存储，同样放到线程中，避免阻塞其他会话的流式输出
+        context = await asyncio.to_thread(self._build_context, messages, rag_context)
+
+        cache, key, cached = self._cache_lookup(context, use_cache)
+        if cached is not None:
+            for chunk in replay_chunks(cached):
+                collector.add(chunk["type"], chunk["content"])
+                yield chunk
+            collector.message = Message(role="assistant", content=cached)
+            return
+
+        metrics = self.api_manager.metrics.start(self.current_api, self.current_model)
+        metrics.retrieval = self.last_context_stats.get("retrieval")
+        try:
+            client, response = await self.api_manager.open_async_stream(self.current_api, self.current_model, context)
+        except Exception as e:
+            self.api_manager.metrics.emit(metrics.finish(e))
+            raise
+        metrics.api_name, metrics.model = client.api_name, client.model
+
+        parser = ThinkStreamParser(self.api_manager.get_think_tags(client.api_name))
+        try:
+            async for chunk in response:
+                for segment in self._chunk_segments(chunk, parser, metrics):
+                    yield collector.add(*segment)
+            for segment in parser.flush():
+                metrics.on_text(*segment)
+                yield collector.add(*segment)
+        except asyncio.CancelledError:
+            # 用户主动取消不计为端点错误
+            record = metrics.finish()
+            record["cancelled"] = True
+            self.api_manager.metrics.emit(record)
+            raise
+        except Exception as e:
+            self.api_manager.metrics.emit(metrics.finish(e))
+            raise
+        finally:
+            # 正常结束或被取消都立即关闭上游连接
+            await response.close()
+        self._finish(client, metrics, collector, cache, key)
+
+    def start(self, messages: List[Message], rag_context: Optional[str] = None,
+              use_cache: bool = True, handle: Optional[GenerationHandle] = None) -> GenerationHandle:
+        """在后台事件循环中开始生成，返回可迭代、可取消的句柄"""
+        handle = handle or GenerationHandle()
+        handle.request_id = get_request_id() or new_request_id()
+        # 取快照，避免后台任务与脚本线程同时读写会话历史；生成不依赖发起它的脚本运行，中断后可重新接上
+        history = list(messages)
+
+        async def run():
+            set_request_id(handle.request_id)
+            try:
+                async for chunk in self.astream_response(history, rag_context, use_cache, handle.collector):
+                    handle._emit(chunk)
+            except asyncio.CancelledError:
+                handle.cancelled = True
+            except Exception as e:
+                handle.error = e
+
+        handle._launch(run())
+        return handle
+
+
+def start_group(api_manager, targets: List[Tuple[str, str]], messages: List[Message],
+                rag_context: Optional[str] = None, use_cache: bool = True,
+                retriever=None, system_prompt: Optional[str] = None) -> Tuple[GenerationGroup, List[AsyncChatEngine]]:
+    """向多个 (供应商, 模型) 同时发送同一轮对话，返回生成组与各路引擎（用于读取各路指标）"""
+    group = GenerationGroup(len(targets))
+    engines = []
+    for (api_name, model), handle in zip(targets, group.handles):
+        engine = AsyncChatEngine(api_manager, retriever, system_prompt)
+        engine.set_model(api_name, model)
+        engine.start(messages, rag_context, use_cache, handle=handle)
+        engines.append(engine)
+    return group, engines
@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class ModelInfo:
+    """模型目录中的一个模型"""
+    api_name: str
+    model: str  # 请求时使用的模型 id
+    display_name: str
+    vision: bool = False
+    reasoning: bool = False  # 输出推理内容（reasoning_content 或内联推理标签）
+    context_window: Optional[int] = None
+    discovered: bool = False  # 来自供应商 /models，而不是配置中的 model_list
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.api_name, self.model
+
+    @property
+    def label(self) -> str:
+        return f"{self.api_name} / {self.display_name}"
+
+
+def parse_model_entry(entry: str) -> Tuple[str, str]:
+    """解析 model_list 中的条目，"模型id#显示名称" 形式的注释作为显示名称"""
+    model, _, name = entry.partition('#')
+    model = model.strip()
+    return model, name.strip() or model
+
+
+class ModelCatalog:
+    """
+    不可变的模型目录：配置加载时一次性预先计算各供应商的模型 id、显示名称与能力，
+    界面渲染与模型校验直接查表，不再在每次运行脚本时解析配置
+    """
+    def __init__(self, models: List[ModelInfo], open_providers: Iterable[str] = ()):
+        """open_providers: 接受目录之外模型 id 的供应商（如需要用户自建接入点的火山引擎）"""
+        providers: Dict[str, List[ModelInfo]] = {}
+        for info in models:
+            providers.setdefault(info.api_name, []).append(info)
+        self._providers = MappingProxyType({name: tuple(infos) for name, infos in providers.items()})
+        self._index = MappingProxyType({info.key: info for info in models})
+        self._open_providers = frozenset(open_providers)
+
+    @classmethod
+    def build(cls, api_configs: Mapping, aliases: Mapping, alias_api: str,
+              discovered: Optional[Mapping[str, List[Dict]]] = None) -> 'ModelCatalog':
+        """
+        根据 APIConfig、模型别名与 /models 发现的模型构建目录：
+        发现的信息默认只用于补全 model_list 中模型的能力，context_windows / vision_models / reasoning_models
+        覆盖发现的能力；供应商设置 list_discovered 时，未列出的对话模型追加在 model_list 之后
+        """
+        discovered = discovered or {}
+        models = []
+        for api_name, config in api_configs.items():
+            vision = set(config.vision_models or [])
+            reasoning = set(config.reasoning_models or [])
+            windows = config.context_windows or {}
+            found = {entry["id"]: entry for entry in discovered.get(api_name, ())}
+            entries = [parse_model_entry(entry) for entry in config.model_list or []]
+            listed = {model for model, _ in entries}
+            if config.list_discovered:
+                entries += [(model, model) for model, meta in found.items() if model not in listed and meta.get("chat")]
+            for model, name in entries:
+                meta = found.get(model, {})
+                models.append(ModelInfo(
+                    api_name, model, name,
+                    vision=model in vision or bool(meta.get("vision")),
+                    reasoning=model in reasoning or bool(meta.get("reasoning")),
+                    context_window=windows.get(model) or meta.get("context_window") or config.context_window,
+                    discovered=model not in listed
+                ))
+        for alias in aliases:
+            models.append(ModelInfo(alias_api, alias, alias))
+        open_providers = [name for name, config in api_configs.items() if config.allow_unlisted]
+        return cls(models, open_providers)
+
+    @property
+    def providers(self) -> Tuple[str, ...]:
+        return tuple(self._providers)
+
+    def models(self, api_name: str) -> Tuple[ModelInfo, ...]:
+        if api_name not in self._providers:
+            raise ValueError(f"Unknown API: {api_name}")
+        return self._providers[api_name]
+
+    def get(self, api_name: str, model: str) -> Optional[ModelInfo]:
+        return self._index.get((api_name, model))
+
+    def accepts(self, api_name: str, model: str) -> bool:
+        """模型是否可用于请求：在目录中，或所属供应商接受目录之外的模型 id"""
+        return (api_name, model) in self._index or api_name in self._open_providers
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[ModelInfo]:
+        return iter(self._index.values())
+
+    def __len__(self) -> int:
+        return len(self._index)
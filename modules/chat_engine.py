@@ -1,28 +1,246 @@
-from dataclasses import dataclass
-from typing import List, Generator, Union, Optional
+from typing import Dict, List, Generator, Union, Optional, Tuple
+import logging
+import sys
 import time
+from modules.context_builder import MESSAGE_OVERHEAD_TOKENS, ContextBuilder, estimate_tokens, message_text
+from modules.response_cache import cache_key, replay_chunks
+from modules.spill_store import SpilledFile, SpillRef, SpillStore
+from modules.think_parser import ThinkStreamParser
+
+logger = logging.getLogger(__name__)
+
+
+class Reply:
+    """助手回答：正文、推理内容与推理耗时；较长的推理内容可移到 SpillStore，只保留引用"""
+    __slots__ = ("content", "_reasoning", "elapsed")
+
+    def __init__(self, content: str = "", reasoning: Union[str, SpillRef] = "", elapsed: Optional[int] = None):
+        self.content = content
+        self._reasoning = reasoning
+        self.elapsed = elapsed
+
+    @classmethod
+    def from_dict(cls, content: Dict) -> 'Reply':
+        return cls(content.get("content", ""), content.get("reasoning", ""), content.get("elapsed"))
+
+    @property
+    def reasoning(self) -> str:
+        if isinstance(self._reasoning, SpillRef):
+            return self._reasoning.text()
+        return self._reasoning
+
+    @property
+    def reasoning_spilled(self) -> bool:
+        return isinstance(self._reasoning, SpillRef)
+
+    def to_dict(self) -> Dict:
+        return {"content": self.content, "reasoning": self.reasoning, "elapsed": self.elapsed}
+
+    def spilled(self, store: SpillStore) -> 'Reply':
+        """推理内容超过外置阈值时返回推理内容移到 store 的新对象，否则返回自身"""
+        if isinstance(self._reasoning, str) and len(self._reasoning) >= store.threshold:
+            return Reply(self.content, store.put_text(self._reasoning), self.elapsed)
+        return self
+
+    def _key(self) -> tuple:
+        # 已外置的推理内容按引用比较，不需要读回磁盘
+        return (self.content, self._reasoning, self.elapsed)
+
+    def __eq__(self, other):
+        return isinstance(other, Reply) and (
+            self._key() == other._key()
+            or (self.content, self.elapsed) == (other.content, other.elapsed) and self.reasoning == other.reasoning
+        )
+
+    def __hash__(self):
+        return hash((self.content, self.elapsed))
+
+    def __repr__(self):
+        return f"Reply(content={self.content!r}, reasoning={self._reasoning!r}, elapsed={self.elapsed!r})"
+
 
-@dataclass
 class Message:
-    role: str
-    content: Union[dict,str]
-    files : Optional[object] = None
-    timestamp: float = None
+    """
+    一条对话消息：用户消息的 content 为字符串，助手消息为 Reply（传入字典时自动转换）
+
+    使用 __slots__ 且角色字符串驻留，每条消息只占少量固定内存；
+    较长的推理内容与上传的图片可通过 spill() 移到外置存储
+    """
+    __slots__ = ("role", "_content", "files", "timestamp", "tokens", "seq", "images")
+
+    def __init__(self, role: str, content: Union[str, Reply, Dict], files: Optional[list] = None,
+                 timestamp: Optional[float] = None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.files = files
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.tokens: Optional[int] = None  # token 数缓存，由 ContextBuilder 计算
+        self.seq: Optional[int] = None  # 在持久化会话中的序号
+        self.images: Optional[dict] = None  # 按图片限制缓存的处理结果
+
+    @property
+    def content(self) -> Union[str, Reply]:
+        return self._content
+
+    @content.setter
+    def content(self, value: Union[str, Reply, Dict]):
+        self._content = Reply.from_dict(value) if isinstance(value, dict) else value
+
+    @property
+    def text(self) -> str:
+        """发送给模型的正文（不含推理内容）"""
+        if isinstance(self._content, Reply):
+            return self._content.content
+        return self._content or ""
+
+    def spill(self, store: Optional[SpillStore]) -> 'Message':
+        """将较长的推理内容与上传的图片移到外置存储，消息只保留引用"""
+        if store is None:
+            return self
+        if isinstance(self._content, Reply):
+            self._content = self._content.spilled(store)
+        if self.files:
+            self.files = [
+                SpilledFile(getattr(f, "name", ""), getattr(f, "type", None), store.put(f.getvalue()))
+                if hasattr(f, "getvalue") and not isinstance(f, SpilledFile) else f
+                for f in self.files
+            ]
+            # 处理结果可由外置的原图重新生成，下次使用时写入外置存储
+            self.images = None
+        return self
+
+    def memory_usage(self) -> Tuple[int, int]:
+        """估算 (常驻内存字节数, 外置存储字节数)"""
+        resident = sys.getsizeof(self)
+        spilled = 0
+        content = self._content
+        if isinstance(content, Reply):
+            resident += sys.getsizeof(content) + sys.getsizeof(content.content)
+            if isinstance(content._reasoning, SpillRef):
+                spilled += content._reasoning.size
+            else:
+                resident += sys.getsizeof(content._reasoning)
+        else:
+            resident += sys.getsizeof(content)
+        for f in self.files or ():
+            if isinstance(f, SpilledFile):
+                spilled += f.size
+            else:
+                resident += getattr(f, "size", 0) or 0
+        for prepared in (self.images or {}).values():
+            for image in prepared:
+                if isinstance(image.data, SpillRef):
+                    spilled += image.data.size
+                else:
+                    resident += len(image.data)
+        return resident, spilled
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return ((self.role, self._content, self.files, self.timestamp)
+                == (other.role, other._content, other.files, other.timestamp))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f"Message(role={self.role!r}, content={self._content!r}, "
+                f"files={self.files!r}, timestamp={self.timestamp!r})")
+
+
+def memory_report(messages: List[Message], render_cache: Optional[Dict] = None) -> Dict[str, int]:
+    """单个会话的内存占用：消息常驻与外置字节数，以及渲染缓存的 HTML 字节数"""
+    resident = spilled = 0
+    for message in messages:
+        message_resident, message_spilled = message.memory_usage()
+        resident += message_resident
+        spilled += message_spilled
+    return {
+        "messages": len(messages),
+        "resident_bytes": resident,
+        "spilled_bytes": spilled,
+        "render_cache_bytes": sum(sys.getsizeof(value) for value in (render_cache or {}).values()),
+    }
+
+class ResponseCollector:
+    """累积推理/正文片段，生成 get_response 约定格式的分块，并给出最终答案"""
+    def __init__(self):
+        self._content: List[str] = []
+        self._reasoning: List[str] = []
+        self.elapsed = 0
+        self._reasoning_start = None
+        self._recorded = False
+        self.message: Optional[Message] = None  # 流正常结束后的最终消息
+
+    def add(self, chunk_type: str, text: str) -> dict:
+        """记录一个片段，返回对应的流式分块"""
+        if chunk_type == "reasoning":
+            if self._reasoning_start is None:
+                self.elapsed = -1
+                self._reasoning_start = time.time()
+            self._reasoning.append(text)
+            return {"type": "reasoning", "content": text}
+        self._content.append(text)
+        if self._reasoning_start is not None:
+            self.stop()
+            return {"type": "content", "content": text, "elapsed": self.elapsed}
+        return {"type": "content", "content": text}
+
+    def stop(self):
+        """推理阶段结束（开始输出正文、流结束或被取消）时记录思考用时，只记录一次"""
+        if self._reasoning_start is not None and not self._recorded:
+            self.elapsed = round(time.time() - self._reasoning_start)
+            self._recorded = True
+
+    def result(self) -> dict:
+        """当前已收到的答案 {"content", "reasoning", "elapsed"}"""
+        return {
+            "content": "".join(self._content),
+            "reasoning": "".join(self._reasoning),
+            "elapsed": self.elapsed
+        }
+
+    def finish(self) -> Message:
+        self.stop()
+        self.message = Message(role="assistant", content=self.result())
+        return self.message
+
+# 检索到的参考资料附在本轮提问之前时使用的说明
+REFERENCE_TEMPLATE = "以下是从本地知识库检索到的参考资料，请结合它们回答后面的问题；如果资料与问题无关，请忽略。\n\n{reference}\n\n问题："
+
+
+def with_reference(message: Dict, reference: str) -> Dict:
+    """返回在正文前附上参考资料的新用户消息（不修改传入的消息），带图片的消息在首个文本片段前插入"""
+    prefix = REFERENCE_TEMPLATE.format(reference=reference)
+    content = message["content"]
+    if isinstance(content, str):
+        content = prefix + content
+    else:
+        content = [{"type": "text", "text": prefix}] + list(content)
+    return {**message, "content": content}
 
-    def __post_init__(self):
-        if self.timestamp is None:
-            self.timestamp = time.time()
 
 class ChatEngine:
-    def __init__(self, api_manager):
+    def __init__(self, api_manager, retriever=None, system_prompt: Optional[str] = None):
+        """
+        retriever: 本地文档索引（如 RAGIndex），设置后自动为每轮提问检索参考资料
+        system_prompt: 固定位于上下文最前面的系统提示
+        """
         self.api_manager = api_manager
+        self.retriever = retriever
+        self.system_prompt = system_prompt
         self.current_api = None
         self.current_model = None
         self.messages: List[Message] = []
+        self.last_context_stats = {}
+        self.last_metrics = None
+        self._context_anchor = None  # 上一轮上下文保留的第一条消息，用于保持前缀稳定
+        # 本会话的供应商前缀缓存统计（提示 token 总数与命中缓存的 token 数）
+        self.prefix_cache = {"prompt_tokens": 0, "cached_tokens": 0}
     
     def set_model(self, api_name: str, model: str):
         """设置当前使用的API和模型"""
-        if not self.api_manager.validate_model(api_name, model) and api_name != "volcengine":
+        if not self.api_manager.validate_model(api_name, model):
             raise ValueError(f"Invalid model {model} for API {api_name}")
         
         self.current_api = api_name
@@ -32,97 +250,134 @@ class ChatEngine:
         """清空聊天历史"""
         self.messages = []
         
-    def get_response(self, messages: List[Message], rag_context: Optional[str] = None) -> Generator[str, None, Message]:
-        """获取AI响应"""
+    @staticmethod
+    def _chunk_segments(chunk, parser: ThinkStreamParser, metrics) -> List[tuple]:
+        """将一个响应分块拆分为 (reasoning|content, 文本) 片段，兼容 reasoning_content 字段与内联推理标签"""
+        # 开启 include_usage 时，最后一个分块只携带用量，choices 为空
+        if getattr(chunk, "usage", None) is not None:
+            metrics.on_usage(chunk.usage)
+        if not chunk.choices:
+            return []
+        metrics.on_chunk()
+        delta = chunk.choices[0].delta
+        segments = []
+        reasoning_content = getattr(delta, "reasoning_content", None)
+        if reasoning_content:
+            segments.append(("reasoning", reasoning_content))
+        segments.extend(parser.feed(getattr(delta, "content", None)))
+        for segment in segments:
+            metrics.on_text(*segment)
+        return segments
+
+    def _retrieve(self, messages: List[Message], rag_context: Optional[str] = None) -> Optional[str]:
+        """未显式传入 rag_context 时，用最后一条用户消息检索本地文档；检索耗时单独记录，不计入生成延迟"""
+        self.last_context_stats = {}
+        if rag_context is not None or self.retriever is None or not messages or messages[-1].role != "user":
+            return rag_context
+        start = time.perf_counter()
+        rag_context = self.retriever.build_context(message_text(messages[-1]))
+        self.last_context_stats["retrieval"] = time.perf_counter() - start
+        return rag_context
+
+    def _build_context(self, messages: List[Message], rag_context: Optional[str] = None) -> List[dict]:
+        """按模型上下文预算准备发送给模型的消息列表"""
         if not self.current_api or not self.current_model:
             raise ValueError("API and model must be set before chat")
             
-        # 准备消息历史，确保content是字符串
-        # 无论是否有推理内容，只将正文内容放入消息历史中
-        context = []
-        for msg in messages:
-            if isinstance(msg.content, dict):
-                context.append({"role": msg.role, "content": msg.content["content"]})
-            else:
-                context.append({"role": msg.role, "content": msg.content})
-        
-        # # 如果有RAG上下文，添加系统提示
-        # if rag_context and rag_context.strip():
-        #     # 添加系统消息，引导模型使用检索到的文档内容
-        #     system_message = {
-        #         "role": "system", 
-        #         "content": f"你是一个能够参考文档的助手。请使用以下检索到的信息帮助回答用户的问题。如果信息不相关，请忽略它。\n\n{rag_context}"
-        #     }
-            
-        #     # 如果已有系统消息，就替换；如果没有，就添加
-        #     has_system = False
-        #     for i, msg in enumerate(context):
-        #         if msg["role"] == "system":
-        #             context[i] = system_message
-        #             has_system = True
-        #             break
-            
-        #     if not has_system:
-        #         context.insert(0, system_message)
-        
-        # 获取chat client
-        client = self.api_manager.create_chat_client(
-            self.current_api, 
-            self.current_model
+        # 按模型上下文预算准备消息历史，确保content是字符串
+        # 无论是否有推理内容，只将正文内容放入消息历史中；超出预算的早期对话压缩为摘要
+        # 沿用上一轮的截断位置，使 [系统提示, 摘要, 历史...] 前缀逐轮只追加，命中供应商的前缀缓存
+        budget = self.api_manager.get_context_budget(self.current_api, self.current_model)
+        rag_tokens = estimate_tokens(rag_context) + MESSAGE_OVERHEAD_TOKENS if rag_context else 0
+        builder = ContextBuilder(
+            budget,
+            image_policy=self.api_manager.get_image_policy(self.current_api, self.current_model),
+            system_prompt=self.system_prompt
         )
+        context = builder.build(messages, self._context_anchor, rag_tokens)
+        self._context_anchor = builder.anchor
+        self.last_context_stats.update({
+            "budget": budget,
+            "prompt_tokens": builder.prompt_tokens + rag_tokens,
+            "dropped": builder.dropped
+        })
         
-        # 获取响应
-        print("上下文：")
-        print(context)
-        response = client.chat_completion(context, stream=True)
+        # 如果有RAG上下文，附在本轮提问之前，引导模型使用检索到的文档内容；
+        # 参考资料每轮都不同，放在最后一条用户消息中，不在历史中间插入系统消息，也不破坏前面的稳定前缀
+        if rag_context and rag_context.strip() and context and context[-1]["role"] == "user":
+            context[-1] = with_reference(context[-1], rag_context)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("context built", extra={"fields": {
+                "api": self.current_api, "model": self.current_model, "history": len(messages),
+                "context_messages": len(context), **self.last_context_stats
+            }})
+        return context
+
+    @property
+    def prefix_cache_hit_rate(self) -> Optional[float]:
+        """本会话提示 token 中命中供应商前缀缓存的比例，供应商未返回缓存用量时为 None"""
+        total = self.prefix_cache["prompt_tokens"]
+        return self.prefix_cache["cached_tokens"] / total if total else None
+
+    def _cache_lookup(self, context: List[dict], use_cache: bool):
+        """查找响应缓存，返回 (缓存, 缓存键, 命中的答案)"""
+        cache = self.api_manager.response_cache if use_cache else None
+        key = cache_key(self.current_api, self.current_model, context) if cache else None
+        cached = cache.get(key) if cache else None
+        self.last_context_stats["cache_hit"] = cached is not None
+        return cache, key, cached
+
+    def get_response(self, messages: List[Message], rag_context: Optional[str] = None,
+                     use_cache: bool = True) -> Generator[str, None, Message]:
+        """获取AI响应（启用响应缓存时，相同请求直接回放缓存的答案）"""
+        rag_context = self._retrieve(messages, rag_context)
+        context = self._build_context(messages, rag_context)
         
-        # 收集完整响应
-        full_response = ""
-        reasoning = ""
+        # 命中响应缓存时以模拟流回放，调用方无需区分
+        cache, key, cached = self._cache_lookup(context, use_cache)
+        if cached is not None:
+            yield from replay_chunks(cached)
+            return Message(role="assistant", content=cached)
         
-        # 处理响应流
-        reasoning_elapsed = 0
-        recorder = False
-        on_reasoning = None
-        for chunk in response:
-            if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content is not None:
-                if not reasoning_elapsed:
-                    reasoning_elapsed = -1
-                    reasoning_start = time.time()
-                reasoning += chunk.choices[0].delta.reasoning_content
-                yield {"type": "reasoning", "content": chunk.choices[0].delta.reasoning_content}
-            elif hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content and "<think>" in chunk.choices[0].delta.content:
-                if not on_reasoning:
-                    on_reasoning = True
-                if not reasoning_elapsed:
-                    reasoning_elapsed = -1
-                    reasoning_start = time.time()
-            else:
-                if on_reasoning:
-                    if chunk.choices[0].delta.content == "</think>":
-                        on_reasoning = False
-                        continue
-                    reasoning += chunk.choices[0].delta.content
-                    yield {"type": "reasoning", "content": chunk.choices[0].delta.content}
-                else:
-                    full_response += chunk.choices[0].delta.content if chunk.choices[0].delta.content else ""
-                    if reasoning_elapsed:
-                        if not recorder:
-                            reasoning_elapsed = round(time.time() - reasoning_start)
-                            recorder = True
-                        yield {"type": "content", "content": chunk.choices[0].delta.content,"elapsed":reasoning_elapsed}
-                    else:
-                        yield {"type": "content", "content": chunk.choices[0].delta.content}
+        # 获取响应（模型别名会路由到最快的健康端点）
+        metrics = self.api_manager.metrics.start(self.current_api, self.current_model)
+        metrics.retrieval = self.last_context_stats.get("retrieval")
+        try:
+            client, response = self.api_manager.open_stream(self.current_api, self.current_model, context)
+        except Exception as e:
+            self.api_manager.metrics.emit(metrics.finish(e))
+            raise
+        metrics.api_name, metrics.model = client.api_name, client.model
+        
+        # 处理响应流，收集完整响应
+        collector = ResponseCollector()
+        parser = ThinkStreamParser(self.api_manager.get_think_tags(client.api_name))
+        try:
+            for chunk in response:
+                for segment in self._chunk_segments(chunk, parser, metrics):
+                    yield collector.add(*segment)
+            for segment in parser.flush():
+                metrics.on_text(*segment)
+                yield collector.add(*segment)
+        except Exception as e:
+            self.api_manager.metrics.emit(metrics.finish(e))
+            raise
+        self._finish(client, metrics, collector, cache, key)
         
         # 添加助手响应到历史
-        return Message(
-            role="assistant", 
-            content={
-                "content":full_response,
-                "reasoning":reasoning,
-                "elapsed":reasoning_elapsed
-                }
-            )
+        return collector.message
+
+    def _finish(self, client, metrics, collector: ResponseCollector, cache, key):
+        """流正常结束：上报指标、补记配额用量、写入响应缓存并生成最终消息"""
+        self.last_metrics = metrics.finish()
+        self.api_manager.metrics.emit(self.last_metrics)
+        if self.last_metrics["cached_tokens"] is not None:
+            self.prefix_cache["prompt_tokens"] += self.last_metrics["prompt_tokens"] or 0
+            self.prefix_cache["cached_tokens"] += self.last_metrics["cached_tokens"]
+        client.record_usage(self.last_metrics["completion_tokens"])
+        message = collector.finish()
+        if cache and message.content.content:
+            cache.set(key, message.content.to_dict())
     
 if __name__ == "__main__":
     from api_manager import APIManager
@@ -0,0 +1,172 @@
+from typing import Callable, Dict, List, Optional, Union
+import re
+
+from modules.image_pipeline import DEFAULT_IMAGE_TOKENS, ImagePolicy, message_images
+
+# 未配置上下文长度时使用的默认值
+DEFAULT_CONTEXT_WINDOW = 32000
+# 为模型输出预留的 token 数
+DEFAULT_OUTPUT_RESERVE = 4096
+# 滚动摘要最多占用预算的比例
+SUMMARY_BUDGET_RATIO = 0.15
+# 每条被压缩的消息在摘要中保留的最大字符数
+SUMMARY_EXCERPT_CHARS = 200
+# 超出预算重新截断时，保留的历史压缩到可用预算的比例（为后续轮次留出只追加的空间）
+COMPACT_RATIO = 0.7
+# 每条消息的固定开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_PATTERN = re.compile('[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_text(message) -> str:
+    """取出发送给模型的消息正文（推理内容不进入上下文）"""
+    return message.text
+
+
+def content_tokens(content: Union[str, List[Dict], None]) -> int:
+    """估算 OpenAI 格式消息 content 的 token 数（字符串或多模态分段列表）"""
+    if isinstance(content, list):
+        return sum(
+            estimate_tokens(part.get("text", "")) if part.get("type") == "text" else DEFAULT_IMAGE_TOKENS
+            for part in content
+        )
+    return estimate_tokens(str(content or ""))
+
+
+def message_tokens(message) -> int:
+    """获取消息的 token 数，计算结果缓存在 Message.tokens 上"""
+    if message.tokens is None:
+        message.tokens = estimate_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+    return message.tokens
+
+
+def excerpt_summarizer(messages: List) -> str:
+    """默认摘要器：截取每条被压缩消息的开头，不额外调用模型"""
+    lines = []
+    for msg in messages:
+        text = " ".join(message_text(msg).split())
+        if len(text) > SUMMARY_EXCERPT_CHARS:
+            text = text[:SUMMARY_EXCERPT_CHARS] + "…"
+        lines.append(f"{msg.role}: {text}")
+    return "\n".join(lines)
+
+
+class ContextBuilder:
+    """
+    按 token 预算组装上下文：保留最近的对话，更早的对话压缩为滚动摘要
+
+    为了命中供应商的前缀缓存，上下文按 [系统提示, 滚动摘要, 历史..., 当前提问] 排列，
+    并在多轮之间沿用同一个截断位置（锚点），使前缀逐轮只追加不改写；
+    只有超出预算时才重新截断，且一次压缩到预算的 COMPACT_RATIO，留出后续若干轮的追加空间
+    """
+    def __init__(self, budget: int, summarizer: Optional[Callable[[List], str]] = excerpt_summarizer,
+                 image_policy: Optional[ImagePolicy] = None, system_prompt: Optional[str] = None):
+        """
+        budget: 上下文可用的 token 预算
+        summarizer: 将被移出上下文的消息压缩为摘要文本的函数，None 表示直接丢弃
+        image_policy: 模型支持图片输入时的图片限制，None 表示只发送文本
+        system_prompt: 固定位于上下文最前面的系统提示
+        """
+        self.budget = budget
+        self.summarizer = summarizer
+        self.image_policy = image_policy
+        self.system_prompt = system_prompt
+        self.dropped = 0
+        self.prompt_tokens = 0
+        self.anchor = None  # 本次保留的第一条消息，下一轮传回 build 以沿用截断位置
+
+    def build(self, messages: List, anchor=None, extra_tokens: int = 0) -> List[Dict]:
+        """
+        组装 OpenAI 格式的消息列表
+        anchor: 上一轮的 self.anchor，仍在预算内时沿用该截断位置
+        extra_tokens: 本轮额外插入在稳定前缀之后的内容（如检索到的参考资料）占用的 token 数
+        """
+        system_tokens = estimate_tokens(self.system_prompt) + MESSAGE_OVERHEAD_TOKENS if self.system_prompt else 0
+        # 摘要预算固定为总预算的一定比例，使同一批被压缩的消息总是得到相同的摘要文本
+        summary_limit = int(self.budget * SUMMARY_BUDGET_RATIO) if self.summarizer is not None else 0
+        full = self.budget - system_tokens - extra_tokens
+        compacted = full - summary_limit
+
+        suffix = self._suffix_tokens(messages)
+        start = next((i for i, msg in enumerate(messages) if msg is anchor), None) if anchor is not None else None
+        if start is None or suffix[start] > (full if start == 0 else compacted):
+            start = 0 if suffix[0] <= full else self._cut(messages, suffix, int(compacted * COMPACT_RATIO))
+
+        kept = messages[start:]
+        dropped = messages[:start]
+        used = system_tokens + suffix[start] if messages else system_tokens
+        context = [{"role": msg.role, "content": self._content(msg)} for msg in kept]
+
+        if dropped and self.summarizer is not None:
+            summary = self._summary_message(dropped, summary_limit)
+            if summary is not None:
+                context.insert(0, summary)
+                used += estimate_tokens(summary["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if self.system_prompt:
+            context.insert(0, {"role": "system", "content": self.system_prompt})
+
+        self.anchor = kept[0] if kept else None
+        self.dropped = len(dropped)
+        self.prompt_tokens = used
+        return context
+
+    def _suffix_tokens(self, messages: List) -> List[int]:
+        """suffix[i] 为 messages[i:] 的 token 总数"""
+        suffix = [0] * (len(messages) + 1)
+        for i in range(len(messages) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + self._tokens(messages[i])
+        return suffix
+
+    @staticmethod
+    def _cut(messages: List, suffix: List[int], target: int) -> int:
+        """重新截断：保留不超过 target 的最近消息，返回保留部分的起始下标"""
+        # 最后一条（当前提问）无论多长都必须保留
+        start = len(messages) - 1
+        while start > 0 and suffix[start - 1] <= target:
+            start -= 1
+        # 保证历史从用户消息开始，避免以孤立的助手回复开头
+        while start < len(messages) - 1 and messages[start].role == "assistant":
+            start += 1
+        return start
+
+    def _tokens(self, msg) -> int:
+        tokens = message_tokens(msg)
+        if self.image_policy is not None and msg.files:
+            tokens += sum(image.tokens for image in message_images(msg, self.image_policy))
+        return tokens
+
+    def _content(self, msg) -> Union[str, List[Dict]]:
+        """消息正文；附带图片且模型支持时生成 text + image_url 分段"""
+        text = message_text(msg)
+        if self.image_policy is None or not msg.files:
+            return text
+        images = message_images(msg, self.image_policy)
+        if not images:
+            return text
+        parts = [{"type": "text", "text": text}] if text else []
+        parts.extend(image.content_part(self.image_policy.detail) for image in images)
+        return parts
+
+    def _summary_message(self, dropped: List, summary_limit: int) -> Optional[Dict]:
+        """生成滚动摘要系统消息，超出摘要预算时从最早的内容开始截断"""
+        limit = summary_limit - MESSAGE_OVERHEAD_TOKENS
+        if limit <= 0:
+            return None
+        summary = self.summarizer(dropped)
+        while summary and estimate_tokens(summary) > limit:
+            summary = summary[len(summary) // 4:]
+        if not summary:
+            return None
+        return {
+            "role": "system",
+            "content": f"以下是更早对话的摘要，供参考：\n{summary}"
+        }
@@ -0,0 +1,152 @@
+from typing import Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from modules.chat_engine import Message
+
+# 每次从存储中加载的历史消息条数
+DEFAULT_PAGE_SIZE = 20
+# 会话标题的最大长度
+TITLE_MAX_CHARS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    api TEXT,
+    model TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    is_json INTEGER NOT NULL,
+    files TEXT,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+);
+"""
+
+
+def _file_names(files) -> Optional[List[str]]:
+    """上传文件对象无法持久化，只保存文件名"""
+    if not files:
+        return None
+    return [getattr(f, "name", str(f)) for f in files]
+
+
+class ConversationStore:
+    """基于 SQLite（WAL 模式）的会话存储：消息定稿后追加写入，历史按页懒加载，可被多个进程共享"""
+    def __init__(self, path: str = "data/conversations.sqlite"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['ConversationStore']:
+        """根据 conversation_store 配置段创建存储，enabled 为 false 时返回 None"""
+        config = config or {}
+        if not config.get("enabled", True):
+            return None
+        return cls(config.get("path", "data/conversations.sqlite"))
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接（Streamlit 会话运行在不同线程中）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_conversation(self, title: str, api: Optional[str] = None, model: Optional[str] = None) -> str:
+        """新建会话，返回会话 id"""
+        conversation_id = uuid.uuid4().hex
+        title = " ".join(title.split())[:TITLE_MAX_CHARS] or "新对话"
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO conversations (id, title, api, model, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation_id, title, api, model, now, now)
+        )
+        return conversation_id
+
+    def append_message(self, conversation_id: str, message: Message) -> int:
+        """追加一条已定稿的消息，返回其在会话中的序号"""
+        is_json = not isinstance(message.content, str)
+        content = json.dumps(message.content.to_dict(), ensure_ascii=False) if is_json else message.content
+        files = _file_names(message.files)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO messages (conversation_id, seq, role, content, is_json, files, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, seq, message.role, content, int(is_json),
+                 json.dumps(files, ensure_ascii=False) if files else None, message.timestamp)
+            )
+            conn.execute("UPDATE conversations SET updated = ? WHERE id = ?", (time.time(), conversation_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        message.seq = seq
+        return seq
+
+    def list_conversations(self, limit: int = 50) -> List[Dict]:
+        """按最近更新时间列出会话"""
+        rows = self._conn().execute(
+            "SELECT id, title, api, model, created, updated FROM conversations ORDER BY updated DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        keys = ("id", "title", "api", "model", "created", "updated")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def load_messages(self, conversation_id: str, before_seq: Optional[int] = None,
+                      limit: int = DEFAULT_PAGE_SIZE) -> List[Message]:
+        """加载 before_seq 之前最近的 limit 条消息（按时间正序），before_seq 为 None 时加载最新一页"""
+        if before_seq is None:
+            before_seq = 1 << 62
+        rows = self._conn().execute(
+            "SELECT seq, role, content, is_json, files, timestamp FROM messages "
+            "WHERE conversation_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (conversation_id, before_seq, limit)
+        ).fetchall()
+        messages = []
+        for seq, role, content, is_json, files, timestamp in reversed(rows):
+            message = Message(
+                role=role,
+                content=json.loads(content) if is_json else content,
+                files=json.loads(files) if files else None,
+                timestamp=timestamp
+            )
+            message.seq = seq
+            messages.append(message)
+        return messages
+
+    def count_messages(self, conversation_id: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()[0]
+
+    def delete_conversation(self, conversation_id: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        conn.execute("COMMIT")
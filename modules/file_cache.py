@@ -0,0 +1,30 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+import os
+import threading
+
+_cache: Dict[Tuple[str, Optional[Callable]], Tuple[int, int, Any]] = {}
+_lock = threading.Lock()
+
+
+def read_cached(path: str, parse: Optional[Callable[[str], Any]] = None) -> Any:
+    """
+    读取文本文件并缓存解析结果，文件修改时间或大小变化时自动重新读取；
+    解析结果在调用方之间共享，调用方不应修改它；parse 按函数对象区分缓存，应传入模块级函数
+    """
+    stat = os.stat(path)
+    key = (path, parse)
+    entry = _cache.get(key)
+    if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+        return entry[2]
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    value = parse(text) if parse is not None else text
+    with _lock:
+        _cache[key] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+def file_version(path: str) -> Tuple[int, int]:
+    """文件的 (修改时间, 大小)，用于判断文件是否变化"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,187 @@
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List, Optional, Union
+import base64
+import io
+import logging
+import math
+
+from modules.spill_store import SpilledFile, SpillRef
+
+# Pillow 为可选依赖，首次处理图片时才导入：未安装时图片原样发送（仍受字节上限约束）
+Image = ImageOps = None
+_pillow_checked = False
+
+logger = logging.getLogger(__name__)
+
+# 未知尺寸图片的 token 估算值（约等于 1024x1024 高清图）
+DEFAULT_IMAGE_TOKENS = 765
+# 逐步降低 JPEG 质量时的下限，再低则改为缩小尺寸
+MIN_JPEG_QUALITY = 50
+# 质量降到下限仍超出字节上限时，每次缩小的比例
+SHRINK_RATIO = 0.75
+
+_EXIF_ORIENTATION = 0x0112
+
+
+@dataclass(frozen=True)
+class ImagePolicy:
+    """单个模型的图片输入限制"""
+    max_side: int = 1024  # 长边最大像素
+    max_bytes: int = 1_000_000  # 编码后最大字节数
+    quality: int = 85  # JPEG 初始压缩质量
+    detail: str = "auto"  # image_url.detail
+
+    @classmethod
+    def from_dict(cls, config: Optional[Dict]) -> 'ImagePolicy':
+        config = config or {}
+        names = {f.name for f in fields(cls)}
+        unknown = set(config) - names
+        if unknown:
+            raise ValueError(f"Unknown image settings: {', '.join(sorted(unknown))}")
+        return cls(**config)
+
+    @classmethod
+    def strictest(cls, policies: List['ImagePolicy']) -> 'ImagePolicy':
+        """合并多个端点的限制，取每项最严格的值"""
+        return cls(
+            max_side=min(p.max_side for p in policies),
+            max_bytes=min(p.max_bytes for p in policies),
+            quality=min(p.quality for p in policies),
+            detail=policies[0].detail
+        )
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """处理后可直接发送的图片"""
+    mime: str
+    data: Union[str, SpillRef]  # base64 编码，原图已外置时同样写入外置存储
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+    @property
+    def encoded(self) -> str:
+        if isinstance(self.data, SpillRef):
+            return self.data.text()
+        return self.data
+
+    @property
+    def size(self) -> int:
+        length = self.data.size if isinstance(self.data, SpillRef) else len(self.data)
+        return length * 3 // 4
+
+    @property
+    def tokens(self) -> int:
+        """按 512 像素分块估算 token 数（OpenAI 高清模式计费方式）"""
+        if not self.width or not self.height:
+            return DEFAULT_IMAGE_TOKENS
+        tiles = math.ceil(self.width / 512) * math.ceil(self.height / 512)
+        return 85 + 170 * tiles
+
+    def content_part(self, detail: str = "auto") -> Dict:
+        return {
+            "type": "image_url",
+            "image_url": {"url": f"data:{self.mime};base64,{self.encoded}", "detail": detail}
+        }
+
+
+def _sniff_mime(data: bytes) -> Optional[str]:
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    return None
+
+
+def _encode(image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        image.save(buf, format="PNG", optimize=True)
+    else:
+        image.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def _import_pillow() -> bool:
+    global Image, ImageOps, _pillow_checked
+    if not _pillow_checked:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            pass
+        _pillow_checked = True
+    return Image is not None
+
+
+def prepare_image(data: bytes, policy: ImagePolicy) -> PreparedImage:
+    """解码上传的图片，缩放到长边上限并重新压缩到字节上限以内"""
+    if not _import_pillow():
+        mime = _sniff_mime(data)
+        if mime is None:
+            raise ValueError("Unsupported image format")
+        if len(data) > policy.max_bytes:
+            raise ValueError(f"Image is {len(data)} bytes, exceeds {policy.max_bytes} (install Pillow to downscale)")
+        return PreparedImage(mime, base64.b64encode(data).decode("ascii"))
+    try:
+        return _prepare_with_pillow(data, policy)
+    except Image.DecompressionBombError as e:
+        # 像素数超过 Pillow 的解压炸弹上限，与无法解码的图片同样处理
+        raise ValueError(f"Image is too large to decode: {e}") from e
+
+
+def _prepare_with_pillow(data: bytes, policy: ImagePolicy) -> PreparedImage:
+    image = Image.open(io.BytesIO(data))
+    fmt = image.format
+    rotated = image.getexif().get(_EXIF_ORIENTATION, 1) != 1
+    # 尺寸与字节都在限制内且无需旋转时原样发送，避免重复压缩损失画质
+    if (fmt in ("JPEG", "PNG") and not rotated and max(image.size) <= policy.max_side
+            and len(data) <= policy.max_bytes):
+        return PreparedImage(Image.MIME[fmt], base64.b64encode(data).decode("ascii"), *image.size)
+
+    # JPEG 可在解码时直接按 2 的幂缩小，大幅减少相机原图的解码开销
+    image.draft("RGB", (policy.max_side, policy.max_side))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    image.thumbnail((policy.max_side, policy.max_side), Image.LANCZOS)
+
+    out_format = "PNG" if has_alpha else "JPEG"
+    quality = policy.quality
+    while True:
+        encoded = _encode(image, out_format, quality)
+        if len(encoded) <= policy.max_bytes:
+            break
+        if out_format == "JPEG" and quality > MIN_JPEG_QUALITY:
+            quality = max(quality - 10, MIN_JPEG_QUALITY)
+            continue
+        width, height = image.size
+        if max(width, height) <= 64:
+            raise ValueError(f"Image cannot be compressed below {policy.max_bytes} bytes")
+        image = image.resize((max(int(width * SHRINK_RATIO), 1), max(int(height * SHRINK_RATIO), 1)), Image.LANCZOS)
+    return PreparedImage(Image.MIME[out_format], base64.b64encode(encoded).decode("ascii"), *image.size)
+
+
+def message_images(message, policy: ImagePolicy) -> List[PreparedImage]:
+    """
+    获取消息附带图片的处理结果，按限制缓存在 Message.images 上，重新运行脚本时不会重复解码；
+    从会话存储恢复的消息只保留了文件名，没有可发送的图片；原图已外置时处理结果也写入同一外置存储
+    """
+    if not message.files:
+        return []
+    if message.images is None:
+        message.images = {}
+    prepared = message.images.get(policy)
+    if prepared is None:
+        prepared = []
+        for file in message.files:
+            if not hasattr(file, "getvalue"):
+                continue
+            try:
+                image = prepare_image(file.getvalue(), policy)
+                if isinstance(file, SpilledFile):
+                    image = replace(image, data=file.store.put_text(image.data))
+                prepared.append(image)
+            except (OSError, ValueError) as e:
+                logger.warning("skipping image", extra={"fields": {"file": getattr(file, "name", ""), "error": str(e)}})
+        message.images[policy] = prepared
+    return prepared
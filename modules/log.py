@@ -0,0 +1,179 @@
+"""
+结构化日志：每条日志输出一行 JSON，带请求 id，经有界队列由后台线程写出，热路径上不做 I/O
+
+默认只记录消息的长度与哈希，不记录正文；通过环境变量配置：
+    AWESOMEAI_LOG_LEVEL    日志级别（默认 INFO）
+    AWESOMEAI_LOG_SAMPLE   INFO 及以下日志的采样率 0~1（默认 1），按请求 id 采样，同一请求的日志全部保留或全部丢弃
+    AWESOMEAI_LOG_FILE     写入的文件路径（默认 stderr）
+    AWESOMEAI_LOG_BODIES   设为 1 时额外记录消息正文（仅用于调试）
+"""
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterable, Optional
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+import zlib
+
+# 应用自身的日志器，第三方库（httpx、openai）的日志不受影响
+LOGGER_NAMES = ("modules", "app", "batch")
+# 待写出日志的队列长度，写出跟不上时丢弃新日志而不是阻塞调用方
+QUEUE_SIZE = 10000
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+_log_bodies = False
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str]):
+    """设置当前上下文（线程或异步任务）的请求 id，之后的日志与指标记录都会带上它"""
+    _request_id.set(request_id)
+
+
+def describe(text: Optional[str]) -> Dict:
+    """文本的长度与哈希（AWESOMEAI_LOG_BODIES=1 时附带正文）"""
+    text = text or ""
+    info = {"chars": len(text), "sha1": hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]}
+    if _log_bodies:
+        info["body"] = text
+    return info
+
+
+def describe_messages(messages: Iterable[Dict]) -> Dict:
+    """OpenAI 格式消息列表的条数、总长度与整体哈希"""
+    digest = hashlib.sha1()
+    count = chars = 0
+    bodies = []
+    for message in messages:
+        content = message["content"]
+        text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+        digest.update(message["role"].encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+        count += 1
+        chars += len(text)
+        if _log_bodies:
+            bodies.append({"role": message["role"], "content": text})
+    info = {"messages": count, "chars": chars, "sha1": digest.hexdigest()[:12]}
+    if _log_bodies:
+        info["body"] = bodies
+    return info
+
+
+class RequestIdFilter(logging.Filter):
+    """在日志记录上附加当前请求 id（在调用方线程执行，队列另一端的线程读不到上下文）"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """按比例采样 INFO 及以下的日志，WARNING 及以上总是保留"""
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random.random() < self.rate
+        return zlib.crc32(request_id.encode("utf-8")) / 0xFFFFFFFF < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志一行 JSON：时间、级别、日志器、消息、请求 id 与 extra={"fields": {...}} 中的字段"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # 经过 DroppingQueueHandler 的记录在入队时已将异常格式化为 exc_text
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """非阻塞的队列处理器：队列已满时丢弃日志并计数"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 格式化推迟到写出线程，这里只固定消息参数与异常信息
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: Optional[str] = None, sample_rate: Optional[float] = None,
+                  path: Optional[str] = None) -> QueueListener:
+    """配置应用日志（进程内只生效一次），参数缺省时读取环境变量"""
+    global _listener, _log_bodies
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        level = (level or os.getenv("AWESOMEAI_LOG_LEVEL") or "INFO").upper()
+        if sample_rate is None:
+            sample_rate = float(os.getenv("AWESOMEAI_LOG_SAMPLE", "1"))
+        path = path or os.getenv("AWESOMEAI_LOG_FILE")
+        _log_bodies = os.getenv("AWESOMEAI_LOG_BODIES") == "1"
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            output = logging.FileHandler(path, encoding="utf-8")
+        else:
+            output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JSONFormatter())
+
+        handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(SamplingFilter(sample_rate))
+        for name in LOGGER_NAMES:
+            logger = logging.getLogger(name)
+            logger.setLevel(level)
+            logger.addHandler(handler)
+            logger.propagate = False
+
+        _listener = QueueListener(handler.queue, output)
+        _listener.start()
+        # 退出时写完队列中剩余的日志
+        atexit.register(_listener.stop)
+        return _listener
+
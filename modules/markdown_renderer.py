@@ -0,0 +1,294 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import hashlib
+import html
+import re
+import threading
+
+# Pygments 为可选依赖，首次渲染代码块时才导入：未安装时代码块只转义不着色
+pygments = None
+_pygments_checked = False
+
+# 着色结果缓存的代码块数（进程内所有会话共享）
+HIGHLIGHT_CACHE_SIZE = 256
+
+# 输出中不能出现换行：Streamlit 按 Markdown 解析，空行会提前结束外层的 HTML 块
+_NEWLINE = "&#10;"
+
+_FENCE = re.compile(r"^\s*(```|~~~)\s*([\w+#.-]*)")
+_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_HR = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_UL = re.compile(r"^\s*[-*+]\s+(.*)$")
+_OL = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+_QUOTE = re.compile(r"^\s*>\s?(.*)$")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|(\s*:?-+:?\s*\|)+\s*$")
+
+_CODE_SPAN = re.compile(r"(`+)(.+?)\1")
+_INLINE_RULES = (
+    (re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*"), r"<strong>\1</strong>"),
+    (re.compile(r"(?<![\w*])\*(?=\S)(.+?)(?<=\S)\*(?![\w*])"), r"<em>\1</em>"),
+    (re.compile(r"~~(?=\S)(.+?)(?<=\S)~~"), r"<del>\1</del>"),
+    (re.compile(r"\[([^\]]+)\]\(((?:https?://|mailto:)[^\s)]+)\)"),
+     r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>'),
+)
+
+# 段落类分组的外层标签与行之间的分隔符
+_GROUPS = {
+    "p": ("<p>", "<br/>", "</p>"),
+    "quote": ("<blockquote>", "<br/>", "</blockquote>"),
+    "ul": ("<ul>", "", "</ul>"),
+    "ol": ("<ol>", "", "</ol>"),
+    "table": ("<table>", "", "</table>"),
+}
+
+_highlight_cache: "OrderedDict[str, str]" = OrderedDict()
+_highlight_lock = threading.Lock()
+_lexers = {}  # 语言名到 Pygments lexer 的缓存，None 表示不支持该语言
+
+
+def _import_pygments() -> bool:
+    global pygments, _pygments_checked
+    if not _pygments_checked:
+        try:
+            import pygments
+            import pygments.formatters
+            import pygments.lexers
+        except ImportError:
+            pass
+        _pygments_checked = True
+    return pygments is not None
+
+
+def render_inline(text: str) -> str:
+    """转义一行文本并转换行内格式（行内代码、粗体、斜体、删除线、链接）"""
+    parts = []
+    pos = 0
+    for match in _CODE_SPAN.finditer(text):
+        parts.append(_inline_text(text[pos:match.start()]))
+        parts.append(f"<code>{html.escape(match.group(2).strip())}</code>")
+        pos = match.end()
+    parts.append(_inline_text(text[pos:]))
+    return "".join(parts)
+
+
+def _inline_text(text: str) -> str:
+    text = html.escape(text)
+    for pattern, replacement in _INLINE_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def highlight_code(code: str, lang: str = "") -> str:
+    """代码块着色（需要 Pygments），结果按内容哈希缓存，同一代码块不会重复着色"""
+    key = hashlib.sha1(f"{lang}\0{code}".encode("utf-8")).hexdigest()
+    with _highlight_lock:
+        cached = _highlight_cache.get(key)
+        if cached is not None:
+            _highlight_cache.move_to_end(key)
+            return cached
+
+    lexer = _code_lexer(lang)
+    if lexer is not None:
+        body = pygments.highlight(code, lexer, pygments.formatters.HtmlFormatter(nowrap=True)).rstrip("\n")
+    else:
+        body = html.escape(code)
+    block = _code_block(body.replace("\n", _NEWLINE), lang)
+
+    with _highlight_lock:
+        _highlight_cache[key] = block
+        if len(_highlight_cache) > HIGHLIGHT_CACHE_SIZE:
+            _highlight_cache.popitem(last=False)
+    return block
+
+
+def _code_lexer(lang: str):
+    """代码块语言对应的 lexer，未安装 Pygments 或不支持该语言时返回 None"""
+    if not lang or not _import_pygments():
+        return None
+    if lang not in _lexers:
+        try:
+            _lexers[lang] = pygments.lexers.get_lexer_by_name(lang)
+        except pygments.util.ClassNotFound:
+            _lexers[lang] = None
+    return _lexers[lang]
+
+
+def _highlight_line(line: str, lexer) -> str:
+    """流式输出中未闭合代码块的单行着色（跨行的字符串、注释在代码块闭合后整体着色时才正确）"""
+    if lexer is None:
+        return html.escape(line)
+    body = pygments.highlight(line, lexer, pygments.formatters.HtmlFormatter(nowrap=True)).rstrip("\n")
+    return body.replace("\n", _NEWLINE)
+
+
+def _code_block(body: str, lang: str) -> str:
+    lang_class = f' class="language-{lang}"' if lang else ""
+    return f'<pre class="code-block"><code{lang_class}>{body}</code></pre>'
+
+
+def _table_row(line: str, header: bool = False) -> str:
+    cells = line.strip().strip("|").split("|")
+    tag = "th" if header else "td"
+    return "<tr>" + "".join(f"<{tag}>{render_inline(cell.strip())}</{tag}>" for cell in cells) + "</tr>"
+
+
+def _classify(line: str) -> Tuple[str, str]:
+    """判断一行的类型，返回 (类型, 去掉标记后的内容)"""
+    match = _HEADING.match(line)
+    if match:
+        return "h" + str(len(match.group(1))), match.group(2)
+    if _HR.match(line):
+        return "hr", ""
+    for kind, pattern in (("ul", _UL), ("ol", _OL), ("quote", _QUOTE)):
+        match = pattern.match(line)
+        if match:
+            return kind, match.group(1)
+    if _TABLE_ROW.match(line):
+        return "table", line
+    return "p", line
+
+
+class IncrementalMarkdown:
+    """
+    流式 Markdown 渲染器：每次只转义、转换新到达的文本
+
+    已完成的块（闭合的代码块、空行结束的段落、标题等）转换为 HTML 后冻结，之后不再处理；
+    未完成的块中已完整的行各只转换一次，每帧只重新转换最后一个不完整的行，处理开销与新增文本成正比。
+    未闭合的代码块中每个完整的行着色一次并拼接缓存，每帧只转义最后一个不完整的行；闭合时整体重新着色一次，结果按内容哈希缓存
+    """
+    def __init__(self):
+        self._consumed = 0  # 已处理的文本长度
+        self._frozen = ""  # 已冻结块的 HTML
+        self._partial = ""  # 最后一个不完整的行
+        # 当前未完成的分组：段落类为 (类型, 各行 HTML)；代码块为 ("code", 原始各行)，着色结果另存于 _code_html
+        self._kind: Optional[str] = None
+        self._items: List[str] = []
+        self._fence = ""
+        self._lang = ""
+        self._table_rows: List[str] = []  # 表格的原始行，用于在出现分隔行时把首行改为表头
+        self._code_html = ""  # 未闭合代码块中已完整各行着色后拼接的 HTML
+        self._lexer = None
+
+    def update(self, text: str) -> str:
+        """传入截至目前的完整文本（只会在末尾追加），返回当前的 HTML"""
+        if len(text) < self._consumed:
+            self.__init__()
+        self.feed(text[self._consumed:])
+        return self.html()
+
+    def feed(self, delta: str):
+        """追加新到达的文本"""
+        if not delta:
+            return
+        self._consumed += len(delta)
+        lines = (self._partial + delta).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._add_line(line)
+
+    def finish(self) -> str:
+        """文本结束：处理最后一行并冻结所有块，返回完整的 HTML"""
+        if self._partial:
+            self._add_line(self._partial)
+            self._partial = ""
+        self._close()
+        return self._frozen
+
+    def html(self) -> str:
+        return self._frozen + self._open_html()
+
+    def _add_line(self, line: str):
+        if self._kind == "code":
+            if line.strip().startswith(self._fence):
+                self._close()
+            else:
+                if self._items:
+                    self._code_html += _NEWLINE
+                self._code_html += _highlight_line(line, self._lexer)
+                self._items.append(line)
+            return
+        fence = _FENCE.match(line)
+        if fence:
+            self._close()
+            self._kind, self._items = "code", []
+            self._fence, self._lang = fence.group(1), fence.group(2)
+            self._lexer = _code_lexer(self._lang)
+            return
+        if not line.strip():
+            self._close()
+            return
+        kind, text = _classify(line)
+        if kind == "hr":
+            self._close()
+            self._frozen += "<hr/>"
+            return
+        if kind.startswith("h"):
+            self._close()
+            self._frozen += f"<{kind}>{render_inline(text)}</{kind}>"
+            return
+        if kind != self._kind:
+            self._close()
+            self._kind, self._items = kind, []
+        if kind == "table":
+            self._add_table_row(line)
+        else:
+            self._items.append(self._item_html(kind, text))
+
+    def _add_table_row(self, line: str):
+        if _TABLE_SEPARATOR.match(line):
+            if len(self._table_rows) == 1:
+                self._items[0] = _table_row(self._table_rows[0], header=True)
+            return
+        self._table_rows.append(line)
+        self._items.append(_table_row(line))
+
+    @staticmethod
+    def _item_html(kind: str, text: str) -> str:
+        if kind in ("ul", "ol"):
+            return f"<li>{render_inline(text)}</li>"
+        return render_inline(text)
+
+    def _close(self):
+        """冻结当前未完成的分组"""
+        if self._kind == "code":
+            self._frozen += highlight_code("\n".join(self._items), self._lang)
+        elif self._kind is not None:
+            self._frozen += self._group_html(self._kind, self._items)
+        self._kind, self._items = None, []
+        self._table_rows = []
+        self._code_html = ""
+
+    @staticmethod
+    def _group_html(kind: str, items: List[str]) -> str:
+        start, separator, end = _GROUPS[kind]
+        return start + separator.join(items) + end
+
+    def _open_html(self) -> str:
+        """未完成部分的 HTML：已完整的行使用转换好的结果，只转换最后一个不完整的行"""
+        partial = self._partial
+        if self._kind == "code":
+            body = self._code_html
+            if partial:
+                # 不完整的行每帧都在变化，只转义；整行到达后才着色并并入缓存
+                body += (_NEWLINE if self._items else "") + html.escape(partial)
+            return _code_block(body, self._lang)
+        if not partial.strip():
+            return self._group_html(self._kind, self._items) if self._kind else ""
+        kind, text = _classify(partial)
+        if kind == "table" and self._kind == "table" and not _TABLE_SEPARATOR.match(partial):
+            return self._group_html(kind, self._items + [_table_row(partial)])
+        if kind in ("hr", "table") or kind.startswith("h"):
+            # 这些行在完整之前按普通文本显示
+            kind, text = "p", partial
+        if kind == self._kind:
+            return self._group_html(kind, self._items + [self._item_html(kind, text)])
+        opened = self._group_html(self._kind, self._items) if self._kind else ""
+        return opened + self._group_html(kind, [self._item_html(kind, text)])
+
+
+def render_markdown(text: str) -> str:
+    """一次性渲染完整文本"""
+    renderer = IncrementalMarkdown()
+    renderer.feed(text)
+    return renderer.finish()
@@ -0,0 +1,303 @@
+from collections import deque, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from modules.context_builder import estimate_tokens
+from modules.log import get_request_id
+
+logger = logging.getLogger(__name__)
+
+# 每条请求完成时写入日志的指标字段
+LOG_FIELDS = ("api", "model", "ttft", "duration", "prompt_tokens", "completion_tokens", "cached_tokens",
+              "cancelled", "error")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """计算分位数（最近秩法），空列表返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _usage_field(usage, name: str):
+    """读取用量字段，兼容 SDK 对象与字典"""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get(name)
+    value = getattr(usage, name, None)
+    if value is None:
+        # 供应商扩展字段保存在 SDK 对象的 model_extra 中
+        value = (getattr(usage, "model_extra", None) or {}).get(name)
+    return value
+
+
+class RequestMetrics:
+    """单次流式请求的延迟统计"""
+    def __init__(self, api_name: str, model: str):
+        self.api_name = api_name
+        self.model = model
+        self.request_id = get_request_id()  # 发起本次请求的界面轮次/批量条目
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._last_chunk = None
+        self.first_reasoning = None
+        self.first_content = None
+        self.chunks = 0
+        self.gaps: List[float] = []
+        self.output_chars = 0
+        self.estimated_tokens = 0
+        self.usage: Dict[str, int] = {}
+        self.retrieval: Optional[float] = None  # 本地文档检索耗时，在请求开始前完成，不计入首字延迟
+
+    def on_chunk(self, kind: Optional[str] = None, text: Optional[str] = None):
+        """记录一个流式分块（用于分块数与分块间隔），可同时记录其文本"""
+        now = time.perf_counter()
+        if self._last_chunk is not None:
+            self.gaps.append(now - self._last_chunk)
+        self._last_chunk = now
+        self.chunks += 1
+        if kind is not None:
+            self.on_text(kind, text)
+
+    def on_text(self, kind: str, text: Optional[str]):
+        """记录分块中的文本，kind 为 reasoning 或 content"""
+        if not text:
+            return
+        now = time.perf_counter()
+        if kind == "reasoning" and self.first_reasoning is None:
+            self.first_reasoning = now - self._start
+        elif kind == "content" and self.first_content is None:
+            self.first_content = now - self._start
+        self.output_chars += len(text)
+        self.estimated_tokens += estimate_tokens(text)
+
+    def on_usage(self, usage):
+        """记录流中返回的 token 用量（需供应商支持 stream_options.include_usage），包括前缀缓存命中的提示 token 数"""
+        if usage is None:
+            return
+        for name in ("prompt_tokens", "completion_tokens", "total_tokens",
+                     "prompt_cache_hit_tokens", "prompt_cache_miss_tokens"):
+            value = _usage_field(usage, name)
+            if value is not None:
+                self.usage[name] = value
+        # OpenAI 兼容格式：prompt_tokens_details.cached_tokens
+        cached = _usage_field(_usage_field(usage, "prompt_tokens_details"), "cached_tokens")
+        if cached is not None:
+            self.usage["cached_tokens"] = cached
+
+    @property
+    def cached_tokens(self) -> Optional[int]:
+        """命中供应商前缀缓存的提示 token 数，供应商未返回时为 None"""
+        if "prompt_cache_hit_tokens" in self.usage:
+            # DeepSeek：prompt_cache_hit_tokens / prompt_cache_miss_tokens
+            return self.usage["prompt_cache_hit_tokens"]
+        return self.usage.get("cached_tokens")
+
+    def finish(self, error: Optional[BaseException] = None) -> Dict:
+        """结束统计，返回可序列化的指标记录"""
+        duration = time.perf_counter() - self._start
+        completion_tokens = self.usage.get("completion_tokens", self.estimated_tokens)
+        first_token = min((t for t in (self.first_reasoning, self.first_content) if t is not None), default=None)
+        generation_time = duration - first_token if first_token is not None else None
+        return {
+            "request_id": self.request_id,
+            "api": self.api_name,
+            "model": self.model,
+            "started_at": self.started_at,
+            "ttft_reasoning": self.first_reasoning,
+            "ttft_content": self.first_content,
+            "ttft": first_token,
+            "duration": duration,
+            "chunks": self.chunks,
+            "output_chars": self.output_chars,
+            "completion_tokens": completion_tokens,
+            "prompt_tokens": self.usage.get("prompt_tokens"),
+            "cached_tokens": self.cached_tokens,
+            "usage_reported": "completion_tokens" in self.usage,
+            "tokens_per_sec": completion_tokens / generation_time if generation_time else None,
+            "gap_p50": percentile(self.gaps, 50),
+            "gap_p99": percentile(self.gaps, 99),
+            "retrieval": self.retrieval,
+            "error": f"{type(error).__name__}: {error}" if error else None
+        }
+
+
+class MemorySink:
+    """内存环形缓冲区，保存最近的请求记录"""
+    def __init__(self, capacity: int = 1000):
+        self.records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict):
+        with self._lock:
+            self.records.append(record)
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return list(self.records)
+
+
+class JSONLSink:
+    """将每条请求记录追加写入 JSONL 文件"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def emit(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class PrometheusSink:
+    """按供应商/模型聚合计数，输出 Prometheus 文本格式，可选启动 /metrics HTTP 端点"""
+    def __init__(self, port: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(lambda: defaultdict(float))
+        self._server = None
+        if port:
+            self.serve(port)
+
+    def emit(self, record: Dict):
+        key = (record["api"], record["model"])
+        with self._lock:
+            totals = self._totals[key]
+            totals["requests"] += 1
+            totals["errors"] += 1 if record["error"] else 0
+            totals["duration"] += record["duration"]
+            totals["chunks"] += record["chunks"]
+            totals["completion_tokens"] += record["completion_tokens"] or 0
+            totals["prompt_tokens"] += record["prompt_tokens"] or 0
+            totals["cached_tokens"] += record.get("cached_tokens") or 0
+            if record["ttft"] is not None:
+                totals["ttft"] += record["ttft"]
+                totals["ttft_count"] += 1
+            if record.get("retrieval") is not None:
+                totals["retrieval"] += record["retrieval"]
+                totals["retrieval_count"] += 1
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式的指标"""
+        metrics = [
+            ("awesomeai_requests_total", "counter", "requests"),
+            ("awesomeai_request_errors_total", "counter", "errors"),
+            ("awesomeai_request_duration_seconds_sum", "counter", "duration"),
+            ("awesomeai_stream_chunks_total", "counter", "chunks"),
+            ("awesomeai_completion_tokens_total", "counter", "completion_tokens"),
+            ("awesomeai_prompt_tokens_total", "counter", "prompt_tokens"),
+            ("awesomeai_cached_prompt_tokens_total", "counter", "cached_tokens"),
+            ("awesomeai_ttft_seconds_sum", "counter", "ttft"),
+            ("awesomeai_ttft_seconds_count", "counter", "ttft_count"),
+            ("awesomeai_retrieval_seconds_sum", "counter", "retrieval"),
+            ("awesomeai_retrieval_seconds_count", "counter", "retrieval_count"),
+        ]
+        with self._lock:
+            items = [(key, dict(totals)) for key, totals in self._totals.items()]
+        lines = []
+        for name, kind, field in metrics:
+            lines.append(f"# TYPE {name} {kind}")
+            for (api_name, model), totals in items:
+                labels = f'api="{api_name}",model="{model}"'
+                lines.append(f"{name}{{{labels}}} {totals.get(field, 0):g}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """在后台线程中启动 /metrics 端点"""
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+
+def _log_fields(record: Dict) -> Dict:
+    """指标记录中写入日志的字段（请求 id 由日志层附加）"""
+    return {name: record.get(name) for name in LOG_FIELDS}
+
+
+class MetricsHub:
+    """指标分发中心：将请求记录发送到所有 sink，并提供按供应商/模型的汇总"""
+    def __init__(self, sinks: Optional[list] = None, capacity: int = 1000):
+        self.memory = MemorySink(capacity)
+        self.sinks = [self.memory] + list(sinks or [])
+
+    @classmethod
+    def from_env(cls) -> 'MetricsHub':
+        """根据环境变量创建：AWESOMEAI_METRICS_JSONL 指定 JSONL 路径，AWESOMEAI_METRICS_PORT 指定 /metrics 端口"""
+        sinks = []
+        jsonl_path = os.getenv("AWESOMEAI_METRICS_JSONL")
+        if jsonl_path:
+            sinks.append(JSONLSink(jsonl_path))
+        port = os.getenv("AWESOMEAI_METRICS_PORT")
+        if port:
+            sinks.append(PrometheusSink(int(port)))
+        return cls(sinks)
+
+    def start(self, api_name: str, model: str) -> RequestMetrics:
+        return RequestMetrics(api_name, model)
+
+    def emit(self, record: Dict):
+        if record["error"]:
+            logger.warning("request failed", extra={"fields": _log_fields(record)})
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info("request finished", extra={"fields": _log_fields(record)})
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                logger.warning("metrics sink failed", extra={"fields": {"sink": type(sink).__name__, "error": str(e)}})
+
+    def summary(self) -> Dict[tuple, Dict]:
+        """按 (供应商, 模型) 汇总最近请求的 TTFT、吞吐与错误率"""
+        groups = defaultdict(list)
+        for record in self.memory.snapshot():
+            groups[(record["api"], record["model"])].append(record)
+        result = {}
+        for key, records in groups.items():
+            ttfts = [r["ttft"] for r in records if r["ttft"] is not None]
+            rates = [r["tokens_per_sec"] for r in records if r["tokens_per_sec"]]
+            gaps = [r["gap_p99"] for r in records if r["gap_p99"] is not None]
+            retrievals = [r["retrieval"] for r in records if r.get("retrieval") is not None]
+            cache_reported = [r for r in records if r.get("cached_tokens") is not None]
+            prompt_tokens = sum(r["prompt_tokens"] or 0 for r in cache_reported)
+            result[key] = {
+                "requests": len(records),
+                "errors": sum(1 for r in records if r["error"]),
+                "ttft_p50": percentile(ttfts, 50),
+                "ttft_p99": percentile(ttfts, 99),
+                "tokens_per_sec": sum(rates) / len(rates) if rates else None,
+                # 各请求分块间隔 p99 的 p99：近期请求中最严重的停顿
+                "gap_p99": percentile(gaps, 99),
+                "retrieval_p50": percentile(retrievals, 50),
+                "prefix_cache_hit_rate": (
+                    sum(r["cached_tokens"] for r in cache_reported) / prompt_tokens if prompt_tokens else None
+                ),
+            }
+        return result
@@ -0,0 +1,142 @@
+from typing import Dict, List, Mapping, Optional
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# /models 列表在磁盘上的有效期（秒），过期后在后台重新拉取
+DEFAULT_DISCOVERY_TTL = 86400
+# 拉取失败后重试的间隔（秒）
+RETRY_INTERVAL = 600
+
+# 各供应商 /models 返回中表示上下文长度的字段
+_CONTEXT_FIELDS = ("context_window", "context_length", "max_context_length", "max_model_len", "input_token_limit")
+# 表示支持推理输出的参数名
+_REASONING_PARAMETERS = ("reasoning", "include_reasoning", "reasoning_effort")
+# /models 中非对话模型的类型字段取值与 id 特征（向量、重排、语音、图像生成、审核）
+_NON_CHAT_TYPES = ("embedding", "embeddings", "rerank", "audio", "speech", "tts", "stt", "image", "video",
+                   "moderation")
+_NON_CHAT_ID = re.compile(
+    r"embed|rerank|whisper|tts|speech|transcribe|moderation|guard|dall-e|gpt-image|stable-diffusion|sdxl|"
+    r"flux|kolors|bge-|/bce-|cosyvoice|sensevoice|fish-speech|wan-?\d|hunyuan-video", re.IGNORECASE
+)
+
+
+def _is_chat_model(raw: Mapping, model_id: str) -> bool:
+    """根据类型字段、输出模态与 id 判断是否为对话（文本生成）模型"""
+    kind = str(raw.get("type") or raw.get("model_type") or raw.get("task") or "").lower()
+    if kind in _NON_CHAT_TYPES:
+        return False
+    outputs = (raw.get("architecture") or {}).get("output_modalities")
+    if outputs and "text" not in outputs:
+        return False
+    return not _NON_CHAT_ID.search(model_id)
+
+
+def normalize_model(raw: Mapping) -> Optional[Dict]:
+    """
+    将 /models 返回的一项整理为 {"id", "chat", "context_window", "vision", "reasoning"}，无法识别的能力留空；
+    chat 表示对话模型（向量、语音、图像生成等模型为 false）；Google 的模型 id 带有 models/ 前缀，请求时不需要
+    """
+    model_id = raw.get("id")
+    if not model_id:
+        return None
+    if model_id.startswith("models/"):
+        model_id = model_id[len("models/"):]
+    entry = {"id": model_id, "chat": _is_chat_model(raw, model_id)}
+    for name in _CONTEXT_FIELDS:
+        value = raw.get(name) or (raw.get("top_provider") or {}).get(name)
+        if isinstance(value, int) and value > 0:
+            entry["context_window"] = value
+            break
+    architecture = raw.get("architecture") or {}
+    modalities = architecture.get("input_modalities") or raw.get("input_modalities") or raw.get("modalities") or []
+    if "image" in modalities or "image" in str(architecture.get("modality", "")).split("->")[0]:
+        entry["vision"] = True
+    parameters = raw.get("supported_parameters") or []
+    if any(name in parameters for name in _REASONING_PARAMETERS):
+        entry["reasoning"] = True
+    return entry
+
+
+class ModelDiscovery:
+    """
+    各供应商 /models 列表的磁盘缓存：启动时直接读取缓存补全模型目录，过期的供应商由 APIManager 在后台重新拉取；
+    缓存按供应商的 url 区分，url 变化后旧列表失效
+    """
+    def __init__(self, path: Optional[str] = "data/model_catalog.json", ttl: float = DEFAULT_DISCOVERY_TTL,
+                 enabled: bool = True):
+        self.path = path
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: Dict[str, Dict] = {}
+        self._failed: Dict[str, float] = {}  # 最近一次拉取失败的时间，避免反复重试
+        self._lock = threading.Lock()
+        if enabled and path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("ignoring unreadable model catalog cache", extra={"fields": {"path": path, "error": str(e)}})
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'ModelDiscovery':
+        """根据 model_discovery 配置段创建，未配置时使用默认值"""
+        config = config or {}
+        return cls(
+            path=config.get("path", "data/model_catalog.json"),
+            ttl=config.get("ttl", DEFAULT_DISCOVERY_TTL),
+            enabled=config.get("enabled", True)
+        )
+
+    def models(self, api_configs: Mapping) -> Dict[str, List[Dict]]:
+        """按供应商返回缓存中的模型（仅包含开启了发现且 url 未变化的供应商）"""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            return {
+                name: entry["models"]
+                for name, entry in self._entries.items()
+                if name in api_configs and api_configs[name].discover_models and entry.get("url") == api_configs[name].url
+            }
+
+    def stale(self, api_configs: Mapping) -> List[str]:
+        """需要重新拉取的供应商"""
+        if not self.enabled:
+            return []
+        now = time.time()
+        with self._lock:
+            return [
+                name for name, config in api_configs.items()
+                if config.discover_models
+                and now - self._failed.get(name, 0) >= RETRY_INTERVAL
+                and (self._entries.get(name, {}).get("url") != config.url
+                     or now - self._entries[name].get("fetched_at", 0) >= self.ttl)
+            ]
+
+    def update(self, api_name: str, url: str, raw_models: List[Mapping]):
+        """保存一个供应商新拉取的列表并写回磁盘"""
+        models = [entry for entry in map(normalize_model, raw_models) if entry is not None]
+        with self._lock:
+            self._entries[api_name] = {"url": url, "fetched_at": time.time(), "models": models}
+            self._failed.pop(api_name, None)
+            self._save()
+
+    def mark_failed(self, api_name: str):
+        with self._lock:
+            self._failed[api_name] = time.time()
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,485 @@
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+
+# NumPy 为可选依赖，仅在启用向量检索时导入：未安装或未配置向量模型时只使用 BM25 检索
+np = None
+
+logger = logging.getLogger(__name__)
+
+# 分块长度（字符）与相邻分块的重叠字符数
+DEFAULT_CHUNK_CHARS = 800
+DEFAULT_CHUNK_OVERLAP = 100
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 查询词剪枝：倒排列表不长于 PRUNE_MIN_POSTINGS 的查询词总是完整遍历（小索引不做剪枝）；
+# 更长的查询词中，出现在超过 STOPWORD_DF_RATIO 的分块中的视为停用词跳过（全部如此时只保留最稀有的一个），
+# 超过 COMMON_DF_RATIO 的视为常见词，只为其他查询词找到的候选加分
+PRUNE_MIN_POSTINGS = 2000
+STOPWORD_DF_RATIO = 0.3
+COMMON_DF_RATIO = 0.05
+# 默认的最低相关度（BM25 得分除以查询词 idf 之和），低于该值的分块不注入上下文
+DEFAULT_MIN_SCORE = 0.2
+# 默认的最低向量余弦相似度
+DEFAULT_MIN_SIMILARITY = 0.5
+# 混合检索时倒数排名融合（RRF）的平滑常数
+RRF_K = 60
+# 默认返回的分块数与注入上下文的最大字符数
+DEFAULT_TOP_K = 5
+DEFAULT_CONTEXT_CHARS = 4000
+# 向量矩阵扩容时的最小行数
+MIN_VECTOR_CAPACITY = 1024
+# 每批请求向量的分块数
+EMBED_BATCH_SIZE = 32
+
+_WORD_PATTERN = re.compile('[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+_CJK_RUN = re.compile('[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    added REAL NOT NULL,
+    chunks INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL,
+    ord INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    terms TEXT NOT NULL,
+    slot INTEGER
+);
+CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """检索分词：英文/数字按单词（小写），中日韩文字按相邻二字组，单字时保留单字"""
+    terms = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if _CJK_RUN.fullmatch(word):
+            if len(word) == 1:
+                terms.append(word)
+            else:
+                terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+
+def chunk_text(text: str, size: int = DEFAULT_CHUNK_CHARS, overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[str]:
+    """按段落切分文本，段落过长时按固定长度切分，相邻分块保留 overlap 个字符的重叠"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > size:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > size:
+            chunks.append(current[:size])
+            current = current[size - overlap:]
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def _import_numpy() -> bool:
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return False
+    return True
+
+
+class BM25Index:
+    """内存中的 BM25 倒排索引，支持按分块增删"""
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self._norms: Optional[Dict[int, float]] = None  # 各分块的长度归一化项，增删分块后重新计算
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, chunk_id: int, terms: Dict[str, int]):
+        for term, tf in terms.items():
+            self.postings[term][chunk_id] = tf
+        length = sum(terms.values())
+        self.lengths[chunk_id] = length
+        self.total_length += length
+        self._norms = None
+
+    def remove(self, chunk_id: int, terms: Dict[str, int]):
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(chunk_id, 0)
+        self._norms = None
+
+    def _length_norms(self) -> Dict[int, float]:
+        if self._norms is None:
+            avg_length = self.total_length / len(self.lengths)
+            self._norms = {
+                chunk_id: BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                for chunk_id, length in self.lengths.items()
+            }
+        return self._norms
+
+    def search(self, terms: List[str], k: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        返回相关度最高的 k 个 (分块 id, 相关度)，低于 min_score 的分块被舍弃；
+        相关度为 BM25 得分除以查询词 idf 之和，所有查询词在平均长度的分块中各出现一次时为 1
+
+        停用词（文档频率过高的查询词）直接跳过，常见词只为其他查询词找到的候选加分；
+        其余查询词按 idf 从高到低处理（MaxScore）：当前第 k 名的得分不低于剩余查询词得分上限之和时，
+        未出现过的分块不可能进入前 k 名，剩余查询词同样只为已有候选加分，不再遍历整个倒排列表
+        """
+        n = len(self.lengths)
+        if not n or k <= 0:
+            return []
+        query = []
+        reference = 0.0
+        for term, qtf in Counter(terms).items():
+            posting = self.postings.get(term)
+            df = len(posting) if posting else 0
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            # 索引中没有的查询词同样计入相关度的分母
+            reference += qtf * idf
+            if posting:
+                # 单个查询词得分的上限（tf 趋于无穷时）
+                query.append((qtf * idf * (BM25_K1 + 1), posting))
+        if not query:
+            return []
+        query.sort(key=lambda item: len(item[1]))
+        stopword_limit = max(STOPWORD_DF_RATIO * n, PRUNE_MIN_POSTINGS)
+        query = [item for item in query if len(item[1]) <= stopword_limit] or query[:1]
+        common_limit = max(COMMON_DF_RATIO * n, PRUNE_MIN_POSTINGS)
+        essential = sum(1 for _, posting in query if len(posting) <= common_limit) or 1
+        # 常见词排在最后，且总是只为已有候选加分
+        query = sorted(query[:essential], key=lambda item: item[0], reverse=True) + query[essential:]
+
+        norms = self._length_norms()
+        scores: Dict[int, float] = {}
+        remaining = sum(weight for weight, _ in query)
+        for index, (weight, posting) in enumerate(query):
+            if index >= essential or (
+                    len(scores) >= k and heapq.nlargest(k, scores.values())[-1] >= remaining):
+                if len(posting) < len(scores):
+                    for chunk_id, tf in posting.items():
+                        if chunk_id in scores:
+                            scores[chunk_id] += weight * tf / (tf + norms[chunk_id])
+                else:
+                    for chunk_id in scores:
+                        tf = posting.get(chunk_id)
+                        if tf:
+                            scores[chunk_id] += weight * tf / (tf + norms[chunk_id])
+            else:
+                for chunk_id, tf in posting.items():
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * tf / (tf + norms[chunk_id])
+            remaining -= weight
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(chunk_id, score / reference) for chunk_id, score in top if score / reference >= min_score]
+
+
+class VectorStore:
+    """
+    磁盘上的向量矩阵（NumPy memmap，float32，按行归一化），按槽位存放分块向量；
+    删除的槽位清零后复用，容量不足时按倍数扩容
+    """
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.capacity = 0
+        self.matrix = None
+        self.used = 0  # 已分配过的最大槽位 + 1，检索只扫描这一部分
+        self.free: List[int] = []
+        if os.path.exists(path):
+            self.capacity = os.path.getsize(path) // (4 * dim)
+            if self.capacity:
+                self.matrix = np.memmap(path, dtype=np.float32, mode="r+", shape=(self.capacity, dim))
+
+    def load_slots(self, slots: List[int]):
+        """根据存储中记录的槽位恢复分配状态"""
+        occupied = set(slots)
+        self.used = max(occupied) + 1 if occupied else 0
+        self.free = [slot for slot in range(self.used) if slot not in occupied]
+
+    def _reserve(self, rows: int):
+        if self.used + rows <= self.capacity:
+            return
+        capacity = max(MIN_VECTOR_CAPACITY, self.capacity * 2, self.used + rows)
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self.path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.capacity = capacity
+        self.matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def add(self, vectors: List[List[float]]) -> List[int]:
+        data = np.asarray(vectors, dtype=np.float32)
+        if data.ndim != 2 or data.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {data.shape}")
+        norms = np.linalg.norm(data, axis=1, keepdims=True)
+        data /= np.maximum(norms, 1e-12)
+        slots = []
+        while self.free and len(slots) < len(data):
+            slots.append(self.free.pop())
+        new = len(data) - len(slots)
+        self._reserve(new)
+        slots.extend(range(self.used, self.used + new))
+        self.used += new
+        self.matrix[slots] = data
+        self.matrix.flush()
+        return slots
+
+    def remove(self, slots: List[int]):
+        if not slots:
+            return
+        self.matrix[slots] = 0
+        self.matrix.flush()
+        self.free.extend(slots)
+
+    def search(self, vector: List[float], k: int) -> List[Tuple[int, float]]:
+        """余弦相似度最高的 k 个 (槽位, 得分)"""
+        if not self.used:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.matrix[:self.used] @ query
+        k = min(k, self.used)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(slot), float(scores[slot])) for slot in top if scores[slot] > 0]
+
+
+def _remove_index(conn: sqlite3.Connection, path: str):
+    conn.close()
+    shutil.rmtree(path, True)
+
+
+class RAGIndex:
+    """
+    本地文档检索索引：文档切块后写入 SQLite，BM25 倒排索引常驻内存，
+    可选的向量检索使用磁盘上的 memmap 矩阵；增删文档只更新受影响的分块，不重建索引
+    """
+    def __init__(self, path: Optional[str] = "data/rag",
+                 embedder: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 dim: Optional[int] = None, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                 chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, top_k: int = DEFAULT_TOP_K,
+                 max_context_chars: int = DEFAULT_CONTEXT_CHARS, min_score: float = DEFAULT_MIN_SCORE,
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY):
+        """
+        path: 存储目录；None 表示临时索引，存放在系统临时目录中，索引对象被回收或进程退出时删除
+        embedder: 将文本列表转换为向量列表的函数，None 表示只使用 BM25
+        dim: 向量维度，启用向量检索时必填
+        min_score: BM25 结果的最低相关度（得分占查询满分的比例），相关度不足的分块不会注入上下文
+        min_similarity: 向量检索结果的最低余弦相似度
+        """
+        temporary = path is None
+        if temporary:
+            path = tempfile.mkdtemp(prefix="chat-rag-")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap = chunk_overlap
+        self.top_k = top_k
+        self.max_context_chars = max_context_chars
+        self.min_score = min_score
+        self.min_similarity = min_similarity
+        self.embedder = embedder if embedder is not None and dim and _import_numpy() else None
+        if embedder is not None and self.embedder is None:
+            logger.warning("dense retrieval requires numpy and an embedding dim, falling back to BM25")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        if temporary:
+            weakref.finalize(self, _remove_index, self._conn, path)
+        self.bm25 = BM25Index()
+        self.vectors = VectorStore(os.path.join(path, "vectors.f32"), dim) if self.embedder else None
+        self._slot_chunks: Dict[int, int] = {}
+        self._load()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict], api_manager=None, temporary: bool = False) -> Optional['RAGIndex']:
+        """
+        根据 rag 配置段创建索引，enabled 为 false 时返回 None；配置 embedding 时通过对应供应商计算向量
+        temporary: 忽略配置的 path，创建只供一个会话使用的临时索引
+        """
+        config = dict(config or {})
+        if not config.pop("enabled", True):
+            return None
+        config.pop("shared", None)
+        if temporary:
+            config["path"] = None
+        embedding = config.pop("embedding", None)
+        embedder, dim = None, None
+        if embedding and api_manager is not None:
+            api_name, model, dim = embedding["api"], embedding["model"], embedding["dim"]
+
+            def embedder(texts: List[str]) -> List[List[float]]:
+                # 共享客户端关闭了 SDK 重试（聊天请求由 ChatClient 重试），向量请求在这里按供应商设置重试
+                client = api_manager.get_client(api_name).with_options(
+                    max_retries=api_manager.get_transport(api_name).max_retries
+                )
+                response = client.embeddings.create(model=model, input=texts)
+                return [item.embedding for item in response.data]
+        return cls(embedder=embedder, dim=dim, **config)
+
+    def _load(self):
+        """启动时从存储恢复倒排索引（分块的词频已持久化，无需重新分词）"""
+        slots = []
+        for chunk_id, terms, slot in self._conn.execute("SELECT id, terms, slot FROM chunks"):
+            self.bm25.add(chunk_id, json.loads(terms))
+            if slot is not None:
+                slots.append(slot)
+                self._slot_chunks[slot] = chunk_id
+        if self.vectors is not None:
+            self.vectors.load_slots(slots)
+
+    def __len__(self):
+        return len(self.bm25)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors.extend(self.embedder(texts[i:i + EMBED_BATCH_SIZE]))
+        return vectors
+
+    def add_document(self, source: str, text: str) -> int:
+        """添加文档（同名来源已存在时替换），返回文档 id；写入失败时索引保持原样"""
+        chunks = chunk_text(text, self.chunk_chars, self.chunk_overlap)
+        terms = [dict(Counter(tokenize(chunk))) for chunk in chunks]
+        # 向量在加锁前计算，避免网络请求阻塞检索
+        vectors = self._embed(chunks) if self.embedder and chunks else None
+        with self._lock:
+            slots = self.vectors.add(vectors) if vectors else [None] * len(chunks)
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 替换同名文档时删除与写入在同一事务中，任一步失败都回滚到原文档
+                existing = conn.execute("SELECT id FROM documents WHERE source = ?", (source,)).fetchone()
+                replaced = self._delete_rows(existing[0]) if existing else []
+                doc_id = conn.execute(
+                    "INSERT INTO documents (source, added, chunks) VALUES (?, ?, ?)", (source, time.time(), len(chunks))
+                ).lastrowid
+                chunk_ids = []
+                for order, (chunk, chunk_terms, slot) in enumerate(zip(chunks, terms, slots)):
+                    chunk_ids.append(conn.execute(
+                        "INSERT INTO chunks (doc_id, ord, text, terms, slot) VALUES (?, ?, ?, ?, ?)",
+                        (doc_id, order, chunk, json.dumps(chunk_terms, ensure_ascii=False), slot)
+                    ).lastrowid)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                if vectors:
+                    self.vectors.remove(slots)
+                raise
+            # 内存中的索引在事务提交后才更新
+            self._forget(replaced)
+            for chunk_id, chunk_terms, slot in zip(chunk_ids, terms, slots):
+                self.bm25.add(chunk_id, chunk_terms)
+                if slot is not None:
+                    self._slot_chunks[slot] = chunk_id
+        return doc_id
+
+    def add_file(self, path: str, source: Optional[str] = None) -> int:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return self.add_document(source or os.path.basename(path), f.read())
+
+    def _delete_rows(self, doc_id: int) -> List[Tuple[int, str, Optional[int]]]:
+        """在当前事务中删除文档及其分块，返回被删除分块的 (id, 词频, 槽位)"""
+        rows = self._conn.execute("SELECT id, terms, slot FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+        self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+        self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        return rows
+
+    def _forget(self, rows: List[Tuple[int, str, Optional[int]]]):
+        """从内存中的倒排索引与向量矩阵移除已删除的分块"""
+        slots = []
+        for chunk_id, terms, slot in rows:
+            self.bm25.remove(chunk_id, json.loads(terms))
+            if slot is not None:
+                slots.append(slot)
+                self._slot_chunks.pop(slot, None)
+        if self.vectors is not None:
+            self.vectors.remove(slots)
+
+    def delete_document(self, doc_id: int):
+        """删除文档；写入失败时回滚，存储与内存中的索引都保持原样"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._delete_rows(doc_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._forget(rows)
+
+    def list_documents(self) -> List[Dict]:
+        rows = self._conn.execute("SELECT id, source, added, chunks FROM documents ORDER BY added DESC").fetchall()
+        return [dict(zip(("id", "source", "added", "chunks"), row)) for row in rows]
+
+    def search(self, query: str, k: Optional[int] = None) -> List[Dict]:
+        """检索与查询最相关的分块（低于相关度阈值的不返回）；启用向量检索时与 BM25 结果按倒数排名融合"""
+        k = k or self.top_k
+        # 向量检索需要先请求查询向量，放在锁外
+        query_vector = self._embed([query])[0] if self.embedder else None
+        with self._lock:
+            ranked = [chunk_id for chunk_id, _ in self.bm25.search(tokenize(query), k * 2, self.min_score)]
+            if query_vector is not None:
+                dense = [self._slot_chunks[slot] for slot, score in self.vectors.search(query_vector, k * 2)
+                         if slot in self._slot_chunks and score >= self.min_similarity]
+                fused: Dict[int, float] = defaultdict(float)
+                for results in (ranked, dense):
+                    for rank, chunk_id in enumerate(results):
+                        fused[chunk_id] += 1 / (RRF_K + rank + 1)
+                ranked = sorted(fused, key=fused.get, reverse=True)
+            ranked = ranked[:k]
+            if not ranked:
+                return []
+            placeholders = ",".join("?" * len(ranked))
+            rows = self._conn.execute(
+                f"SELECT c.id, c.text, d.source FROM chunks c JOIN documents d ON c.doc_id = d.id "
+                f"WHERE c.id IN ({placeholders})", ranked
+            ).fetchall()
+        by_id = {chunk_id: {"text": text, "source": source} for chunk_id, text, source in rows}
+        return [by_id[chunk_id] for chunk_id in ranked if chunk_id in by_id]
+
+    def build_context(self, query: str) -> Optional[str]:
+        """检索并拼接为附在本轮提问之前的参考资料，超出字符上限的分块被舍弃"""
+        if not len(self) or not query.strip():
+            return None
+        parts, used = [], 0
+        for index, hit in enumerate(self.search(query), 1):
+            part = f"[{index}] 来源：{hit['source']}\n{hit['text']}"
+            if parts and used + len(part) > self.max_context_chars:
+                break
+            parts.append(part)
+            used += len(part)
+        return "\n\n".join(parts) or None
@@ -0,0 +1,191 @@
+from typing import Callable, Dict, Optional, Tuple
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+
+# 未配置 max_wait 时，请求在队列中最多等待的秒数
+DEFAULT_MAX_WAIT = 30.0
+
+# 每分钟配额用令牌桶平滑；每日配额用按 UTC 对齐的固定窗口，与供应商按自然日计数一致
+_WINDOWS = {"rpm": 60.0, "tpm": 60.0}
+_DAILY = {"rpd": 86400.0}
+
+
+class RateLimitExceeded(Exception):
+    """请求超出配额且无法在允许的等待时间内执行"""
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：容量为窗口内的配额，按配额/窗口的速率匀速补充"""
+    def __init__(self, capacity: float, window: float):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / window
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """获取 amount 个令牌需要等待的秒数（超过容量的请求按容量计算）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """扣除令牌，允许为负（用于事后补记实际用量）"""
+        self.tokens -= amount
+
+
+class FixedWindow:
+    """
+    固定窗口计数：窗口按 UTC 时间对齐（日配额在 UTC 零点重置），窗口内的用量不超过配额，接口与 TokenBucket 相同
+
+    令牌桶在用完容量后仍会匀速补充，一天内放行的请求最多可达配额的两倍，因此不用于每日配额。
+    计数只在进程内有效，进程重启后从零开始
+    """
+    def __init__(self, capacity: float, window: float, clock: Callable[[], float] = time.time):
+        self.capacity = float(capacity)
+        self.window = window
+        self.clock = clock
+        self.used = 0.0
+        self.start = self._window_start(clock())
+
+    def _window_start(self, wall: float) -> float:
+        return wall - wall % self.window
+
+    def _roll(self) -> float:
+        wall = self.clock()
+        start = self._window_start(wall)
+        if start != self.start:
+            self.start, self.used = start, 0.0
+        return wall
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """获取 amount 个配额需要等待的秒数，配额用完时等到下一个窗口开始（now 为单调时钟，这里按墙上时间计算）"""
+        wall = self._roll()
+        if self.used + min(amount, self.capacity) <= self.capacity:
+            return 0.0
+        return self.start + self.window - wall
+
+    def consume(self, amount: float):
+        self._roll()
+        self.used += amount
+
+
+class QuotaLimiter:
+    """单个 (供应商, 模型) 的 RPM/TPM/RPD 配额调度器，线程安全"""
+    def __init__(self, name: str, limits: Dict):
+        self.name = name
+        self.max_wait = float(limits.get("max_wait", DEFAULT_MAX_WAIT))
+        self.buckets = {
+            kind: TokenBucket(limits[kind], window)
+            for kind, window in _WINDOWS.items() if limits.get(kind)
+        }
+        self.buckets.update({
+            kind: FixedWindow(limits[kind], window)
+            for kind, window in _DAILY.items() if limits.get(kind)
+        })
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self, tokens: int, now: float) -> Tuple[float, str]:
+        """计算执行请求所需的等待时间及瓶颈配额"""
+        wait, reason = max(self.blocked_until - now, 0.0), "retry-after"
+        for kind, bucket in self.buckets.items():
+            bucket_wait = bucket.wait_time(tokens if kind == "tpm" else 1, now)
+            if bucket_wait > wait:
+                wait, reason = bucket_wait, kind
+        return wait, reason
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None):
+        """
+        申请执行一次请求：配额充足时立即返回，否则排队等待；
+        预计等待超过 max_wait 时直接拒绝，避免在注定失败的请求上浪费时间
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait, reason = self._wait_time(tokens, now)
+                if wait <= 0:
+                    for kind, bucket in self.buckets.items():
+                        bucket.consume(tokens if kind == "tpm" else 1)
+                    return
+                if now + wait > deadline:
+                    raise RateLimitExceeded(
+                        f"Rate limit ({reason}) exceeded for {self.name}, retry after {wait:.1f}s",
+                        retry_after=wait
+                    )
+            time.sleep(min(wait, max(deadline - time.monotonic(), 0.0)))
+
+    def record_usage(self, tokens: int):
+        """补记请求完成后的额外 token 用量（如输出 token）"""
+        bucket = self.buckets.get("tpm")
+        if bucket and tokens > 0:
+            with self._lock:
+                bucket.consume(tokens)
+
+    def penalize(self, retry_after: float):
+        """收到 429 后，让所有会话在 retry_after 秒内暂停向该配额发送请求"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class RateLimiter:
+    """进程内共享的配额调度器集合，按 (供应商, 模型) 管理"""
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], QuotaLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_name: str, model: str, limits: Optional[Dict]) -> Optional[QuotaLimiter]:
+        """获取对应的配额调度器，未配置配额时返回 None"""
+        if not limits:
+            return None
+        key = (api_name, model)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = QuotaLimiter(f"{api_name}/{model}", limits)
+            return limiter
+
+    def discard(self, api_name: str):
+        """丢弃指定供应商的调度器（配置变化后按新配额重新创建）"""
+        with self._lock:
+            for key in [key for key in self._limiters if key[0] == api_name]:
+                del self._limiters[key]
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """解析响应头中的 retry-after-ms / retry-after（秒数或 HTTP 日期）"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """指数退避加全抖动"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
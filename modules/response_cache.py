@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 回放缓存答案时每个模拟分块的字符数
+REPLAY_CHUNK_CHARS = 16
+
+
+def normalize_text(text: str) -> str:
+    """规范化消息文本：统一换行并去掉首尾空白，使仅有空白差异的请求命中同一缓存"""
+    return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").strip().split("\n"))
+
+
+def cache_key(api_name: str, model: str, context: List[Dict], params: Optional[Dict] = None) -> str:
+    """根据 (供应商, 模型, 规范化上下文, 采样参数) 计算缓存键"""
+    payload = {
+        "api": api_name,
+        "model": model,
+        "messages": [[m["role"], normalize_text(str(m.get("content") or ""))] for m in context],
+        "params": params or {}
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """内存 LRU 缓存，按条目数与总字节数限制容量，条目超过 TTL 后失效"""
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, created = item
+            if time.time() - created > self.ttl:
+                self._remove(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, created: Optional[float] = None):
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (value, created or time.time())
+            self.size += len(value)
+            while self._items and (len(self._items) > self.max_entries or self.size > self.max_bytes):
+                self._remove(next(iter(self._items)))
+
+    def _remove(self, key: str):
+        value, _ = self._items.pop(key)
+        self.size -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+class SQLiteCache:
+    """本地 SQLite 持久化缓存，可在进程重启后继续命中"""
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """返回 (value, created)，未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed = ? WHERE key = ?", (now, key))
+            return row
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE created < ? OR key IN ("
+                "SELECT key FROM response_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl, self.max_entries)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+
+class ResponseCache:
+    """补全结果缓存：内存 LRU 在前，可选 SQLite 持久化在后"""
+    def __init__(self, ttl: float = 3600, max_entries: int = 1000, max_bytes: int = 50_000_000,
+                 path: Optional[str] = None):
+        self.memory = MemoryCache(ttl, max_entries, max_bytes)
+        self.disk = SQLiteCache(path, ttl, max_entries) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['ResponseCache']:
+        """根据 response_cache 配置段创建缓存，未启用时返回 None"""
+        if not config or not config.get("enabled"):
+            return None
+        return cls(
+            ttl=config.get("ttl", 3600),
+            max_entries=config.get("max_entries", 1000),
+            max_bytes=config.get("max_bytes", 50_000_000),
+            path=config.get("path")
+        )
+
+    def get(self, key: str) -> Optional[Dict]:
+        """查找缓存的答案 {"content", "reasoning", "elapsed"}"""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            row = self.disk.get(key)
+            if row is not None:
+                value = row[0]
+                self.memory.set(key, value, created=row[1])
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, content: Dict):
+        value = json.dumps(content, ensure_ascii=False)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def replay_chunks(content: Dict, chunk_chars: int = REPLAY_CHUNK_CHARS):
+    """将缓存的答案拆成与 get_response 相同格式的模拟流式分块"""
+    reasoning = content.get("reasoning") or ""
+    answer = content.get("content") or ""
+    elapsed = content.get("elapsed")
+    for i in range(0, len(reasoning), chunk_chars):
+        yield {"type": "reasoning", "content": reasoning[i:i + chunk_chars]}
+    for i in range(0, len(answer), chunk_chars):
+        if reasoning:
+            yield {"type": "content", "content": answer[i:i + chunk_chars], "elapsed": elapsed}
+        else:
+            yield {"type": "content", "content": answer[i:i + chunk_chars]}
@@ -0,0 +1,221 @@
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import contextvars
+import queue
+import threading
+import time
+
+# 模型别名在侧边栏中显示的虚拟供应商名
+ALIAS_API = "auto"
+# TTFT 指数滑动平均系数
+EWMA_ALPHA = 0.3
+# 错误率统计窗口（最近请求数）
+ERROR_WINDOW = 20
+# 错误率达到阈值时熔断该端点
+ERROR_THRESHOLD = 0.5
+# 熔断前至少需要的样本数
+MIN_SAMPLES = 3
+# 熔断冷却时间（秒）
+COOLDOWN = 60.0
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    api_name: str
+    model: str
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Endpoint':
+        """解析 "供应商/模型" 格式（模型名本身可以包含 /）"""
+        api_name, _, model = spec.partition("/")
+        if not api_name or not model:
+            raise ValueError(f"Invalid endpoint '{spec}', expected 'api/model'")
+        return cls(api_name, model)
+
+    def __str__(self):
+        return f"{self.api_name}/{self.model}"
+
+
+@dataclass
+class ModelAlias:
+    name: str
+    endpoints: List[Endpoint]
+    hedge_after: Optional[float] = None  # 首个 token 超过该秒数未到达时，向次优端点发起对冲请求
+
+
+class EndpointStats:
+    """单个端点的滚动 TTFT 与错误率"""
+    def __init__(self):
+        self.ttft: Optional[float] = None
+        self.results = deque(maxlen=ERROR_WINDOW)
+        self.cooldown_until = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        if not self.results:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def observe(self, ttft: Optional[float], ok: bool):
+        self.results.append(ok)
+        if ttft is not None:
+            self.ttft = ttft if self.ttft is None else EWMA_ALPHA * ttft + (1 - EWMA_ALPHA) * self.ttft
+        if not ok and len(self.results) >= MIN_SAMPLES and self.error_rate >= ERROR_THRESHOLD:
+            self.cooldown_until = time.monotonic() + COOLDOWN
+            self.results.clear()
+
+    def score(self) -> float:
+        """路由得分，越小越优先；尚无样本的端点得分为 0，优先探测"""
+        if self.ttft is None:
+            return 0.0
+        return self.ttft * (1 + 4 * self.error_rate)
+
+
+class _Attempt:
+    """一次路由尝试：在后台线程中建立流并读取到第一个 token"""
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.error: Optional[BaseException] = None
+        self._stream = None
+        self._iterator = None
+        self._buffered = []
+        self._cancelled = threading.Event()
+
+    def run(self, start: Callable[[Endpoint], Iterator], results: queue.Queue):
+        try:
+            self._stream = start(self.endpoint)
+            self._iterator = iter(self._stream)
+            # 缓存只含角色等元信息的分块，直到出现第一个实际 token
+            for chunk in self._iterator:
+                self._buffered.append(chunk)
+                if _has_token(chunk) or self._cancelled.is_set():
+                    break
+        except Exception as e:
+            self.error = e
+        if self._cancelled.is_set():
+            self.close()
+            return
+        results.put(self)
+
+    def cancel(self):
+        self._cancelled.set()
+        self.close()
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def chunks(self) -> Iterator:
+        yield from self._buffered
+        if self._iterator is not None:
+            yield from self._iterator
+
+
+def _has_token(chunk) -> bool:
+    if not getattr(chunk, "choices", None):
+        return False
+    delta = chunk.choices[0].delta
+    return bool(getattr(delta, "content", None) or getattr(delta, "reasoning_content", None))
+
+
+class ModelRouter:
+    """模型别名路由：按滚动 TTFT/错误率选择最快的健康端点，可选对冲请求"""
+    def __init__(self, aliases: Optional[Dict[str, Dict]] = None):
+        # 重新加载配置时整体替换 aliases，端点统计保留
+        self.aliases: Dict[str, ModelAlias] = self.parse_aliases(aliases)
+        self._stats: Dict[Endpoint, EndpointStats] = defaultdict(EndpointStats)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_aliases(aliases: Optional[Dict[str, Dict]]) -> Dict[str, ModelAlias]:
+        """解析 aliases 配置段"""
+        return {
+            name: ModelAlias(
+                name=name,
+                endpoints=[Endpoint.parse(e) for e in spec["endpoints"]],
+                hedge_after=spec.get("hedge_after")
+            )
+            for name, spec in (aliases or {}).items()
+        }
+
+    def observe(self, endpoint: Endpoint, ttft: Optional[float], ok: bool):
+        with self._lock:
+            self._stats[endpoint].observe(ttft, ok)
+
+    def emit(self, record: Dict):
+        """作为 MetricsHub 的 sink，用每次请求的指标更新端点统计"""
+        if record["api"] == ALIAS_API:
+            return
+        self.observe(Endpoint(record["api"], record["model"]), record["ttft"], record["error"] is None)
+
+    def rank(self, alias_name: str) -> List[Endpoint]:
+        """按健康状况与得分排序端点；全部熔断时仍按得分返回，保证可用"""
+        alias = self.aliases[alias_name]
+        with self._lock:
+            stats = {e: self._stats[e] for e in alias.endpoints}
+            order = {e: i for i, e in enumerate(alias.endpoints)}
+            return sorted(alias.endpoints, key=lambda e: (not stats[e].healthy, stats[e].score(), order[e]))
+
+    def stats(self, alias_name: str) -> List[Tuple[Endpoint, Dict]]:
+        """返回别名下各端点的统计快照"""
+        with self._lock:
+            return [(e, {
+                "ttft": self._stats[e].ttft,
+                "error_rate": self._stats[e].error_rate,
+                "healthy": self._stats[e].healthy
+            }) for e in self.aliases[alias_name].endpoints]
+
+    def open_stream(self, alias_name: str, start: Callable[[Endpoint], Iterator]) -> Tuple[Endpoint, Iterator]:
+        """
+        按排序依次尝试端点：失败时立即切换到下一个；
+        若配置了 hedge_after，首个 token 超时未到达时并发请求次优端点，先出 token 者胜出，另一个被取消
+        """
+        alias = self.aliases[alias_name]
+        pending = self.rank(alias_name)
+        results: queue.Queue = queue.Queue()
+        attempts: List[_Attempt] = []
+        errors = []
+
+        def launch():
+            attempt = _Attempt(pending.pop(0))
+            attempts.append(attempt)
+            # 在调用方的上下文中运行，日志保留请求 id
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(attempt.run, start, results), daemon=True).start()
+
+        launch()
+        running = 1
+        hedged = False
+        while running:
+            timeout = alias.hedge_after if (alias.hedge_after and not hedged and pending) else None
+            try:
+                attempt = results.get(timeout=timeout)
+            except queue.Empty:
+                hedged = True
+                launch()
+                running += 1
+                continue
+            running -= 1
+            if attempt.error is None:
+                for other in attempts:
+                    if other is not attempt and other.error is None:
+                        other.cancel()
+                        # 被取消的端点至少慢了这么久，计入其 TTFT
+                        self.observe(other.endpoint, time.perf_counter() - other.started, True)
+                return attempt.endpoint, attempt.chunks()
+            errors.append(f"{attempt.endpoint}: {attempt.error}")
+            self.observe(attempt.endpoint, None, False)
+            if pending and running == 0:
+                launch()
+                running += 1
+        raise Exception(f"All endpoints failed for model alias {alias_name}: " + "; ".join(errors))
@@ -0,0 +1,131 @@
+from typing import Dict, Optional
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+# 超过该字节数的负载（推理内容、图片）写入外置存储，消息只保留引用
+DEFAULT_SPILL_THRESHOLD = 4096
+
+
+class SpillRef:
+    """外置存储中一块负载的引用，引用对象被回收后对应文件随之删除"""
+    __slots__ = ("_store", "key", "size", "__weakref__")
+
+    def __init__(self, store: 'SpillStore', key: str, size: int):
+        self._store = store
+        self.key = key
+        self.size = size
+
+    @property
+    def store(self) -> 'SpillStore':
+        return self._store
+
+    def read(self) -> bytes:
+        return self._store.read(self.key)
+
+    def text(self) -> str:
+        return self.read().decode("utf-8")
+
+    def __eq__(self, other):
+        return isinstance(other, SpillRef) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"SpillRef({self.key[:12]}, {self.size} bytes)"
+
+
+class SpilledFile:
+    """已写入外置存储的上传文件，接口与 UploadedFile 的 name/type/size/getvalue 一致"""
+    __slots__ = ("name", "type", "ref")
+
+    def __init__(self, name: str, type: Optional[str], ref: SpillRef):
+        self.name = name
+        self.type = type
+        self.ref = ref
+
+    @property
+    def size(self) -> int:
+        return self.ref.size
+
+    @property
+    def store(self) -> 'SpillStore':
+        return self.ref.store
+
+    def getvalue(self) -> bytes:
+        return self.ref.read()
+
+
+class SpillStore:
+    """
+    进程内共享的大块负载外置存储：按内容哈希写入磁盘文件，相同内容只存一份；
+    每个 SpillRef 持有一次引用计数，计数归零时删除文件，进程退出时清空整个目录
+    """
+    def __init__(self, path: Optional[str] = None, threshold: int = DEFAULT_SPILL_THRESHOLD):
+        """
+        path: 存放目录的父目录，默认使用系统临时目录；每个进程使用独立的子目录
+        threshold: 小于该字节数的负载保留在内存中
+        """
+        if path:
+            os.makedirs(path, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="chat-spill-", dir=path or None)
+        self.threshold = threshold
+        self._refcounts: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        atexit.register(shutil.rmtree, self.path, True)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['SpillStore']:
+        """根据 spill 配置段创建，enabled 为 false 时返回 None"""
+        config = config or {}
+        if not config.get("enabled", True):
+            return None
+        return cls(config.get("path"), config.get("threshold", DEFAULT_SPILL_THRESHOLD))
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def put(self, data: bytes) -> SpillRef:
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if key not in self._refcounts:
+                tmp = self._file(key) + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self._file(key))
+                self._refcounts[key] = 0
+                self._sizes[key] = len(data)
+            self._refcounts[key] += 1
+        ref = SpillRef(self, key, len(data))
+        weakref.finalize(ref, self._release, key)
+        return ref
+
+    def put_text(self, text: str) -> SpillRef:
+        return self.put(text.encode("utf-8"))
+
+    def read(self, key: str) -> bytes:
+        with open(self._file(key), "rb") as f:
+            return f.read()
+
+    def _release(self, key: str):
+        with self._lock:
+            self._refcounts[key] -= 1
+            if self._refcounts[key] > 0:
+                return
+            del self._refcounts[key]
+            del self._sizes[key]
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """当前保存的负载数量与总字节数（所有会话合计）"""
+        with self._lock:
+            return {"blobs": len(self._sizes), "bytes": sum(self._sizes.values())}
@@ -0,0 +1,60 @@
+import time
+from typing import Callable
+
+
+class StreamRenderer:
+    """流式渲染器：合并流式分块，按最大帧率/最小增量刷新到占位组件"""
+    def __init__(self, placeholder, render_func: Callable[..., str],
+                 max_fps: float = 15, min_delta: int = 0):
+        """
+        placeholder: st.empty() 返回的占位组件
+        render_func: 根据当前状态生成 HTML 的函数（如 ChatUI.streaming_renderer() 返回的函数）
+        max_fps: 每秒最多刷新次数，<=0 表示不限制
+        min_delta: 两次刷新之间至少新增的字符数，0 表示不限制
+        """
+        self.placeholder = placeholder
+        self.render_func = render_func
+        self.min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+        self.min_delta = min_delta
+        self.frames = 0
+
+        self._state = {}
+        self._size = 0
+        self._flushed_size = 0
+        self._last_flush = 0.0
+        self._dirty = False
+
+    def update(self, force: bool = False, **state) -> bool:
+        """更新渲染状态，满足刷新条件时才真正推送到前端，返回是否发生了刷新"""
+        self._state.update(state)
+        self._size = sum(len(v) for v in self._state.values() if isinstance(v, str))
+        self._dirty = True
+        if force or self._should_flush():
+            self.flush()
+            return True
+        return False
+
+    def _should_flush(self) -> bool:
+        """判断是否达到刷新条件（首帧总是立即刷新）"""
+        if not self.frames:
+            return True
+        if time.monotonic() - self._last_flush < self.min_interval:
+            return False
+        return self._size - self._flushed_size >= self.min_delta
+
+    def flush(self):
+        """立即将当前状态渲染到占位组件"""
+        if not self._dirty:
+            return
+        self.placeholder.markdown(self.render_func(**self._state), unsafe_allow_html=True)
+        self.frames += 1
+        self._flushed_size = self._size
+        self._last_flush = time.monotonic()
+        self._dirty = False
+
+    def close(self, **state):
+        """流结束时保证最后一帧被完整渲染"""
+        if state:
+            self._state.update(state)
+            self._dirty = True
+        self.flush()
@@ -0,0 +1,84 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# 默认的推理内容标签对
+DEFAULT_THINK_TAGS: Tuple[Tuple[str, str], ...] = (("<think>", "</think>"),)
+
+
+def _partial_suffix(buf: str, start: int, tags: Iterable[str]) -> int:
+    """返回 buf 末尾可能是某个标签前缀的最大长度（需要暂存，等待下一块确认）"""
+    longest = 0
+    for tag in tags:
+        for k in range(min(len(tag) - 1, len(buf) - start), longest, -1):
+            if buf.endswith(tag[:k]):
+                longest = k
+                break
+    return longest
+
+
+class ThinkStreamParser:
+    """
+    增量式推理/正文分段解析器
+
+    按任意分块边界处理内联的 <think>...</think> 标签（标签可跨块、可与正文同块），
+    每块只扫描新到达的文本加上不超过标签长度的暂存尾部，不会重新扫描已累积的内容。
+    """
+    def __init__(self, tags: Optional[Sequence[Sequence[str]]] = None):
+        self.tags = [tuple(pair) for pair in (tags or DEFAULT_THINK_TAGS)]
+        self._open_tags = [open_tag for open_tag, _ in self.tags]
+        self._close: Optional[str] = None
+        self._pending = ""
+
+    @property
+    def in_reasoning(self) -> bool:
+        return self._close is not None
+
+    def feed(self, text: Optional[str]) -> List[Tuple[str, str]]:
+        """输入一段正文增量，返回 [(类型, 文本)]，类型为 reasoning 或 content"""
+        if not text:
+            return []
+        buf = self._pending + text
+        self._pending = ""
+        segments: List[Tuple[str, str]] = []
+        pos = 0
+        while pos < len(buf):
+            if self._close is None:
+                index, pair = -1, None
+                for open_tag, close_tag in self.tags:
+                    i = buf.find(open_tag, pos)
+                    if i != -1 and (index == -1 or i < index):
+                        index, pair = i, (open_tag, close_tag)
+                if pair is None:
+                    keep = _partial_suffix(buf, pos, self._open_tags)
+                    self._append(segments, "content", buf[pos:len(buf) - keep])
+                    self._pending = buf[len(buf) - keep:]
+                    break
+                self._append(segments, "content", buf[pos:index])
+                self._close = pair[1]
+                pos = index + len(pair[0])
+            else:
+                index = buf.find(self._close, pos)
+                if index == -1:
+                    keep = _partial_suffix(buf, pos, (self._close,))
+                    self._append(segments, "reasoning", buf[pos:len(buf) - keep])
+                    self._pending = buf[len(buf) - keep:]
+                    break
+                self._append(segments, "reasoning", buf[pos:index])
+                pos = index + len(self._close)
+                self._close = None
+        return segments
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """流结束时输出暂存的尾部文本（未闭合的标签前缀按普通文本处理）"""
+        segments: List[Tuple[str, str]] = []
+        self._append(segments, "reasoning" if self._close is not None else "content", self._pending)
+        self._pending = ""
+        return segments
+
+    @staticmethod
+    def _append(segments: List[Tuple[str, str]], kind: str, text: str):
+        if not text:
+            return
+        if segments and segments[-1][0] == kind:
+            segments[-1] = (kind, segments[-1][1] + text)
+        else:
+            segments.append((kind, text))
@@ -0,0 +1,204 @@
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING, Dict, Optional
+import importlib.util
+import logging
+import threading
+import time
+
+# httpx 在创建客户端时才导入，缩短冷启动时间
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """单个供应商的 HTTP 连接池与超时设置"""
+    connect_timeout: float = 5.0
+    read_timeout: float = 120.0  # 流式响应中两次数据之间的最长间隔
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0  # 等待空闲连接的最长时间
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    http2: bool = False
+    max_retries: int = 2  # 连接错误/超时/5xx 的重试次数（由 ChatClient 以带抖动的指数退避执行，SDK 不再重试）
+    warm_up: bool = True  # 启动时预先建立连接（HEAD 请求，不访问任何接口）
+
+    @classmethod
+    def from_dict(cls, config: Optional[Dict]) -> 'TransportConfig':
+        config = config or {}
+        names = {f.name for f in fields(cls)}
+        unknown = set(config) - names
+        if unknown:
+            raise ValueError(f"Unknown transport settings: {', '.join(sorted(unknown))}")
+        return cls(**config)
+
+    @property
+    def timeout(self) -> 'httpx.Timeout':
+        import httpx
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        )
+
+    @property
+    def limits(self) -> 'httpx.Limits':
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    @property
+    def use_http2(self) -> bool:
+        """HTTP/2 需要可选依赖 h2，未安装时退回 HTTP/1.1"""
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, falling back to HTTP/1.1")
+            return False
+        return self.http2
+
+
+class PoolStats:
+    """连接池使用统计：请求数、等待响应头的请求数与 5xx 错误数"""
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def on_complete(self, response=None):
+        """请求结束（收到响应头或传输层出错），出错时 response 为 None"""
+        with self._lock:
+            self.in_flight -= 1
+            if response is not None and response.status_code >= 500:
+                self.errors += 1
+
+
+class _CountingTransport:
+    """包装 httpx 传输层，在 handle_request 前后维护 PoolStats，连接超时等传输错误同样计入请求结束"""
+    def __init__(self, transport, stats: PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    @property
+    def _pool(self):
+        # 供 pool_connections 读取内部连接池
+        return getattr(self._transport, "_pool", None)
+
+    def handle_request(self, request):
+        self._stats.on_request()
+        response = None
+        try:
+            response = self._transport.handle_request(request)
+            return response
+        finally:
+            self._stats.on_complete(response)
+
+    def close(self):
+        self._transport.close()
+
+    def __enter__(self):
+        self._transport.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self._transport.__exit__(*args)
+
+
+class _AsyncCountingTransport(_CountingTransport):
+    async def handle_async_request(self, request):
+        self._stats.on_request()
+        response = None
+        try:
+            response = await self._transport.handle_async_request(request)
+            return response
+        finally:
+            self._stats.on_complete(response)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    async def __aenter__(self):
+        await self._transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self._transport.__aexit__(*args)
+
+
+def build_http_client(config: TransportConfig, stats: PoolStats) -> 'httpx.Client':
+    """创建带连接池与超时设置的同步 httpx 客户端"""
+    import httpx
+    transport = httpx.HTTPTransport(limits=config.limits, http2=config.use_http2)
+    # limits/http2 仍传给客户端，供按环境变量创建的代理传输层使用
+    return httpx.Client(
+        timeout=config.timeout,
+        limits=config.limits,
+        http2=config.use_http2,
+        transport=_CountingTransport(transport, stats)
+    )
+
+
+def build_async_http_client(config: TransportConfig, stats: PoolStats) -> 'httpx.AsyncClient':
+    """创建带连接池与超时设置的异步 httpx 客户端"""
+    import httpx
+    transport = httpx.AsyncHTTPTransport(limits=config.limits, http2=config.use_http2)
+    # limits/http2 仍传给客户端，供按环境变量创建的代理传输层使用
+    return httpx.AsyncClient(
+        timeout=config.timeout,
+        limits=config.limits,
+        http2=config.use_http2,
+        transport=_AsyncCountingTransport(transport, stats)
+    )
+
+
+def pool_connections(client) -> Dict[str, int]:
+    """读取 httpcore 连接池中的连接数（依赖 httpx 内部结构，不可用时返回空）"""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return {}
+    idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+    return {"connections": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+def client_busy(client) -> bool:
+    """客户端是否仍有进行中的请求：等待响应头，或连接仍在读取流式响应体"""
+    stats = getattr(getattr(client, "_transport", None), "_stats", None)
+    if stats is not None and stats.in_flight > 0:
+        return True
+    return pool_connections(client).get("active", 0) > 0
+
+
+def warm_up(client: 'httpx.Client', url: str) -> Optional[float]:
+    """
+    向供应商地址发送 HEAD 请求以预先完成 DNS/TCP/TLS 握手，返回耗时；失败时返回 None
+    HEAD 不带认证信息、没有响应体，不会触发任何接口，响应状态码（如 404/405）无关紧要
+    """
+    import httpx
+    start = time.perf_counter()
+    try:
+        client.head(url)
+    except httpx.HTTPError:
+        return None
+    return time.perf_counter() - start
+
+
+async def async_warm_up(client: 'httpx.AsyncClient', url: str) -> Optional[float]:
+    import httpx
+    start = time.perf_counter()
+    try:
+        await client.head(url)
+    except httpx.HTTPError:
+        return None
+    return time.perf_counter() - start
@@ -1,10 +1,22 @@
 import streamlit as st
-from typing import List, Tuple, Optional
-from modules.chat_engine import Message
+from typing import Callable, List, Tuple, Optional
+from modules.catalog import ModelCatalog
+from modules.chat_engine import Message, Reply
+from modules.file_cache import read_cached
+from modules.markdown_renderer import IncrementalMarkdown, render_markdown
+from collections import OrderedDict
 import time
 import html
 
+def _style_tag(css: str) -> str:
+    return f"<style>{css}</style>"
+
 class ChatUI:
+    # 历史窗口分页大小；渲染缓存的上限随窗口变化，只保留当前可见消息的 HTML
+    HISTORY_PAGE_SIZE = 20
+    # 对比模式最多同时请求的模型数
+    COMPARE_MAX_MODELS = 4
+
     def __init__(self):
         # 初始化session state
         if "messages" not in st.session_state:
@@ -13,9 +25,29 @@ class ChatUI:
             st.session_state.current_api = None
         if "current_model" not in st.session_state:
             st.session_state.current_model = None
+        if "render_cache" not in st.session_state:
+            st.session_state.render_cache = OrderedDict()
+        if "history_window" not in st.session_state:
+            st.session_state.history_window = self.HISTORY_PAGE_SIZE
+        if "conversation_id" not in st.session_state:
+            st.session_state.conversation_id = None
+        if "has_earlier" not in st.session_state:
+            st.session_state.has_earlier = False
+        if "compare_results" not in st.session_state:
+            st.session_state.compare_results = None
+        if "generation" not in st.session_state:
+            st.session_state.generation = None  # 本会话进行中的后台生成 {id, offset, state, target}
             
-    def render_sidebar(self, apis: dict) -> Tuple[str, str]:
-        """渲染侧边栏"""
+    @staticmethod
+    def render_css(path: str):
+        """注入自定义样式（样式标签按文件修改时间缓存，每次运行脚本不再重新读取文件）"""
+        st.markdown(read_cached(path, _style_tag), unsafe_allow_html=True)
+
+    def render_sidebar(self, catalog: ModelCatalog, on_clear: Optional[Callable[[], None]] = None) -> Tuple[str, str]:
+        """
+        渲染侧边栏（选项直接取自预先计算的模型目录）
+        on_clear: 清空对话前调用，用于停止本会话进行中的生成
+        """
         with st.sidebar:
             st.markdown("""
                 <div class="sidebar-header">
@@ -24,45 +56,31 @@ class ChatUI:
             """, unsafe_allow_html=True)
             
             # API选择
+            providers = catalog.providers
             api_name = st.selectbox(
                 "选择模型供应商",
-                options=list(apis.keys()),
-                index=0 if st.session_state.current_api is None 
-                else list(apis.keys()).index(st.session_state.current_api),
+                options=providers,
+                index=providers.index(st.session_state.current_api)
+                if st.session_state.current_api in providers
+                else 0,
                 format_func=lambda x: x.title()  # 首字母大写
             )
             
-            # 模型选择
-            models = apis[api_name]["model_list"]
-            
-            # 为 volcengine 添加特殊处理
-            if api_name == "volcengine":
-                # 从注释中提取模型名称
-                model_names = {}
-                for model in models:
-                    if '#' in model:
-                        model_id, model_name = model.split('#')
-                        model_names[model_id.strip()] = model_name.strip()
-                
-                # 清理model_list中的注释
-                clean_models = [m.split('#')[0].strip() for m in models]
-                
-                model = st.selectbox(
-                    "选择模型",
-                    options=clean_models,
-                    index=clean_models.index(st.session_state.current_model) 
-                    if st.session_state.current_model in clean_models 
-                    else 0,
-                    format_func=lambda x: model_names.get(x, x)  # 使用注释中的名称显示
-                )
-            else:
-                model = st.selectbox(
-                    "选择模型",
-                    options=models,
-                    index=models.index(st.session_state.current_model) 
-                    if st.session_state.current_model in models 
-                    else 0
-                )
+            # 模型选择（显示名称来自目录，如 volcengine 接入点 id 后的注释，并标出推理/图片能力）
+            models = catalog.models(api_name)
+            ids = [info.model for info in models]
+            names = {
+                info.model: info.display_name + (" 🧠" if info.reasoning else "") + (" 🖼️" if info.vision else "")
+                for info in models
+            }
+            model = st.selectbox(
+                "选择模型",
+                options=ids,
+                index=ids.index(st.session_state.current_model)
+                if st.session_state.current_model in ids
+                else 0,
+                format_func=names.get
+            )
             
             # 分隔线
             st.markdown("---")
@@ -71,7 +89,15 @@ class ChatUI:
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("🗑️ 清空对话", use_container_width=True):
+                    if on_clear is not None:
+                        on_clear()
                     st.session_state.messages = []
+                    st.session_state.render_cache.clear()
+                    st.session_state.history_window = self.HISTORY_PAGE_SIZE
+                    st.session_state.conversation_id = None
+                    st.session_state.has_earlier = False
+                    st.session_state.compare_results = None
+                    st.session_state.generation = None
                     st.rerun()
             with col2:
                 if st.button("⚙️ 更多设置", use_container_width=True):
@@ -79,18 +105,195 @@ class ChatUI:
                 
             return api_name, model
 
-    # 统一转义逻辑
-    def escape_content(self,content):
-        """递归转义字符串或字典中的 HTML 特殊字符"""
-        if isinstance(content, dict):
-            return {k: self.escape_content(v) for k, v in content.items()}
-        elif isinstance(content, str):
-            return html.escape(content)
-        return content
-                
+    def render_compare_settings(self, catalog: ModelCatalog) -> List[Tuple[str, str]]:
+        """在侧边栏渲染对比模式设置，返回选中的 (供应商, 模型) 列表；未开启或少于两个时返回空列表"""
+        with st.sidebar:
+            if not st.toggle("🆚 多模型对比", key="compare_mode"):
+                return []
+            targets = st.multiselect(
+                "同时发送给",
+                options=[info.key for info in catalog],
+                format_func=lambda target: catalog.get(*target).label,
+                max_selections=self.COMPARE_MAX_MODELS,
+                key="compare_targets"
+            )
+            if len(targets) < 2:
+                st.caption("请至少选择两个模型")
+                return []
+            return targets
+
+    def render_compare_columns(self, labels: List[str]) -> List[Tuple[object, object]]:
+        """为每个对比模型创建一列，返回各列的 (指标占位, 消息占位)"""
+        slots = []
+        for column, label in zip(st.columns(len(labels)), labels):
+            with column:
+                st.markdown(f"**{html.escape(label)}**")
+                stats = st.empty()
+                stats.caption("等待首字…")
+                message = st.empty()
+                slots.append((stats, message))
+        return slots
+
+    @staticmethod
+    def format_compare_stats(ttft: Optional[float], tokens_per_sec: Optional[float] = None,
+                             error: Optional[str] = None) -> str:
+        """对比列的指标说明：首字延迟与输出速度"""
+        if error:
+            return f"❌ {error}"
+        parts = ["首字 -" if ttft is None else f"首字 {ttft:.2f}s"]
+        if tokens_per_sec is not None:
+            parts.append(f"{tokens_per_sec:.1f} tokens/s")
+        return " · ".join(parts)
+
+    def render_compare_results(self, results: List[dict]) -> Optional[int]:
+        """渲染已完成的对比结果，返回用户选择采用的回答序号"""
+        selected = None
+        for index, (column, result) in enumerate(zip(st.columns(len(results)), results)):
+            with column:
+                st.markdown(f"**{html.escape(result['label'])}**")
+                st.caption(result["stats"])
+                if result["message"] is not None:
+                    self.render_message(result["message"])
+                    if st.button("✅ 采用此回答", key=f"adopt_{index}", use_container_width=True):
+                        selected = index
+        return selected
+
+    def render_conversations(self, conversations: List[dict], current_id: Optional[str]) -> Optional[str]:
+        """在侧边栏列出历史会话，返回用户选择的会话 id（选择新对话时返回空字符串）"""
+        selected = None
+        with st.sidebar:
+            with st.expander("💬 历史对话", expanded=False):
+                if st.button("➕ 新对话", key="new_conversation", use_container_width=True):
+                    selected = ""
+                for conversation in conversations:
+                    label = conversation["title"]
+                    if conversation["id"] == current_id:
+                        label = "▶ " + label
+                    if st.button(label, key=f"conversation_{conversation['id']}", use_container_width=True):
+                        selected = conversation["id"]
+        return selected
+
+    def render_knowledge_base(self, documents: List[dict]) -> Tuple[list, Optional[int]]:
+        """在侧边栏渲染本地知识库，返回 (新上传的文件, 要删除的文档 id)"""
+        if "kb_uploader" not in st.session_state:
+            st.session_state.kb_uploader = 0
+        deleted = None
+        with st.sidebar:
+            with st.expander(f"📚 知识库（{len(documents)}）", expanded=False):
+                uploads = st.file_uploader(
+                    "添加文档", type=["txt", "md"], accept_multiple_files=True,
+                    key=f"kb_upload_{st.session_state.kb_uploader}"
+                )
+                for document in documents:
+                    col1, col2 = st.columns([4, 1])
+                    col1.caption(f"{document['source']}（{document['chunks']} 块）")
+                    if col2.button("🗑️", key=f"kb_delete_{document['id']}"):
+                        deleted = document["id"]
+        if uploads:
+            # 更换上传组件的 key 以清空已处理的文件，避免重新运行时重复入库
+            st.session_state.kb_uploader += 1
+        return uploads or [], deleted
+
+    @staticmethod
+    def _format_bytes(size: int) -> str:
+        for unit in ("B", "KB", "MB"):
+            if size < 1024:
+                return f"{size:.0f}{unit}"
+            size /= 1024
+        return f"{size:.1f}GB"
+
+    def render_metrics(self, summary: dict, pool_stats: Optional[dict] = None,
+                       session_hit_rate: Optional[float] = None, memory: Optional[dict] = None):
+        """在侧边栏按供应商/模型展示最近请求的延迟统计、前缀缓存命中率、连接池使用情况与本会话内存占用"""
+        with st.sidebar:
+            with st.expander("⏱️ 性能统计", expanded=False):
+                if session_hit_rate is not None:
+                    st.caption(f"本会话前缀缓存命中率：{session_hit_rate:.0%}")
+                if memory is not None:
+                    st.caption(
+                        f"本会话内存：{memory['messages']}条消息 "
+                        f"常驻{self._format_bytes(memory['resident_bytes'])}，"
+                        f"外置{self._format_bytes(memory['spilled_bytes'])}，"
+                        f"渲染缓存{self._format_bytes(memory['render_cache_bytes'])}"
+                    )
+                if pool_stats:
+                    st.caption("连接池")
+                    st.dataframe(
+                        [{"供应商": name, **stats} for name, stats in pool_stats.items() if stats["requests"]],
+                        hide_index=True, use_container_width=True
+                    )
+                if not summary:
+                    st.caption("暂无请求记录")
+                    return
+                fmt = lambda v, unit="s": "-" if v is None else f"{v:.2f}{unit}"
+                rows = []
+                for (api_name, model), stats in sorted(summary.items()):
+                    rows.append({
+                        "供应商": api_name,
+                        "模型": model.split('#')[0],
+                        "请求数": stats["requests"],
+                        "错误": stats["errors"],
+                        "首字 p50": fmt(stats["ttft_p50"]),
+                        "首字 p99": fmt(stats["ttft_p99"]),
+                        "tokens/s": fmt(stats["tokens_per_sec"], ""),
+                        "分块间隔 p99": fmt(stats["gap_p99"]),
+                        "前缀缓存命中": fmt(stats["prefix_cache_hit_rate"] and stats["prefix_cache_hit_rate"] * 100, "%"),
+                        "检索 p50": fmt(stats["retrieval_p50"] and stats["retrieval_p50"] * 1000, "ms"),
+                    })
+                st.dataframe(rows, hide_index=True, use_container_width=True)
+
+    @staticmethod
+    def _message_cache_key(message: Message):
+        """根据消息角色、时间戳和内容计算缓存键（已外置的推理内容按引用比较，无需读回）"""
+        return (message.role, message.timestamp, message.content)
+
+    def cached_message_html(self, cache: "OrderedDict[tuple, str]", message: Message, limit: int) -> str:
+        """
+        取单条历史消息的 HTML，按消息内容缓存，最多保留 limit 条
+        推理内容已外置的消息不缓存：HTML 中包含读回的推理正文，缓存会让它整个会话常驻内存
+        """
+        if isinstance(message.content, Reply) and message.content.reasoning_spilled:
+            return self.build_message_html(message)
+        key = self._message_cache_key(message)
+        message_html = cache.get(key)
+        if message_html is None:
+            message_html = self.build_message_html(message)
+            cache[key] = message_html
+            while len(cache) > limit:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return message_html
+
     def render_message(self,message:Message):
         """
-        渲染单条历史消息
+        渲染单条历史消息（HTML 按消息内容缓存，重复渲染时不再重新拼接）
+        """
+        message_html = self.cached_message_html(
+            st.session_state.render_cache, message, st.session_state.history_window
+        )
+        st.markdown(message_html, unsafe_allow_html=True)
+
+    def render_history(self, messages: List[Message], has_earlier: bool = False):
+        """
+        渲染历史消息窗口：只渲染最近的若干条，更早的消息按需分页加载
+        has_earlier 表示存储中还有尚未加载到内存的更早消息
+        """
+        window = st.session_state.history_window
+        hidden = len(messages) - window
+        if hidden > 0 or has_earlier:
+            label = f"⬆️ 加载更早的消息（还有{hidden}条）" if hidden > 0 and not has_earlier else "⬆️ 加载更早的消息"
+            if st.button(label, key="load_earlier", use_container_width=True):
+                st.session_state.history_window += self.HISTORY_PAGE_SIZE
+                st.rerun()
+            messages = messages[max(hidden, 0):]
+
+        for message in messages:
+            self.render_message(message)
+
+    def build_message_html(self,message:Message) -> str:
+        """
+        生成单条历史消息的 HTML
         """
         user_avatar = "https://api.dicebear.com/9.x/fun-emoji/svg?seed=Liam"
         assistant_avatar = "https://api.dicebear.com/9.x/bottts/svg?seed=Destiny"
@@ -98,11 +301,11 @@ class ChatUI:
         avatar_url = user_avatar if message.role == "user" else assistant_avatar
         content = message.content
         
-        # 若为助手消息且内容为字典，则分离思考过程和回答部分
+        # 若为助手消息，则分离思考过程和回答部分
         if message.role == "assistant":
-            reasoning = content.get("reasoning","").strip()
-            answer = content.get("content", "").strip()
-            elapsed = content.get("elapsed", None)  # 耗时秒数，由主流程传入保存
+            reasoning = content.reasoning.strip()
+            answer = content.content.strip()
+            elapsed = content.elapsed  # 耗时秒数，由主流程传入保存
             if reasoning:
                 header = "思考完成"
                 if elapsed is not None:
@@ -110,15 +313,16 @@ class ChatUI:
                 thought_html = (
                     f'<details class="assistant-thought" open>'
                     f'<summary>{header}</summary>'
-                    f'<p>{reasoning}</p>'
+                    f'<div class="thought-body">{render_markdown(reasoning)}</div>'
                     f'</details>'
                 )
-                answer_html = f'<div class="assistant-answer">{answer}</div>'
+                answer_html = f'<div class="assistant-answer">{render_markdown(answer)}</div>'
                 message_content = thought_html + answer_html
             else:
-                message_content = f'<div class="assistant-answer">{answer}</div>'
+                message_content = f'<div class="assistant-answer">{render_markdown(answer)}</div>'
         else:
-            message_content = html.escape(content)
+            # 用户输入按原文显示，不做 Markdown 转换
+            message_content = html.escape(content).replace("\n", "<br/>")
 
         message_html = (
             '<div class="message ' + message.role + '">'
@@ -127,8 +331,7 @@ class ChatUI:
             '<div class="timestamp">' + time.strftime("%H:%M", time.localtime(message.timestamp)) + '</div>'
             '</div></div>'
         )
-
-        st.markdown(message_html, unsafe_allow_html=True)
+        return message_html
 
     def get_user_input_with_upload(self):
         """获取用户输入和上传文件"""
@@ -158,38 +361,53 @@ class ChatUI:
         """
         st.markdown(animation_html, unsafe_allow_html=True)
     
+    def streaming_renderer(self) -> Callable[..., str]:
+        """
+        创建一次流式响应使用的渲染函数（参数与 render_streaming_message 一致）：
+        正文与思考过程各用一个 IncrementalMarkdown，每帧只转换新到达的文本
+        """
+        answer, thought = IncrementalMarkdown(), IncrementalMarkdown()
+
+        def render(content="", reasoning="", elapsed=None, under_reasoning=False, is_reasoner=False) -> str:
+            return self._streaming_html(
+                answer.update(content or ""), thought.update(reasoning or ""), elapsed, under_reasoning, is_reasoner
+            )
+        return render
+
     def render_streaming_message(self,content="", reasoning="", elapsed=None, under_reasoning=False,is_reasoner=False):
-        """渲染流式响应消息"""
+        """渲染流式响应消息（每次完整转换全文，逐帧渲染请使用 streaming_renderer）"""
+        return self._streaming_html(
+            render_markdown(content or ""), render_markdown(reasoning or ""), elapsed, under_reasoning, is_reasoner
+        )
+
+    @staticmethod
+    def _streaming_html(content_html: str, reasoning_html: str, elapsed=None, under_reasoning=False,
+                        is_reasoner=False) -> str:
+        """由已转换的正文与思考过程 HTML 拼接流式消息"""
         assistant_avatar = "https://api.dicebear.com/9.x/bottts/svg?seed=Destiny"
         
         if is_reasoner:
             if under_reasoning:
                 # 不显示正文内容部分
                 header = '<span class="dynamic-thinking">深度思考中...</span>'
-                thought_display = (
-                    f'<details class="assistant-thought" open>'
-                    f'<summary>{header}</summary>'
-                    f'<p>{reasoning}</p>'
-                    f'</details>'
-                )
                 answer_display = ""
             else:
                 # 流式完成后显示耗时信息，同时显示正文内容部分
                 header = f"思考完成（用时{elapsed}秒）"
-                thought_display = (
-                    f'<details class="assistant-thought" open>'
-                    f'<summary>{header}</summary>'
-                    f'<p>{reasoning}</p>'
-                    f'</details>'
-                )
-                answer_display = f'<div class="assistant-answer">{content}</div>'
+                answer_display = f'<div class="assistant-answer">{content_html}</div>'
+            thought_display = (
+                f'<details class="assistant-thought" open>'
+                f'<summary>{header}</summary>'
+                f'<div class="thought-body">{reasoning_html}</div>'
+                f'</details>'
+            )
             combined = thought_display + answer_display
         else:
-            combined = f'<div class="assistant-answer">{content}</div>'
+            combined = f'<div class="assistant-answer">{content_html}</div>'
         
         html_ = (
             '<div class="message assistant">'
             '<div class="avatar"><img src="' + assistant_avatar + '" alt="avatar"/></div>'
             '<div class="content"><div class="bubble">' + combined + '</div></div></div>'
         )
-        return html_
\ No newline at end of file
+        return html_
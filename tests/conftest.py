@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 测试直接导入 modules 包，与 benchmarks 中的脚本一样把仓库根目录加入搜索路径
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+
+from modules.async_engine import AsyncChatEngine, GenerationGroup, GenerationHandle, GenerationRegistry
+from modules.chat_engine import Message
+
+
+class FakeEngine(AsyncChatEngine):
+    """不访问供应商的引擎：先产出给定的分块，然后一直等待，被取消时模拟关闭上游连接的耗时"""
+    def __init__(self, chunks, hang: bool = True, close_delay: float = 0.2, error: Exception = None):
+        self.chunks = chunks
+        self.hang = hang
+        self.close_delay = close_delay
+        self.error = error
+        self.closed = threading.Event()
+
+    async def astream_response(self, messages, rag_context=None, use_cache=True, collector=None):
+        try:
+            for kind, text in self.chunks:
+                yield collector.add(kind, text)
+            if self.error is not None:
+                raise self.error
+            if self.hang:
+                await asyncio.sleep(3600)
+        finally:
+            # 取消时仍在清理，期间再追加的内容也要计入部分答案
+            await asyncio.sleep(self.close_delay)
+            collector.add("content", "!")
+            self.closed.set()
+
+
+def history():
+    return [Message(role="user", content="hi")]
+
+
+def test_wait_blocks_until_cancelled_task_unwinds():
+    engine = FakeEngine([("reasoning", "thinking"), ("content", "partial")])
+    handle = engine.start(history())
+    chunks = iter(handle)
+    assert next(chunks)["type"] == "reasoning"
+    assert next(chunks)["content"] == "partial"
+
+    handle.cancel()
+    assert handle.wait(5)
+    assert engine.closed.is_set()
+    assert handle.cancelled
+    message = handle.partial_message()
+    assert message.content.content == "partial!"
+    assert message.content.reasoning == "thinking"
+    # 在推理之后被取消，思考用时已记录
+    assert message.content.elapsed is not None and message.content.elapsed >= 0
+
+
+def test_cancel_before_start_still_finishes():
+    engine = FakeEngine([("content", "never")], close_delay=0)
+    handle = GenerationHandle()
+    handle.cancel()
+    engine.start(history(), handle=handle)
+    assert handle.wait(5)
+    assert handle.cancelled
+    assert handle.chunks == []
+
+
+def test_error_raised_after_chunks():
+    engine = FakeEngine([("content", "a")], error=RuntimeError("upstream"), close_delay=0)
+    handle = engine.start(history())
+    received = []
+    try:
+        for chunk in handle:
+            received.append(chunk["content"])
+    except RuntimeError as e:
+        assert str(e) == "upstream"
+    else:
+        raise AssertionError("expected the generation error to be raised")
+    assert received == ["a"]
+
+
+def test_follow_resumes_from_offset_and_heartbeats():
+    engine = FakeEngine([("content", "a"), ("content", "b")], close_delay=0)
+    handle = engine.start(history())
+    seen = []
+    for offset, chunk in handle.follow(heartbeat=0.05):
+        if chunk is None:
+            break
+        seen.append((offset, chunk["content"]))
+    assert seen == [(0, "a"), (1, "b")]
+    # 重新接上时从序号 1 继续，不再重复已读到的分块
+    assert next(handle.follow(1, heartbeat=0.05)) == (1, {"type": "content", "content": "b"})
+    handle.cancel()
+    assert handle.wait(5)
+
+
+def test_group_reports_each_finished_handle():
+    group = GenerationGroup(2)
+    for handle, text in zip(group.handles, ("x", "y")):
+        FakeEngine([("content", text)], hang=False, close_delay=0).start(history(), handle=handle)
+    finished = [index for index, chunk in group if chunk is None]
+    assert sorted(finished) == [0, 1]
+    assert group.done
+
+
+def test_registry_expires_finished_handles():
+    registry = GenerationRegistry(ttl=0)
+    handle = GenerationHandle()
+    generation_id = registry.add(handle)
+    assert registry.get(generation_id) is handle
+    handle._finalize()
+    assert registry.get(generation_id) is None
+
+
+def test_group_error_in_one_model_does_not_affect_the_others():
+    group = GenerationGroup(2)
+    FakeEngine([("content", "x")], hang=False, close_delay=0, error=RuntimeError("down")).start(
+        history(), handle=group.handles[0])
+    FakeEngine([("content", "y")], hang=False, close_delay=0.1).start(history(), handle=group.handles[1])
+    received = {0: "", 1: ""}
+    for index, chunk in group:
+        if chunk is not None:
+            received[index] += chunk["content"]
+    assert received == {0: "x", 1: "y"}
+    assert isinstance(group.handles[0].error, RuntimeError)
+    assert group.handles[1].error is None
+    assert group.handles[1].partial_message().content.content == "y!"
+
+
+def test_detached_generation_can_be_reattached_by_id():
+    registry = GenerationRegistry()
+    engine = FakeEngine([("content", "a"), ("content", "b"), ("content", "c")], hang=False, close_delay=0.05)
+    generation_id = registry.add(engine.start(history()))
+
+    # 第一次脚本运行只读到一个分块就被中断
+    first = registry.get(generation_id)
+    offset, chunk = next(first.follow())
+    assert chunk["content"] == "a"
+
+    # 重新运行后凭 id 取回同一个生成，从下一个序号继续读完
+    handle = registry.get(generation_id)
+    assert handle is first
+    rest = [chunk["content"] for _, chunk in handle.follow(offset + 1)]
+    assert rest == ["b", "c"]
+    assert handle.done and handle.partial_message().content.content == "abc!"
+    registry.release(generation_id)
+    assert registry.get(generation_id) is None and len(registry) == 0
@@ -0,0 +1,75 @@
+import asyncio
+from collections import defaultdict
+import json
+
+from batch import BatchRunner, parse_provider_concurrency
+from modules.chat_engine import Message, ResponseCollector
+from modules.router import ModelRouter, Endpoint
+
+import pytest
+
+
+class FakeManager:
+    def __init__(self, aliases):
+        self.router = ModelRouter(aliases)
+
+
+class FakeEngine:
+    def __init__(self, target):
+        self.last_metrics = {"api": target.api_name, "model": target.model, "ttft": 0.01}
+        self.last_context_stats = {}
+
+
+class RecordingRunner(BatchRunner):
+    """不访问供应商，记录每个供应商同时进行的请求数"""
+    def __init__(self, *args, fail=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail = set(fail)
+        self.active = defaultdict(int)
+        self.peak = defaultdict(int)
+
+    async def _stream(self, item, target):
+        self.active[target.api_name] += 1
+        self.peak[target.api_name] = max(self.peak[target.api_name], self.active[target.api_name])
+        await asyncio.sleep(0.01)
+        self.active[target.api_name] -= 1
+        collector = ResponseCollector()
+        if target.api_name in self.fail:
+            return FakeEngine(target), collector, RuntimeError("upstream down")
+        collector.add("content", f"from {target.api_name}")
+        collector.finish()
+        return FakeEngine(target), collector, None
+
+
+def items(specs):
+    return [{"id": str(i), "endpoint": Endpoint.parse(spec), "messages": [Message(role="user", content="q")]}
+            for i, spec in enumerate(specs)]
+
+
+def test_alias_requests_count_against_the_resolved_provider(tmp_path):
+    manager = FakeManager({"fast": {"endpoints": ["a/m1", "b/m2"]}})
+    runner = RecordingRunner(manager, str(tmp_path / "out.jsonl"), concurrency=2)
+    asyncio.run(runner.run(items(["auto/fast"] * 12 + ["a/m1"] * 6)))
+
+    assert runner.peak["a"] <= 2 and runner.peak["b"] <= 2
+    assert "auto" not in runner.peak
+    served = {record["served_by"] for record in runner.records if record["api"] == "auto"}
+    assert served == {"a/m1", "b/m2"}
+    assert all(record["error"] is None for record in runner.records)
+    lines = (tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 18 and json.loads(lines[0])["content"].startswith("from ")
+
+
+def test_alias_falls_over_to_the_next_endpoint(tmp_path):
+    manager = FakeManager({"fast": {"endpoints": ["a/m1", "b/m2"]}})
+    runner = RecordingRunner(manager, str(tmp_path / "out.jsonl"), concurrency=1, fail={"a"})
+    asyncio.run(runner.run(items(["auto/fast", "a/m1"])))
+    by_id = {record["id"]: record for record in runner.records}
+    assert by_id["0"]["served_by"] == "b/m2" and by_id["0"]["error"] is None
+    assert by_id["1"]["error"] == "RuntimeError: upstream down"
+
+
+def test_parse_provider_concurrency():
+    assert parse_provider_concurrency(["groq=2", "a=10"]) == {"groq": 2, "a": 10}
+    with pytest.raises(ValueError):
+        parse_provider_concurrency(["groq=0"])
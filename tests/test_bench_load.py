@@ -0,0 +1,21 @@
+from benchmarks.bench_load import NullPlaceholder, capacity
+
+
+def level(sessions, saturated):
+    return {"sessions": sessions, "saturated": saturated}
+
+
+def test_capacity_is_the_last_level_before_saturation():
+    assert capacity([level(1, False), level(10, False), level(25, True)]) == 10
+    # 已饱和级别之后的级别即使恢复也不计入
+    assert capacity([level(50, False), level(1, False), level(10, True)]) == 1
+    assert capacity([level(1, True)]) is None
+    assert capacity([]) is None
+
+
+def test_null_placeholder_counts_frames_and_bytes():
+    placeholder = NullPlaceholder()
+    placeholder.markdown("你好", unsafe_allow_html=True)
+    placeholder.markdown("ab")
+    assert placeholder.frames == 2
+    assert placeholder.bytes == len("你好".encode("utf-8")) + 2
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+import os
+
+import pytest
+
+from modules.catalog import ModelCatalog, parse_model_entry
+from modules.file_cache import file_version, read_cached
+
+
+def api_config(**overrides):
+    config = dict(url="https://example.com/v1", model_list=[], vision_models=None, reasoning_models=None,
+                  context_windows=None, context_window=None, list_discovered=False, allow_unlisted=False,
+                  discover_models=True)
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+def test_parse_model_entry():
+    assert parse_model_entry("ep-123#deepseek-v3") == ("ep-123", "deepseek-v3")
+    assert parse_model_entry(" gpt-4 ") == ("gpt-4", "gpt-4")
+
+
+def test_catalog_build_and_lookup():
+    configs = {
+        "a": api_config(model_list=["m1", "ep-1#Pretty"], vision_models=["m1"], reasoning_models=["ep-1"],
+                        context_window=1000, context_windows={"ep-1": 500}),
+        "open": api_config(model_list=["x"], allow_unlisted=True),
+    }
+    catalog = ModelCatalog.build(configs, {"alias": {}}, "auto")
+    assert catalog.providers == ("a", "open", "auto")
+    assert [info.label for info in catalog.models("a")] == ["a / m1", "a / Pretty"]
+    m1, ep = catalog.models("a")
+    assert m1.vision and not m1.reasoning and m1.context_window == 1000
+    assert ep.reasoning and ep.context_window == 500
+    assert ("auto", "alias") in catalog
+    assert catalog.accepts("open", "anything")
+    assert not catalog.accepts("a", "anything")
+    with pytest.raises(ValueError):
+        catalog.models("missing")
+
+
+def test_read_cached_reparses_only_when_the_file_changes(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("one", encoding="utf-8")
+    calls = []
+
+    def parse(text):
+        calls.append(text)
+        return text.upper()
+
+    assert read_cached(str(path), parse) == "ONE"
+    assert read_cached(str(path), parse) == "ONE"
+    assert read_cached(str(path)) == "one"
+    assert calls == ["one"]
+
+    version = file_version(str(path))
+    path.write_text("two!", encoding="utf-8")
+    os.utime(path, ns=(version[0] + 1_000_000, version[0] + 1_000_000))
+    assert read_cached(str(path), parse) == "TWO!"
+    assert calls == ["one", "two!"]
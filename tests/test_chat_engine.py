@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+from modules.chat_engine import ChatEngine, Message
+from modules.metrics import MetricsHub
+
+
+class FakeClient:
+    api_name, model = "api", "model"
+
+    def __init__(self):
+        self.recorded = []
+
+    def record_usage(self, completion_tokens):
+        self.recorded.append(completion_tokens)
+
+
+class FakeAPIManager:
+    """只提供 ChatEngine 用到的接口；每次请求返回一段固定的流并带上前缀缓存用量"""
+    def __init__(self, budget=10000, cached_tokens=64):
+        self.budget = budget
+        self.cached_tokens = cached_tokens
+        self.metrics = MetricsHub()
+        self.response_cache = None
+        self.client = FakeClient()
+        self.contexts = []
+
+    def validate_model(self, api_name, model):
+        return True
+
+    def get_context_budget(self, api_name, model):
+        return self.budget
+
+    def get_image_policy(self, api_name, model):
+        return None
+
+    def get_think_tags(self, api_name):
+        return None
+
+    def open_stream(self, api_name, model, context):
+        self.contexts.append(context)
+        usage = {"prompt_tokens": 100, "completion_tokens": 2, "prompt_cache_hit_tokens": self.cached_tokens}
+        chunks = [
+            SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content="<think>r</think>ok"))]),
+            SimpleNamespace(usage=usage, choices=[]),
+        ]
+        return self.client, iter(chunks)
+
+
+def engine(**kwargs):
+    engine = ChatEngine(FakeAPIManager(**kwargs), system_prompt="sys")
+    engine.set_model("api", "model")
+    return engine
+
+
+def run_turn(engine, messages, rag_context=None):
+    generator = engine.get_response(messages, rag_context, use_cache=False)
+    try:
+        while True:
+            next(generator)
+    except StopIteration as stop:
+        return stop.value
+
+
+def test_context_prefix_only_grows_across_turns_with_references():
+    chat = engine(budget=400)
+    messages = []
+    previous = None
+    compactions = 0
+    for turn in range(8):
+        messages.append(Message(role="user", content=f"question {turn} " + "x" * 200))
+        reply = run_turn(chat, messages, rag_context=f"reference for turn {turn}")
+        context = chat.api_manager.contexts[-1]
+        assert context[0] == {"role": "system", "content": "sys"}
+        assert context[-1]["content"].startswith("以下是从本地知识库检索到的参考资料")
+        assert f"reference for turn {turn}" in context[-1]["content"]
+        # 参考资料只附在本轮提问上，之前的消息保持不变；只有超出预算重新压缩的那一轮前缀会变化
+        if previous is not None and len(context) > len(previous):
+            assert context[:len(previous) - 1] == previous[:-1]
+        elif previous is not None:
+            compactions += 1
+        previous = context
+        messages.append(reply)
+    assert reply.content.content == "ok" and reply.content.reasoning == "r"
+    assert compactions == 1
+    assert chat.last_context_stats["dropped"] > 0
+
+
+def test_prefix_cache_accounting():
+    chat = engine(cached_tokens=75)
+    assert chat.prefix_cache_hit_rate is None
+    messages = [Message(role="user", content="hi")]
+    run_turn(chat, messages)
+    run_turn(chat, messages)
+    assert chat.prefix_cache == {"prompt_tokens": 200, "cached_tokens": 150}
+    assert chat.prefix_cache_hit_rate == 0.75
+    assert chat.api_manager.client.recorded == [2, 2]
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from modules.api_manager import RELOAD_CHECK_INTERVAL, APIManager
+
+CONFIG = """
+apis:
+  a:
+    url: https://a.example.com/v1
+    key: key-a
+    model_list: [m1]
+  b:
+    url: https://b.example.com/v1
+    key: key-b
+    model_list: [m2]
+aliases:
+  m:
+    endpoints: [a/m1, b/m2]
+model_discovery:
+  enabled: false
+"""
+
+
+def write(path, text):
+    """写入配置并推进修改时间，保证文件版本变化"""
+    version = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    stamp = max(os.stat(path).st_mtime_ns, version + 1_000_000)
+    os.utime(path, ns=(stamp, stamp))
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.delenv("AWESOMEAI_METRICS_JSONL", raising=False)
+    monkeypatch.delenv("AWESOMEAI_METRICS_PORT", raising=False)
+    path = tmp_path / "api_config.yaml"
+    write(path, CONFIG)
+    return APIManager(str(path))
+
+
+def check(manager):
+    manager._last_reload_check -= RELOAD_CHECK_INTERVAL
+    return manager.maybe_reload()
+
+
+def test_unchanged_file_is_not_reloaded(manager):
+    assert check(manager) is None
+
+
+def test_only_changed_providers_are_reported(manager):
+    write(manager._config_path, CONFIG.replace("model_list: [m2]", "model_list: [m2, m3]"))
+    assert check(manager) == ["b"]
+    assert manager.get_available_models("b") == ["m2", "m3"]
+    assert manager.get_available_models("a") == ["m1"]
+
+
+def test_invalid_config_keeps_the_current_one(manager):
+    write(manager._config_path, CONFIG.replace("model_list: [m1]", "model_list:"))
+    assert check(manager) is None
+    assert "model_list" in manager.reload_error
+    assert manager.get_available_models("a") == ["m1"]
+    # 同一个无效版本不会反复重试
+    manager.reload_error = None
+    assert check(manager) is None and manager.reload_error is None
+
+    write(manager._config_path, CONFIG.replace("model_list: [m1]", "model_list: [m1, m4]"))
+    assert check(manager) == ["a"]
+    assert manager.reload_error is None
+
+
+def test_alias_with_unknown_provider_is_rejected(manager):
+    write(manager._config_path, CONFIG.replace("[a/m1, b/m2]", "[a/m1, c/m2]"))
+    assert check(manager) is None
+    assert "Unknown API c" in manager.reload_error
+    assert [str(e) for e in manager.router.aliases["m"].endpoints] == ["a/m1", "b/m2"]
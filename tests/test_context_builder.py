@@ -0,0 +1,67 @@
+from modules.chat_engine import Message
+from modules.context_builder import ContextBuilder, estimate_tokens
+
+
+def conversation(turns: int, size: int = 200):
+    messages = []
+    for i in range(turns):
+        messages.append(Message(role="user", content=f"question {i} " + "q" * size))
+        messages.append(Message(role="assistant", content=f"answer {i} " + "a" * size))
+    return messages
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_everything_fits_without_summary():
+    messages = conversation(2) + [Message(role="user", content="now")]
+    builder = ContextBuilder(10000, system_prompt="be brief")
+    context = builder.build(messages)
+    assert context[0] == {"role": "system", "content": "be brief"}
+    assert [m["content"] for m in context[1:]] == [m.content for m in messages]
+    assert builder.dropped == 0
+
+
+def test_over_budget_keeps_latest_question_and_summarizes_the_rest():
+    messages = conversation(20) + [Message(role="user", content="latest question")]
+    builder = ContextBuilder(600)
+    context = builder.build(messages)
+    assert context[-1]["content"] == "latest question"
+    assert context[0]["role"] == "system" and "摘要" in context[0]["content"]
+    # 保留的历史从用户消息开始
+    assert context[1]["role"] == "user"
+    assert builder.dropped > 0
+    assert builder.prompt_tokens <= 600
+
+
+def test_summary_can_be_disabled():
+    messages = conversation(20) + [Message(role="user", content="latest")]
+    context = ContextBuilder(300, summarizer=None).build(messages)
+    assert all(m["role"] != "system" for m in context)
+    assert context[-1]["content"] == "latest"
+
+
+def test_anchor_keeps_the_prefix_stable_across_turns():
+    """沿用上一轮的截断位置时，下一轮的上下文以上一轮的上下文为前缀（只追加）"""
+    messages = conversation(20) + [Message(role="user", content="turn 0")]
+    builder = ContextBuilder(1500, system_prompt="sys")
+    previous = builder.build(messages)
+    anchor = builder.anchor
+    for turn in range(1, 3):
+        messages += [Message(role="assistant", content="ok"), Message(role="user", content=f"turn {turn}")]
+        context = builder.build(messages, anchor)
+        assert context[:len(previous)] == previous
+        assert builder.anchor is anchor
+        previous = context
+
+
+def test_extra_tokens_reduce_the_history_budget():
+    messages = conversation(10) + [Message(role="user", content="q")]
+    plain = ContextBuilder(1200)
+    plain.build(messages)
+    reserved = ContextBuilder(1200)
+    reserved.build(messages, extra_tokens=600)
+    assert reserved.dropped > plain.dropped
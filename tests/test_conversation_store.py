@@ -0,0 +1,62 @@
+import threading
+
+from modules.chat_engine import Message
+from modules.conversation_store import ConversationStore
+
+
+def test_append_and_page_backwards(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.sqlite"))
+    conversation_id = store.create_conversation("  第一个   问题\n" + "长" * 50, "api", "model")
+    for i in range(25):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = f"q{i}" if role == "user" else {"content": f"a{i}", "reasoning": "r", "elapsed": 1}
+        assert store.append_message(conversation_id, Message(role=role, content=content)) == i
+
+    assert store.count_messages(conversation_id) == 25
+    latest = store.load_messages(conversation_id, limit=10)
+    assert [m.seq for m in latest] == list(range(15, 25))
+    older = store.load_messages(conversation_id, before_seq=latest[0].seq, limit=10)
+    assert [m.seq for m in older] == list(range(5, 15))
+    assert older[0].content.content == "a5" and older[0].content.reasoning == "r"
+    assert older[1].content == "q6"
+
+    title = store.list_conversations()[0]["title"]
+    assert title.startswith("第一个 问题") and len(title) == 30
+
+
+def test_uploaded_files_are_stored_by_name(tmp_path):
+    class Upload:
+        name = "notes.txt"
+
+    store = ConversationStore(str(tmp_path / "conversations.sqlite"))
+    conversation_id = store.create_conversation("files")
+    store.append_message(conversation_id, Message(role="user", content="see file", files=[Upload()]))
+    assert store.load_messages(conversation_id)[0].files == ["notes.txt"]
+
+
+def test_concurrent_appends_get_distinct_sequence_numbers(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.sqlite"))
+    conversation_id = store.create_conversation("race")
+    seqs = []
+
+    def append():
+        for _ in range(10):
+            seqs.append(store.append_message(conversation_id, Message(role="user", content="x")))
+
+    threads = [threading.Thread(target=append) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(seqs) == list(range(40))
+
+
+def test_delete_and_disable(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.sqlite"))
+    conversation_id = store.create_conversation("")
+    assert store.list_conversations()[0]["title"] == "新对话"
+    store.append_message(conversation_id, Message(role="user", content="x"))
+    store.delete_conversation(conversation_id)
+    assert store.list_conversations() == []
+    assert store.count_messages(conversation_id) == 0
+    assert ConversationStore.from_config({"enabled": False}) is None
@@ -0,0 +1,63 @@
+import base64
+import io
+
+import pytest
+
+from modules import image_pipeline
+from modules.chat_engine import Message
+from modules.image_pipeline import DEFAULT_IMAGE_TOKENS, ImagePolicy, PreparedImage, message_images, prepare_image
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+@pytest.fixture
+def without_pillow(monkeypatch):
+    monkeypatch.setattr(image_pipeline, "Image", None)
+    monkeypatch.setattr(image_pipeline, "_pillow_checked", True)
+
+
+def test_policy_from_dict_and_strictest():
+    policy = ImagePolicy.from_dict({"max_side": 512})
+    assert policy == ImagePolicy(max_side=512)
+    with pytest.raises(ValueError, match="Unknown image settings"):
+        ImagePolicy.from_dict({"max_width": 512})
+    merged = ImagePolicy.strictest([ImagePolicy(max_side=512, quality=90), ImagePolicy(max_bytes=10, quality=70)])
+    assert (merged.max_side, merged.max_bytes, merged.quality) == (512, 10, 70)
+
+
+def test_token_estimate():
+    assert PreparedImage("image/png", "", 1024, 1024).tokens == 85 + 170 * 4
+    assert PreparedImage("image/png", "").tokens == DEFAULT_IMAGE_TOKENS
+
+
+def test_without_pillow_images_are_sent_as_is(without_pillow):
+    data = PNG_HEADER + b"\0" * 100
+    image = prepare_image(data, ImagePolicy())
+    assert image.mime == "image/png"
+    assert base64.b64decode(image.encoded) == data
+    with pytest.raises(ValueError, match="exceeds"):
+        prepare_image(data, ImagePolicy(max_bytes=50))
+    with pytest.raises(ValueError, match="Unsupported"):
+        prepare_image(b"GIF89a", ImagePolicy())
+
+
+def test_message_images_are_cached_per_policy(without_pillow):
+    upload = io.BytesIO(PNG_HEADER + b"\0" * 10)
+    broken = io.BytesIO(b"not an image")
+    message = Message(role="user", content="look", files=[upload, broken, "restored-name.png"])
+    policy = ImagePolicy()
+    images = message_images(message, policy)
+    assert len(images) == 1
+    assert message_images(message, policy) is images
+    assert message_images(message, ImagePolicy(max_side=256)) is not images
+
+
+def test_large_images_are_downscaled_and_recompressed():
+    Image = pytest.importorskip("PIL.Image")
+    source = Image.new("RGB", (3000, 2000), (200, 100, 50))
+    buf = io.BytesIO()
+    source.save(buf, format="PNG")
+    image = prepare_image(buf.getvalue(), ImagePolicy(max_side=1024, max_bytes=200_000))
+    assert image.mime == "image/jpeg"
+    assert max(image.width, image.height) <= 1024
+    assert image.size <= 200_000
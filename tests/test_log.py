@@ -0,0 +1,62 @@
+from logging.handlers import QueueListener
+import io
+import json
+import logging
+import queue
+
+from modules.log import DroppingQueueHandler, JSONFormatter, RequestIdFilter, set_request_id
+
+
+def log_through_queue(emit):
+    """按 setup_logging 的方式经队列写出一条日志，返回解析后的 JSON"""
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JSONFormatter())
+    handler = DroppingQueueHandler(queue.Queue(10))
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger("tests.log")
+    logger.propagate = False
+    logger.addHandler(handler)
+    listener = QueueListener(handler.queue, output)
+    listener.start()
+    try:
+        emit(logger)
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    return json.loads(lines[0])
+
+
+def test_exception_traceback_survives_queue():
+    def emit(logger):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("request %s failed", "abc")
+
+    entry = log_through_queue(emit)
+    assert entry["level"] == "ERROR"
+    assert entry["msg"] == "request abc failed"
+    assert "Traceback" in entry["exc"]
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_fields_and_request_id():
+    set_request_id("req-1")
+    try:
+        entry = log_through_queue(lambda logger: logger.warning("done", extra={"fields": {"tokens": 3}}))
+    finally:
+        set_request_id(None)
+    assert entry["request_id"] == "req-1"
+    assert entry["tokens"] == 3
+    assert "exc" not in entry
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    record = logging.LogRecord("tests.log", logging.INFO, __file__, 1, "x", None, None)
+    handler.enqueue(record)
+    handler.enqueue(record)
+    assert handler.dropped == 1
@@ -0,0 +1,77 @@
+from modules import markdown_renderer
+from modules.markdown_renderer import IncrementalMarkdown, render_inline, render_markdown
+
+
+SAMPLE = """# Title
+
+Some **bold** and `code` text
+with a second line.
+
+- one
+- two
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+```python
+def f(x):
+    return x < 1
+```
+done
+"""
+
+
+def stream(text: str, step: int = 3) -> IncrementalMarkdown:
+    renderer = IncrementalMarkdown()
+    for end in range(step, len(text) + step, step):
+        frame = renderer.update(text[:end])
+        assert "\n" not in frame
+    return renderer
+
+
+def test_streaming_matches_one_shot_render():
+    renderer = stream(SAMPLE)
+    assert renderer.finish() == render_markdown(SAMPLE)
+
+
+def test_block_elements():
+    output = render_markdown(SAMPLE)
+    assert "<h1>Title</h1>" in output
+    assert "<strong>bold</strong>" in output and "<code>code</code>" in output
+    assert "<ul><li>one</li><li>two</li></ul>" in output
+    assert "<th>a</th>" in output and "<td>1</td>" in output
+    assert "&lt;" in output and "\n" not in output
+
+
+def test_inline_escapes_html_and_only_links_safe_schemes():
+    assert render_inline("<script>") == "&lt;script&gt;"
+    assert "<a href=" not in render_inline("[x](javascript:alert(1))")
+    assert 'href="https://example.com"' in render_inline("[x](https://example.com)")
+
+
+def test_open_code_block_highlights_each_line_once(monkeypatch):
+    calls = []
+    original = markdown_renderer._highlight_line
+
+    def counting(line, lexer):
+        calls.append(line)
+        return original(line, lexer)
+
+    monkeypatch.setattr(markdown_renderer, "_highlight_line", counting)
+    renderer = IncrementalMarkdown()
+    text = "```python\n"
+    for i in range(200):
+        text += f"line {i}\n"
+        renderer.update(text)
+    assert len(calls) == 200
+    # 不完整的最后一行只转义，已完整的行不再重新着色
+    calls.clear()
+    for i in range(10):
+        text += "x"
+        renderer.update(text)
+    assert calls == []
+    assert renderer.html().count("&#10;") == 200 and "xxxxxxxxxx</code>" in renderer.html()
+    text += "\n"
+    renderer.update(text)
+    assert calls == ["xxxxxxxxxx"]
@@ -0,0 +1,80 @@
+import json
+
+from modules.metrics import JSONLSink, MetricsHub, RequestMetrics, percentile
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile([], 50) is None
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_request_metrics_record():
+    metrics = RequestMetrics("api", "model")
+    metrics.on_chunk("reasoning", "thinking")
+    metrics.on_chunk("content", "answer")
+    metrics.on_chunk()
+    record = metrics.finish()
+    assert record["chunks"] == 3
+    assert record["output_chars"] == len("thinking") + len("answer")
+    assert 0 <= record["ttft_reasoning"] <= record["ttft_content"]
+    assert record["ttft"] == record["ttft_reasoning"]
+    assert len(metrics.gaps) == 2
+    assert record["usage_reported"] is False
+    assert record["error"] is None
+
+
+def test_usage_prefers_reported_tokens_and_reads_cache_hits():
+    metrics = RequestMetrics("api", "model")
+    metrics.on_text("content", "hello world")
+    metrics.on_usage({"prompt_tokens": 100, "completion_tokens": 7, "prompt_cache_hit_tokens": 64})
+    record = metrics.finish()
+    assert record["completion_tokens"] == 7
+    assert record["cached_tokens"] == 64
+    assert record["usage_reported"] is True
+
+    metrics = RequestMetrics("api", "model")
+    metrics.on_usage({"prompt_tokens": 10, "prompt_tokens_details": {"cached_tokens": 4}})
+    assert metrics.finish()["cached_tokens"] == 4
+
+
+def test_error_is_recorded():
+    record = RequestMetrics("api", "model").finish(ValueError("boom"))
+    assert record["error"] == "ValueError: boom"
+
+
+def record(api="api", model="model", ttft=0.1, gap=0.01, error=None, prompt=None, cached=None):
+    return {
+        "api": api, "model": model, "ttft": ttft, "duration": 1.0, "chunks": 1, "tokens_per_sec": 10.0,
+        "gap_p99": gap, "error": error, "prompt_tokens": prompt, "completion_tokens": 1, "cached_tokens": cached,
+    }
+
+
+def test_summary_groups_by_endpoint():
+    hub = MetricsHub()
+    for i in range(100):
+        hub.emit(record(gap=(i + 1) / 100))
+    hub.emit(record(ttft=None, error="TimeoutError: slow"))
+    hub.emit(record(api="other", prompt=100, cached=25))
+    summary = hub.summary()
+    stats = summary[("api", "model")]
+    assert stats["requests"] == 101
+    assert stats["errors"] == 1
+    assert stats["gap_p99"] == 0.99
+    assert stats["prefix_cache_hit_rate"] is None
+    assert summary[("other", "model")]["prefix_cache_hit_rate"] == 0.25
+
+
+def test_failing_sink_does_not_break_others(tmp_path):
+    class Broken:
+        def emit(self, record):
+            raise RuntimeError("disk full")
+
+    path = tmp_path / "metrics.jsonl"
+    hub = MetricsHub([Broken(), JSONLSink(str(path))])
+    hub.emit(record())
+    assert len(hub.memory.snapshot()) == 1
+    assert json.loads(path.read_text(encoding="utf-8"))["api"] == "api"
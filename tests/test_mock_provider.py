@@ -0,0 +1,73 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from benchmarks.bench_chat import compare_with_baseline
+from benchmarks.mock_provider import MockProvider, MockSettings
+from modules.think_parser import ThinkStreamParser
+
+
+def post(base_url, payload):
+    request = urllib.request.Request(
+        base_url + "/chat/completions", data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"}
+    )
+    return urllib.request.urlopen(request, timeout=10)
+
+
+def sse_chunks(response):
+    chunks = []
+    for line in response.read().decode("utf-8").splitlines():
+        if line.startswith("data: ") and line != "data: [DONE]":
+            chunks.append(json.loads(line[len("data: "):]))
+    return chunks
+
+
+def test_stream_with_think_tags_and_usage():
+    settings = MockSettings(ttft=0, token_rate=0, completion_tokens=5, reasoning_tokens=3, reasoning="think",
+                            tokens_per_chunk=2, seed=1)
+    with MockProvider(settings) as provider:
+        response = post(provider.base_url, {"model": "mock-reasoner", "stream": True,
+                                            "messages": [{"role": "user", "content": "hi"}],
+                                            "stream_options": {"include_usage": True}})
+        chunks = sse_chunks(response)
+    assert chunks[-1]["usage"]["completion_tokens"] == 8
+    assert chunks[-2]["choices"][0]["finish_reason"] == "stop"
+    parser = ThinkStreamParser()
+    segments = []
+    for chunk in chunks:
+        if chunk["choices"]:
+            segments += parser.feed(chunk["choices"][0]["delta"].get("content"))
+    segments += parser.flush()
+    reasoning = "".join(text for kind, text in segments if kind == "reasoning")
+    content = "".join(text for kind, text in segments if kind == "content")
+    assert len(reasoning.split()) == 3 and len(content.split()) == 5
+
+
+def test_reasoning_field_in_non_streaming_response():
+    settings = MockSettings(ttft=0, completion_tokens=2, reasoning_tokens=2, reasoning="field")
+    with MockProvider(settings) as provider:
+        body = json.load(post(provider.base_url, {"messages": []}))
+        models = json.load(urllib.request.urlopen(provider.base_url + "/models", timeout=10))
+    message = body["choices"][0]["message"]
+    assert len(message["reasoning_content"].split()) == 2
+    assert [m["id"] for m in models["data"]] == ["mock-chat", "mock-reasoner"]
+
+
+def test_injected_rate_limit_error():
+    with MockProvider(MockSettings(error_rate=1.0, error_status=429)) as provider:
+        with pytest.raises(urllib.error.HTTPError) as info:
+            post(provider.base_url, {"stream": True})
+    assert info.value.code == 429
+    assert info.value.headers["Retry-After"] == "1"
+
+
+def test_compare_with_baseline_reports_regressions_only():
+    baseline = [{"history": 10, "tokens_per_sec": 100.0, "ttft_p50": 0.2, "cpu_ms_per_token": None}]
+    results = [{"history": 10, "tokens_per_sec": 80.0, "ttft_p50": 0.21, "cpu_ms_per_token": 1.0},
+               {"history": 50, "tokens_per_sec": 1.0}]
+    regressions = compare_with_baseline(results, baseline, tolerance=0.1)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("history=10 tokens_per_sec")
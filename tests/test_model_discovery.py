@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+import json
+
+import pytest
+
+from modules import model_discovery
+from modules.catalog import ModelCatalog
+from modules.model_discovery import ModelDiscovery, normalize_model
+
+
+def api_config(url="https://example.com/v1", **overrides):
+    config = dict(url=url, model_list=[], vision_models=None, reasoning_models=None, context_windows=None,
+                  context_window=None, list_discovered=False, allow_unlisted=False, discover_models=True)
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+@pytest.mark.parametrize("raw, chat", [
+    ({"id": "deepseek-ai/DeepSeek-V3"}, True),
+    ({"id": "BAAI/bge-m3"}, False),
+    ({"id": "text-embedding-3-small"}, False),
+    ({"id": "whisper-large-v3"}, False),
+    ({"id": "some-model", "type": "embedding"}, False),
+    ({"id": "painter", "architecture": {"output_modalities": ["image"]}}, False),
+    ({"id": "gpt-4o", "architecture": {"output_modalities": ["text"]}}, True),
+])
+def test_non_chat_models_are_flagged(raw, chat):
+    assert normalize_model(raw)["chat"] is chat
+
+
+def test_normalize_reads_capabilities():
+    entry = normalize_model({
+        "id": "models/gemini-2.5-flash",
+        "top_provider": {"context_length": 1000000},
+        "architecture": {"input_modalities": ["text", "image"]},
+        "supported_parameters": ["reasoning"],
+    })
+    assert entry == {"id": "gemini-2.5-flash", "chat": True, "context_window": 1000000,
+                     "vision": True, "reasoning": True}
+    assert normalize_model({"object": "model"}) is None
+
+
+def test_cache_is_persisted_and_invalidated_by_url(tmp_path):
+    path = str(tmp_path / "catalog.json")
+    configs = {"a": api_config(url="https://a/v1")}
+    discovery = ModelDiscovery(path)
+    assert discovery.stale(configs) == ["a"]
+    discovery.update("a", "https://a/v1", [{"id": "m", "context_length": 8000}])
+    assert discovery.stale(configs) == []
+    assert json.load(open(path, encoding="utf-8"))["a"]["models"][0]["id"] == "m"
+
+    reloaded = ModelDiscovery(path)
+    assert reloaded.models(configs) == {"a": [{"id": "m", "chat": True, "context_window": 8000}]}
+    moved = {"a": api_config(url="https://b/v1")}
+    assert reloaded.models(moved) == {}
+    assert reloaded.stale(moved) == ["a"]
+
+
+def test_failed_fetch_is_not_retried_immediately(tmp_path, monkeypatch):
+    discovery = ModelDiscovery(str(tmp_path / "catalog.json"))
+    configs = {"a": api_config()}
+    discovery.mark_failed("a")
+    assert discovery.stale(configs) == []
+    now = model_discovery.time.time()
+    monkeypatch.setattr(model_discovery.time, "time", lambda: now + model_discovery.RETRY_INTERVAL)
+    assert discovery.stale(configs) == ["a"]
+
+
+def test_catalog_uses_discovered_capabilities():
+    discovered = {"a": [
+        {"id": "listed", "chat": True, "context_window": 8000, "vision": True},
+        {"id": "extra", "chat": True},
+        {"id": "bge-m3", "chat": False},
+    ]}
+    catalog = ModelCatalog.build({"a": api_config(model_list=["listed"], context_window=4000)}, {}, "auto", discovered)
+    assert [info.model for info in catalog.models("a")] == ["listed"]
+    assert catalog.get("a", "listed").context_window == 8000 and catalog.get("a", "listed").vision
+
+    catalog = ModelCatalog.build({"a": api_config(model_list=["listed"], list_discovered=True)}, {}, "auto", discovered)
+    assert [info.model for info in catalog.models("a")] == ["listed", "extra"]
+    assert catalog.get("a", "extra").discovered
@@ -0,0 +1,128 @@
+from collections import Counter
+import os
+import random
+
+import pytest
+
+from modules import rag_index
+from modules.chat_engine import with_reference
+from modules.rag_index import BM25Index, RAGIndex, tokenize
+
+
+def exhaustive(index: BM25Index, terms, k):
+    """不剪枝的参照实现：临时关闭剪枝阈值后检索"""
+    saved = rag_index.PRUNE_MIN_POSTINGS
+    rag_index.PRUNE_MIN_POSTINGS = len(index) + 1
+    try:
+        return index.search(terms, k)
+    finally:
+        rag_index.PRUNE_MIN_POSTINGS = saved
+
+
+def test_tokenize_words_and_cjk_bigrams():
+    assert tokenize("Hello 检索增强 x") == ["hello", "检索", "索增", "增强", "x"]
+    assert tokenize("字") == ["字"]
+
+
+def test_bm25_relevance_and_min_score():
+    index = BM25Index()
+    index.add(1, {"apple": 2, "pie": 1})
+    index.add(2, {"banana": 1, "bread": 1})
+    index.add(3, {"cherry": 1, "tart": 1})
+    results = index.search(["apple", "pie"], 3)
+    assert [chunk_id for chunk_id, _ in results] == [1]
+    assert 0.5 < results[0][1] < 2
+    # 查询中索引里没有的词计入分母，相关度随之下降
+    partial = index.search(["apple", "pie", "unknown", "words"], 3)
+    assert partial[0][1] < results[0][1]
+    assert index.search(["apple", "pie", "unknown", "words"], 3, min_score=0.9) == []
+
+
+def test_bm25_remove_updates_postings():
+    index = BM25Index()
+    index.add(1, {"apple": 1})
+    index.add(2, {"apple": 1, "pear": 1})
+    index.remove(2, {"apple": 1, "pear": 1})
+    assert "pear" not in index.postings
+    assert [chunk_id for chunk_id, _ in index.search(["apple", "pear"], 5)] == [1]
+
+
+def test_bm25_pruning_keeps_rare_term_results():
+    rng = random.Random(0)
+    index = BM25Index()
+    for chunk_id in range(6000):
+        # 每个分块都含常见词，稀有词只出现在少数分块中
+        terms = Counter(["the", "of"] + [f"w{rng.randrange(3000)}" for _ in range(20)])
+        if chunk_id % 500 == 0:
+            terms["needle"] += 3
+        index.add(chunk_id, dict(terms))
+    query = ["the", "of", "needle", "the"]
+    pruned = index.search(query, 5)
+    assert {chunk_id for chunk_id, _ in pruned} == {chunk_id for chunk_id, _ in exhaustive(index, query, 5)}
+    assert all(chunk_id % 500 == 0 for chunk_id, _ in pruned)
+
+
+def test_delete_document_rolls_back_on_failure(tmp_path):
+    index = RAGIndex(str(tmp_path), chunk_chars=200, min_score=0)
+    doc_id = index.add_document("notes.md", "The quick brown fox jumps over the lazy dog.")
+
+    class FailingConnection:
+        """在删除文档行时失败，模拟写入中途出错"""
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, sql, *args):
+            if sql.startswith("DELETE FROM documents"):
+                raise OSError("disk full")
+            return self.conn.execute(sql, *args)
+
+    conn = index._conn
+    index._conn = FailingConnection(conn)
+    with pytest.raises(OSError):
+        index.delete_document(doc_id)
+    index._conn = conn
+
+    assert [document["id"] for document in index.list_documents()] == [doc_id]
+    assert index.search("quick fox")[0]["source"] == "notes.md"
+    # 事务已回滚，之后的写入正常进行
+    index.delete_document(doc_id)
+    assert index.list_documents() == [] and index.search("quick fox") == []
+
+
+def test_replace_document_keeps_original_when_insert_fails(tmp_path):
+    index = RAGIndex(str(tmp_path), chunk_chars=200, min_score=0)
+    index.add_document("notes.md", "original apple content")
+    conn = index._conn
+
+    class FailingConnection:
+        def execute(self, sql, *args):
+            if sql.startswith("INSERT INTO chunks"):
+                raise OSError("disk full")
+            return conn.execute(sql, *args)
+
+    index._conn = FailingConnection()
+    with pytest.raises(OSError):
+        index.add_document("notes.md", "replacement banana content")
+    index._conn = conn
+    assert index.search("apple")[0]["text"] == "original apple content"
+    assert index.search("banana") == []
+
+
+def test_temporary_index_is_removed_with_the_object():
+    index = RAGIndex(None)
+    path = index.path
+    index.add_document("a.txt", "temporary text")
+    assert os.path.exists(path)
+    del index
+    assert not os.path.exists(path)
+
+
+def test_reference_goes_into_the_user_turn():
+    message = {"role": "user", "content": "What is BM25?"}
+    result = with_reference(message, "[1] 来源：a.md\nBM25 is a ranking function.")
+    assert message["content"] == "What is BM25?"
+    assert result["role"] == "user"
+    assert result["content"].startswith("以下是从本地知识库检索到的参考资料")
+    assert result["content"].endswith("What is BM25?")
+    parts = with_reference({"role": "user", "content": [{"type": "image_url", "image_url": {}}]}, "ref")
+    assert parts["content"][0]["type"] == "text" and parts["content"][1]["type"] == "image_url"
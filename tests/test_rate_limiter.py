@@ -0,0 +1,75 @@
+import pytest
+
+from modules.rate_limiter import (
+    FixedWindow, QuotaLimiter, RateLimitExceeded, RateLimiter, TokenBucket, backoff_delay, parse_retry_after
+)
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_at_quota_rate():
+    bucket = TokenBucket(60, 60.0)
+    bucket.updated = 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(1, 0.0) == pytest.approx(1.0)
+    assert bucket.wait_time(1, 1.0) == 0.0
+
+
+def test_daily_window_never_exceeds_quota_within_a_day():
+    day = 86400.0
+    clock = Clock(10 * day + 3600)
+    window = FixedWindow(3, day, clock)
+    for _ in range(3):
+        assert window.wait_time(1, 0.0) == 0.0
+        window.consume(1)
+    # 令牌桶此时已补充了部分配额，固定窗口要等到 UTC 零点
+    clock.now += 3600
+    assert window.wait_time(1, 0.0) == pytest.approx(day - 7200)
+    clock.now = 11 * day
+    assert window.wait_time(1, 0.0) == 0.0
+    assert window.used == 0
+
+
+def test_quota_limiter_rejects_when_wait_exceeds_max_wait():
+    limiter = QuotaLimiter("p/m", {"rpd": 1, "max_wait": 0.1})
+    limiter.acquire()
+    with pytest.raises(RateLimitExceeded) as info:
+        limiter.acquire()
+    assert "rpd" in str(info.value) and info.value.retry_after > 0
+
+
+def test_quota_limiter_counts_tokens_against_tpm():
+    limiter = QuotaLimiter("p/m", {"tpm": 1000, "max_wait": 0})
+    limiter.acquire(600)
+    limiter.record_usage(300)
+    with pytest.raises(RateLimitExceeded, match="tpm"):
+        limiter.acquire(200)
+
+
+def test_penalize_blocks_all_callers():
+    limiter = QuotaLimiter("p/m", {"rpm": 100, "max_wait": 0})
+    limiter.penalize(30)
+    with pytest.raises(RateLimitExceeded, match="retry-after"):
+        limiter.acquire()
+
+
+def test_rate_limiter_shares_and_discards_limiters():
+    limiters = RateLimiter()
+    assert limiters.get("p", "m", None) is None
+    first = limiters.get("p", "m", {"rpm": 10})
+    assert limiters.get("p", "m", {"rpm": 10}) is first
+    limiters.discard("p")
+    assert limiters.get("p", "m", {"rpm": 10}) is not first
+
+
+def test_parse_retry_after_and_backoff():
+    assert parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert parse_retry_after({"retry-after": "7"}) == 7.0
+    assert parse_retry_after({}) is None
+    assert 0 <= backoff_delay(10, base=1.0, cap=5.0) <= 5.0
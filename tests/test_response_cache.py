@@ -0,0 +1,82 @@
+from modules import response_cache
+from modules.response_cache import MemoryCache, ResponseCache, cache_key, replay_chunks
+
+
+class FakeTime:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_ignores_whitespace_differences():
+    a = cache_key("api", "m", [{"role": "user", "content": "hello  \r\nworld\n"}])
+    b = cache_key("api", "m", [{"role": "user", "content": "hello\nworld"}])
+    assert a == b
+    assert a != cache_key("api", "m2", [{"role": "user", "content": "hello\nworld"}])
+    assert a != cache_key("api", "m", [{"role": "user", "content": "hello\nworld"}], {"temperature": 0})
+
+
+def test_memory_cache_ttl(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    cache = MemoryCache(ttl=10, max_entries=10, max_bytes=1000)
+    cache.set("k", "v")
+    clock.now += 9
+    assert cache.get("k") == "v"
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.size == 0
+
+
+def test_memory_cache_lru_by_entries_and_bytes():
+    cache = MemoryCache(ttl=60, max_entries=2, max_bytes=10)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")  # a 变为最近使用
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+    cache.set("big", "x" * 9)
+    assert cache.size <= 10
+    assert cache.get("big") == "x" * 9
+    assert cache.get("a") is None
+
+
+def test_from_config_disabled():
+    assert ResponseCache.from_config(None) is None
+    assert ResponseCache.from_config({"enabled": False}) is None
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    content = {"content": "answer", "reasoning": "why", "elapsed": 1.5}
+    ResponseCache(path=path).set("k", content)
+    restarted = ResponseCache(path=path)
+    assert restarted.get("k") == content
+    assert restarted.memory.get("k") is not None
+    assert restarted.get("missing") is None
+    assert (restarted.hits, restarted.misses) == (1, 1)
+
+
+def test_disk_cache_evicts_oldest_accessed(tmp_path, monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    cache = ResponseCache(max_entries=2, path=str(tmp_path / "cache.sqlite"))
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.disk.set(key, "{}")
+    assert cache.disk.get("a") is None
+    assert cache.disk.get("c") is not None
+
+
+def test_replay_chunks_round_trip():
+    content = {"content": "a" * 40, "reasoning": "r" * 20, "elapsed": 2.0}
+    chunks = list(replay_chunks(content, chunk_chars=16))
+    assert "".join(c["content"] for c in chunks if c["type"] == "reasoning") == content["reasoning"]
+    answer = [c for c in chunks if c["type"] == "content"]
+    assert "".join(c["content"] for c in answer) == content["content"]
+    assert all(c["elapsed"] == 2.0 for c in answer)
+    assert all("elapsed" not in c for c in replay_chunks({"content": "plain"}))
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+import threading
+import time
+
+import pytest
+
+from modules.router import Endpoint, ModelRouter
+
+ALIASES = {"m": {"endpoints": ["a/model", "b/org/model"]}}
+
+
+def chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    def __init__(self, texts, delay=0.0):
+        self.texts = texts
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield SimpleNamespace(choices=[])  # 只含元信息的首个分块
+        time.sleep(self.delay)
+        for text in self.texts:
+            if self.closed.is_set():
+                return
+            yield chunk(text)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_endpoint_parse():
+    assert Endpoint.parse("b/org/model") == Endpoint("b", "org/model")
+    with pytest.raises(ValueError):
+        Endpoint.parse("no-model")
+
+
+def test_rank_prefers_fast_healthy_endpoints():
+    router = ModelRouter(ALIASES)
+    a, b = router.aliases["m"].endpoints
+    assert router.rank("m") == [a, b]
+    router.observe(a, 2.0, True)
+    router.observe(b, 0.5, True)
+    assert router.rank("m") == [b, a]
+    for _ in range(3):
+        router.observe(b, None, False)
+    # 错误率过高的端点熔断，排到最后
+    assert router.rank("m") == [a, b]
+    assert not dict(router.stats("m"))[b]["healthy"]
+
+
+def test_metrics_records_update_stats_except_alias_records():
+    router = ModelRouter(ALIASES)
+    router.emit({"api": "a", "model": "model", "ttft": 1.0, "error": None})
+    router.emit({"api": "auto", "model": "m", "ttft": 9.0, "error": None})
+    assert dict(router.stats("m"))[Endpoint("a", "model")]["ttft"] == 1.0
+
+
+def test_failover_to_next_endpoint():
+    router = ModelRouter(ALIASES)
+
+    def start(endpoint):
+        if endpoint.api_name == "a":
+            raise ConnectionError("down")
+        return FakeStream(["hi", " there"])
+
+    endpoint, chunks = router.open_stream("m", start)
+    assert endpoint == Endpoint("b", "org/model")
+    assert [c.choices[0].delta.content for c in chunks if c.choices] == ["hi", " there"]
+    assert dict(router.stats("m"))[Endpoint("a", "model")]["error_rate"] == 1.0
+
+
+def test_all_endpoints_failing_raises():
+    router = ModelRouter(ALIASES)
+
+    def start(endpoint):
+        raise ConnectionError(f"{endpoint} down")
+
+    with pytest.raises(Exception, match="All endpoints failed"):
+        router.open_stream("m", start)
+
+
+def test_hedged_request_wins_and_cancels_the_slow_one():
+    router = ModelRouter({"m": {"endpoints": ["a/model", "b/model"], "hedge_after": 0.05}})
+    streams = {"a": FakeStream(["slow"], delay=1.0), "b": FakeStream(["fast"])}
+    endpoint, chunks = router.open_stream("m", lambda e: streams[e.api_name])
+    assert endpoint == Endpoint("b", "model")
+    assert [c.choices[0].delta.content for c in chunks if c.choices] == ["fast"]
+    assert streams["a"].closed.is_set()
+    # 被取消的慢端点按已等待的时间计入 TTFT
+    assert dict(router.stats("m"))[Endpoint("a", "model")]["ttft"] >= 0.05
@@ -0,0 +1,63 @@
+import gc
+import io
+import os
+
+from modules.chat_engine import Message, Reply
+from modules.spill_store import SpillStore
+
+
+def test_identical_payloads_are_stored_once_and_refcounted(tmp_path):
+    store = SpillStore(str(tmp_path))
+    first = store.put(b"x" * 100)
+    second = store.put(b"x" * 100)
+    assert first == second
+    assert store.stats() == {"blobs": 1, "bytes": 100}
+    path = os.path.join(store.path, first.key)
+
+    del first
+    gc.collect()
+    assert os.path.exists(path)
+    assert second.read() == b"x" * 100
+
+    del second
+    gc.collect()
+    assert not os.path.exists(path)
+    assert store.stats() == {"blobs": 0, "bytes": 0}
+
+
+def test_reply_spills_only_long_reasoning(tmp_path):
+    store = SpillStore(str(tmp_path), threshold=10)
+    short = Reply("answer", "brief", 1)
+    assert short.spilled(store) is short
+
+    long = Reply("answer", "r" * 20, 3)
+    spilled = long.spilled(store)
+    assert spilled.reasoning_spilled and not long.reasoning_spilled
+    assert spilled.reasoning == "r" * 20
+    assert spilled == long
+    assert spilled.to_dict() == {"content": "answer", "reasoning": "r" * 20, "elapsed": 3}
+
+
+def test_message_spill_moves_reasoning_and_uploads(tmp_path):
+    store = SpillStore(str(tmp_path), threshold=10)
+    upload = io.BytesIO(b"image-bytes" * 10)
+    upload.name, upload.type = "cat.png", "image/png"
+    user = Message(role="user", content="look", files=[upload]).spill(store)
+    spilled_file = user.files[0]
+    assert spilled_file.name == "cat.png" and spilled_file.type == "image/png"
+    assert spilled_file.getvalue() == b"image-bytes" * 10
+
+    assistant = Message(role="assistant", content={"content": "ok", "reasoning": "r" * 50}).spill(store)
+    resident, spilled = assistant.memory_usage()
+    assert spilled == 50
+    assert store.stats()["blobs"] == 2
+
+    del user, assistant, spilled_file
+    gc.collect()
+    assert store.stats() == {"blobs": 0, "bytes": 0}
+
+
+def test_spill_without_store_is_a_no_op():
+    message = Message(role="assistant", content={"content": "ok", "reasoning": "r" * 5000})
+    assert message.spill(None) is message
+    assert not message.content.reasoning_spilled
@@ -0,0 +1,46 @@
+from modules.stream_renderer import StreamRenderer
+
+
+class Placeholder:
+    def __init__(self):
+        self.frames = []
+
+    def markdown(self, body, **kwargs):
+        self.frames.append(body)
+
+
+def render(content="", reasoning=""):
+    return reasoning + "|" + content
+
+
+def test_first_frame_is_immediate_then_capped_by_frame_rate():
+    placeholder = Placeholder()
+    renderer = StreamRenderer(placeholder, render, max_fps=1, min_delta=0)
+    assert renderer.update(content="a")
+    for text in ("ab", "abc", "abcd"):
+        assert not renderer.update(content=text)
+    assert placeholder.frames == ["|a"]
+    renderer.close()
+    assert placeholder.frames[-1] == "|abcd"
+
+
+def test_min_delta_coalesces_small_chunks():
+    placeholder = Placeholder()
+    renderer = StreamRenderer(placeholder, render, max_fps=0, min_delta=5)
+    renderer.update(content="x")
+    for size in range(2, 6):
+        renderer.update(content="x" * size)
+    assert len(placeholder.frames) == 1
+    assert renderer.update(content="x" * 6)
+    assert placeholder.frames[-1] == "|xxxxxx"
+
+
+def test_force_flushes_and_close_skips_unchanged_state():
+    placeholder = Placeholder()
+    renderer = StreamRenderer(placeholder, render, max_fps=1)
+    renderer.update(content="a")
+    assert renderer.update(force=True, reasoning="r")
+    renderer.close()
+    assert placeholder.frames == ["|a", "r|a"]
+    renderer.close(content="done")
+    assert placeholder.frames[-1] == "r|done" and renderer.frames == 3
@@ -0,0 +1,72 @@
+import pytest
+
+from modules.think_parser import ThinkStreamParser
+
+
+def parse(chunks, tags=None):
+    """逐块输入，合并相邻同类片段后返回 [(类型, 文本)]"""
+    parser = ThinkStreamParser(tags)
+    segments = []
+    for chunk in chunks:
+        segments += parser.feed(chunk)
+    segments += parser.flush()
+    merged = []
+    for kind, text in segments:
+        if merged and merged[-1][0] == kind:
+            merged[-1] = (kind, merged[-1][1] + text)
+        else:
+            merged.append((kind, text))
+    return merged
+
+
+TEXT = "before<think>step 1\nstep 2</think>after"
+EXPECTED = [("content", "before"), ("reasoning", "step 1\nstep 2"), ("content", "after")]
+
+
+def test_single_chunk():
+    assert parse([TEXT]) == EXPECTED
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7])
+def test_tags_split_across_chunks(size):
+    chunks = [TEXT[i:i + size] for i in range(0, len(TEXT), size)]
+    assert parse(chunks) == EXPECTED
+
+
+def test_every_split_point():
+    for i in range(len(TEXT)):
+        assert parse([TEXT[:i], TEXT[i:]]) == EXPECTED
+
+
+def test_partial_tag_is_held_back_until_confirmed():
+    parser = ThinkStreamParser()
+    assert parser.feed("answer <thi") == [("content", "answer ")]
+    assert parser.feed("s is not a tag") == [("content", "<this is not a tag")]
+
+
+def test_flush_emits_unconfirmed_tail_as_text():
+    parser = ThinkStreamParser()
+    assert parser.feed("a <thin") == [("content", "a ")]
+    assert parser.flush() == [("content", "<thin")]
+    assert parser.flush() == []
+
+
+def test_unclosed_reasoning_is_flushed_as_reasoning():
+    parser = ThinkStreamParser()
+    segments = parser.feed("<think>still thinking</th")
+    assert parser.in_reasoning
+    assert segments == [("reasoning", "still thinking")]
+    assert parser.flush() == [("reasoning", "</th")]
+
+
+def test_custom_tags():
+    tags = [["<reasoning>", "</reasoning>"], ["<think>", "</think>"]]
+    assert parse(["x<reason", "ing>r</reasoning>y<think>t</think>"], tags) == [
+        ("content", "x"), ("reasoning", "r"), ("content", "y"), ("reasoning", "t")
+    ]
+
+
+def test_empty_input():
+    parser = ThinkStreamParser()
+    assert parser.feed("") == [] and parser.feed(None) == []
+    assert parser.flush() == []
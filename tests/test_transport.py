@@ -0,0 +1,46 @@
+import pytest
+
+from modules.transport import PoolStats, TransportConfig, _CountingTransport, client_busy
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeTransport:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def handle_request(self, request):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class FakeClient:
+    def __init__(self, transport):
+        self._transport = transport
+
+
+def test_transport_config_rejects_unknown_settings():
+    assert TransportConfig.from_dict({"max_retries": 0}).max_retries == 0
+    with pytest.raises(ValueError, match="retries"):
+        TransportConfig.from_dict({"retries": 3})
+
+
+def test_counting_transport_releases_in_flight_on_errors():
+    stats = PoolStats()
+    transport = _CountingTransport(FakeTransport([ConnectionError("connect timeout"), FakeResponse(503)]), stats)
+    with pytest.raises(ConnectionError):
+        transport.handle_request(None)
+    assert transport.handle_request(None).status_code == 503
+    assert (stats.requests, stats.in_flight, stats.errors) == (2, 0, 1)
+    assert not client_busy(FakeClient(transport))
+
+
+def test_client_busy_while_waiting_for_headers():
+    stats = PoolStats()
+    stats.on_request()
+    assert client_busy(FakeClient(_CountingTransport(FakeTransport([]), stats)))
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+import pytest
+
+from modules.chat_engine import Message
+from modules.spill_store import SpillStore
+from modules.ui_components import ChatUI
+
+
+@pytest.fixture
+def ui(monkeypatch):
+    # build_message_html 与 cached_message_html 不依赖 session_state，跳过 ChatUI 的初始化
+    ui = ChatUI.__new__(ChatUI)
+    calls = []
+    build = ui.build_message_html
+
+    def counting(message):
+        calls.append(message)
+        return build(message)
+
+    monkeypatch.setattr(ui, "build_message_html", counting)
+    ui.calls = calls
+    return ui
+
+
+def messages(count):
+    return [Message(role="user", content=f"message {i}", timestamp=1000.0 + i) for i in range(count)]
+
+
+def test_messages_are_built_once_and_evicted_beyond_the_window(ui):
+    cache = OrderedDict()
+    history = messages(5)
+    for _ in range(3):
+        for message in history[-3:]:
+            ui.cached_message_html(cache, message, limit=3)
+    assert len(ui.calls) == 3
+    assert len(cache) == 3
+
+    # 窗口向后移动，最久未用的消息被淘汰
+    ui.cached_message_html(cache, history[0], limit=3)
+    assert len(cache) == 3
+    assert ui._message_cache_key(history[2]) not in cache
+
+
+def test_user_input_is_escaped(ui):
+    message = Message(role="user", content="<script>x</script>\nline", timestamp=0)
+    html_text = ui.cached_message_html(OrderedDict(), message, limit=1)
+    assert "<script>" not in html_text
+    assert "&lt;script&gt;x&lt;/script&gt;<br/>line" in html_text
+
+
+def test_assistant_reasoning_is_rendered_in_details(ui):
+    message = Message(role="assistant", content={"content": "**答案**", "reasoning": "想一想", "elapsed": 3})
+    html_text = ui.cached_message_html(OrderedDict(), message, limit=1)
+    assert "思考完成（用时3秒）" in html_text
+    assert "<strong>答案</strong>" in html_text
+
+
+def test_spilled_reasoning_is_not_cached(ui, tmp_path):
+    store = SpillStore(str(tmp_path), threshold=10)
+    message = Message(role="assistant", content={"content": "ok", "reasoning": "r" * 100}).spill(store)
+    cache = OrderedDict()
+    ui.cached_message_html(cache, message, limit=5)
+    ui.cached_message_html(cache, message, limit=5)
+    assert not cache
+    assert len(ui.calls) == 2
+
+
+def test_compare_stats():
+    assert ChatUI.format_compare_stats(None) == "首字 -"
+    assert ChatUI.format_compare_stats(0.456, 31.25) == "首字 0.46s · 31.2 tokens/s"
+    assert ChatUI.format_compare_stats(0.1, error="TimeoutError: slow") == "❌ TimeoutError: slow"